@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Benchmarks numeric components on scalars and on batches.
+
+Random numbers from three generators are multiplied together and reduced
+modulo the third, then summed by a sink. The numbers are either sent one per
+packet, or generated and sent in blocks of ``BLOCK_SIZE`` as ``RecordBatch``
+packets (using NumPy if it is installed, and ``array.array`` otherwise).
+Far fewer numbers are sent one at a time, since that takes at least a
+scheduler round trip per number.
+"""
+import time
+
+from pflow.executors.single_process import SingleProcessGraphExecutor, monkey_patch
+monkey_patch()
+
+from pflow.core import Graph, Component
+from pflow.packet import EndOfStream
+from pflow.components import Multiply, Modulo, RandomNumberGenerator
+from pflow.executors.scheduling import QueueDepthPolicy
+from pflow import packet
+
+SCALAR_COUNT = 200
+BATCH_COUNT = 1000000
+BLOCK_SIZE = 100000
+
+
+class Sink(Component):
+    def initialize(self):
+        self.inputs.add('IN', receive_batches=True)
+        self.total = 0
+
+    def run(self):
+        while True:
+            value = self.inputs['IN'].receive()
+            if value is EndOfStream:
+                break
+
+            self.total += sum(value) if packet.is_batch_array(value) else value
+
+
+def run(count, block_size):
+    graph = Graph('BENCHMARK', initialize=False)
+    generators = []
+    for i in range(3):
+        generator = RandomNumberGenerator('RNG_{}'.format(i))
+        graph.set_initial_packet(generator.inputs['LIMIT'], count)
+        if block_size is not None:
+            graph.set_initial_packet(generator.inputs['BLOCK_SIZE'], block_size)
+        generators.append(generator)
+
+    multiply = Multiply('MULTIPLY')
+    modulo = Modulo('MODULO')
+    graph.connect(generators[0].outputs['OUT'], multiply.inputs['X'])
+    graph.connect(generators[1].outputs['OUT'], multiply.inputs['Y'])
+    graph.connect(multiply.outputs['OUT'], modulo.inputs['IN'])
+    graph.connect(generators[2].outputs['OUT'], modulo.inputs['MODULO'])
+    graph.connect(modulo.outputs['OUT'], Sink('SINK').inputs['IN'])
+
+    start_time = time.time()
+    SingleProcessGraphExecutor(graph, scheduling_policy=QueueDepthPolicy()).execute()
+    return time.time() - start_time
+
+
+def main():
+    numpy = packet.get_numpy()
+    print('{:<24} {:>10} {:>16}'.format('mode', 'seconds', 'numbers/second'))
+
+    modes = [('scalars', SCALAR_COUNT, None, numpy),
+             ('batches (array)', BATCH_COUNT, BLOCK_SIZE, None)]
+    if numpy is not None:
+        modes.append(('batches (numpy)', BATCH_COUNT, BLOCK_SIZE, numpy))
+
+    for name, count, block_size, numpy_module in modes:
+        packet._numpy = numpy_module
+        elapsed = run(count, block_size)
+        print('{:<24} {:>10.2f} {:>16.0f}'.format(name, elapsed, count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Benchmarks fanning packets out to several consumers.
+
+A source sends ``PACKETS`` packets to ``N`` sinks, either by creating and
+sending a copy on each output port, or by broadcasting a single shared packet
+on an array port. Runs with the queue depth scheduling policy, so that the
+time components spend waiting doesn't dwarf the cost of sending.
+"""
+import time
+
+from pflow.executors.single_process import SingleProcessGraphExecutor, monkey_patch
+monkey_patch()
+
+from pflow.core import Graph, Component
+from pflow.port import ArrayOutputPort
+from pflow.packet import EndOfStream
+from pflow.executors.scheduling import QueueDepthPolicy
+
+PACKETS = 200
+FANOUTS = (1, 4, 16)
+PAYLOAD = 'x' * 1024
+
+
+class CopySource(Component):
+    def initialize(self):
+        self.outputs.add_ports(ArrayOutputPort('OUT', max(FANOUTS)))
+
+    def run(self):
+        for _ in range(PACKETS):
+            for port in self.outputs['OUT'].get_connected_ports():
+                port.send(PAYLOAD)
+
+
+class BroadcastSource(Component):
+    def initialize(self):
+        self.outputs.add_ports(ArrayOutputPort('OUT', max(FANOUTS)))
+
+    def run(self):
+        for _ in range(PACKETS):
+            self.outputs['OUT'].broadcast(PAYLOAD)
+
+
+class Sink(Component):
+    def initialize(self):
+        self.inputs.add('IN')
+
+    def run(self):
+        while self.inputs['IN'].receive() is not EndOfStream:
+            pass
+
+
+def run(source_class, fanout):
+    graph = Graph('BENCHMARK', initialize=False)
+    source = source_class('SOURCE')
+    for i in range(fanout):
+        graph.connect(source.outputs['OUT'][i], Sink('SINK_{}'.format(i)).inputs['IN'])
+
+    executor = SingleProcessGraphExecutor(graph, scheduling_policy=QueueDepthPolicy())
+    start_time = time.time()
+    executor.execute()
+    return (time.time() - start_time) / PACKETS
+
+
+def main():
+    print('{:<8} {:>20} {:>20}'.format('fanout', 'copies ms/packet', 'broadcast ms/packet'))
+
+    for fanout in FANOUTS:
+        print('{:<8d} {:>20.2f} {:>20.2f}'.format(
+              fanout, run(CopySource, fanout) * 1000, run(BroadcastSource, fanout) * 1000))
+
+
+if __name__ == '__main__':
+    main()
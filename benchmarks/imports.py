@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Benchmarks how long it takes to import pflow modules.
+
+Each import is timed in a fresh interpreter (best of ``REPEAT`` runs), since
+modules are only ever imported once per process. Worker processes and CLI
+tools pay this on every start-up.
+"""
+import os
+import sys
+import subprocess
+
+REPEAT = 5
+
+MODULES = [
+    'pflow',
+    'pflow.core',
+    'pflow.runtime',
+    'pflow.executors.single_process',
+    'pflow.executors.multi_process',
+]
+
+# Modules that should only be imported when the feature needing them is used.
+DEFERRED_MODULES = ['gevent', 'geventwebsocket', 'requests', 'uuid', 'inspect',
+                    'numpy']
+
+_TIMER = '''
+import sys, time
+start = time.time()
+import {module}
+elapsed = time.time() - start
+deferred = [m for m in {deferred!r} if m in sys.modules]
+print('%f %s' % (elapsed, ','.join(deferred)))
+'''
+
+
+def time_import(module):
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = _TIMER.format(module=module, deferred=DEFERRED_MODULES)
+
+    best = None
+    for _ in range(REPEAT):
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         cwd=root_dir)
+        elapsed, deferred = output.decode('ascii').split(' ')
+        best = min(best or float(elapsed), float(elapsed))
+
+    return best, deferred.strip()
+
+
+def main():
+    print('{:<36} {:>10}   {}'.format('module', 'import ms', 'deferred modules loaded'))
+    for module in MODULES:
+        elapsed, deferred = time_import(module)
+        print('{:<36} {:>10.1f}   {}'.format(module, elapsed * 1000,
+                                             deferred or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmarks merging streams that arrive at different rates.
+
+A fast and a slow source send timestamped packets to a merge, which forwards
+them to a sink that records each packet's end-to-end latency. The `Merge`
+component (which waits on all of its ports at once with `receive_any()`) is
+compared with a merge that polls each port in turn with a short timeout.
+"""
+import time
+
+from pflow.executors.single_process import SingleProcessGraphExecutor, monkey_patch
+monkey_patch()
+
+from pflow.core import Graph, Component
+from pflow.port import ArrayInputPort
+from pflow.packet import EndOfStream
+from pflow.components import Merge
+from pflow.executors.scheduling import QueueDepthPolicy
+from pflow import exc
+
+PACKETS = 50
+INTERVALS = (0.01, 0.2)  # Seconds between packets of each source
+POLL_TIMEOUT = 0.05
+
+
+class Source(Component):
+    def initialize(self):
+        self.outputs.add('OUT')
+        self.interval = None
+
+    def run(self):
+        for _ in range(PACKETS):
+            self.suspend(self.interval)
+            self.outputs['OUT'].send(time.time())
+
+
+class PollingMerge(Component):
+    def initialize(self):
+        self.inputs.add_ports(ArrayInputPort('IN', 2))
+        self.outputs.add('OUT')
+
+    def run(self):
+        ports = list(self.inputs['IN'])
+        while ports:
+            for port in list(ports):
+                try:
+                    packet = port.receive_packet(timeout=POLL_TIMEOUT)
+                except exc.PortTimeout:
+                    continue
+
+                if packet is EndOfStream:
+                    ports.remove(port)
+                else:
+                    self.outputs['OUT'].send_packet(packet)
+
+
+class Sink(Component):
+    def initialize(self):
+        self.inputs.add('IN')
+        self.latencies = []
+
+    def run(self):
+        while True:
+            sent_time = self.inputs['IN'].receive()
+            if sent_time is EndOfStream:
+                break
+
+            self.latencies.append(time.time() - sent_time)
+
+
+def run(merge_class):
+    graph = Graph('BENCHMARK', initialize=False)
+    merge = merge_class('MERGE')
+    for i, interval in enumerate(INTERVALS):
+        source = Source('SOURCE_{}'.format(i))
+        source.interval = interval
+        graph.connect(source.outputs['OUT'], merge.inputs['IN'][i])
+
+    sink = Sink('SINK')
+    graph.connect(merge.outputs['OUT'], sink.inputs['IN'])
+    SingleProcessGraphExecutor(graph, scheduling_policy=QueueDepthPolicy()).execute()
+
+    latencies = sorted(sink.latencies)
+    return (sum(latencies) / len(latencies),
+            latencies[int(len(latencies) * 0.95)])
+
+
+def main():
+    print('{:<14} {:>16} {:>16}'.format('merge', 'mean latency ms', 'p95 latency ms'))
+
+    for merge_class in (PollingMerge, Merge):
+        mean_latency, p95_latency = run(merge_class)
+        print('{:<14} {:>16.1f} {:>16.1f}'.format(
+              merge_class.__name__, mean_latency * 1000, p95_latency * 1000))
+
+
+if __name__ == '__main__':
+    main()
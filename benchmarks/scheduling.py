@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Benchmarks the single process executor's scheduling policies.
+
+A source sends ``PACKETS`` timestamped packets through a chain of ``STAGES``
+pass-through components to a sink, which records each packet's end-to-end
+latency. The peak number of packets waiting on edges is sampled while the
+graph runs.
+"""
+import time
+
+from pflow.executors.single_process import SingleProcessGraphExecutor, monkey_patch
+monkey_patch()
+
+import gevent
+
+from pflow.core import Graph, Component
+from pflow.packet import EndOfStream
+from pflow.executors.scheduling import (RoundRobinPolicy, SinkFirstPolicy,
+                                        QueueDepthPolicy)
+
+PACKETS = 100
+STAGES = 3
+
+
+class Source(Component):
+    def initialize(self):
+        self.outputs.add('OUT')
+
+    def run(self):
+        for _ in range(PACKETS):
+            self.outputs['OUT'].send(time.time())
+
+
+class Stage(Component):
+    def initialize(self):
+        self.inputs.add('IN')
+        self.outputs.add('OUT')
+
+    def run(self):
+        while True:
+            packet = self.inputs['IN'].receive_packet()
+            if packet is EndOfStream:
+                break
+
+            self.outputs['OUT'].send_packet(packet)
+
+
+class Sink(Component):
+    def initialize(self):
+        self.inputs.add('IN')
+        self.latencies = []
+
+    def run(self):
+        while True:
+            sent_time = self.inputs['IN'].receive()
+            if sent_time is EndOfStream:
+                break
+
+            self.latencies.append(time.time() - sent_time)
+
+
+def create_graph():
+    graph = Graph('BENCHMARK', initialize=False)
+    previous = Source('SOURCE')
+    for i in range(STAGES):
+        stage = Stage('STAGE_{}'.format(i))
+        graph.connect(previous.outputs['OUT'], stage.inputs['IN'])
+        previous = stage
+
+    sink = Sink('SINK')
+    graph.connect(previous.outputs['OUT'], sink.inputs['IN'])
+    return graph, sink
+
+
+def run(policy):
+    graph, sink = create_graph()
+    executor = SingleProcessGraphExecutor(graph, scheduling_policy=policy)
+
+    peak_depth = [0]
+
+    def sample_depth():
+        while True:
+            if executor._recv_queues:
+                depth = sum(q.qsize() for q in executor._recv_queues.values())
+                peak_depth[0] = max(peak_depth[0], depth)
+            gevent.sleep(0.005)
+
+    sampler = gevent.spawn(sample_depth)
+    start_time = time.time()
+    executor.execute()
+    elapsed = time.time() - start_time
+    sampler.kill()
+
+    latencies = sorted(sink.latencies)
+    return (len(latencies) / elapsed,
+            sum(latencies) / len(latencies),
+            latencies[int(len(latencies) * 0.95)],
+            peak_depth[0])
+
+
+def main():
+    print('{:<18} {:>14} {:>16} {:>16} {:>12}'.format(
+          'policy', 'packets/s', 'mean latency ms', 'p95 latency ms', 'peak queued'))
+
+    for policy in (RoundRobinPolicy(), SinkFirstPolicy(), QueueDepthPolicy()):
+        throughput, mean_latency, p95_latency, peak_depth = run(policy)
+        print('{:<18} {:>14.1f} {:>16.1f} {:>16.1f} {:>12d}'.format(
+              policy.__class__.__name__, throughput, mean_latency * 1000,
+              p95_latency * 1000, peak_depth))
+
+
+if __name__ == '__main__':
+    main()
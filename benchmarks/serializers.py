@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Benchmarks the packet serializers used on cross-process edges.
+
+Every serialized packet is also pickled and unpickled again the same way
+``multiprocessing.Queue`` does it, so the numbers reflect the full per-packet
+cost of crossing a process boundary.
+"""
+import sys
+import timeit
+
+try:
+    import cPickle as pickle  # 2.x
+except ImportError:
+    import pickle  # 3.x
+
+from pflow.packet import (Packet, StartSubStream, SwitchMapNamespace,
+                          NoopSerializer, JsonPacketSerializer,
+                          BinaryPacketSerializer)
+
+ITERATIONS = 2000
+
+if sys.version_info.major < 3:
+    # multiprocessing connections pickle at the highest protocol on 2.x
+    TRANSPORT_PROTOCOL = pickle.HIGHEST_PROTOCOL
+else:
+    TRANSPORT_PROTOCOL = pickle.DEFAULT_PROTOCOL
+
+
+def make_packets():
+    record = {'label': 'Artist - Title', 'rank': 12, 'tags': ['a', 'b', 'c']}
+
+    traced = Packet(record)
+    traced.attrs['trace_id'] = 'c0ffee'
+
+    return [
+        ('int', Packet(42)),
+        ('line', Packet('Oct 18 12:00:00 host process[123]: USER_PROCESS: x')),
+        ('dict', Packet(record)),
+        ('dict+attrs', traced),
+        ('bytes 64k', Packet(b'\0' * 65536)),
+        ('bracket', StartSubStream()),
+        ('namespace', SwitchMapNamespace('alpha'))
+    ]
+
+
+def round_trip(serializer, packet):
+    transported = pickle.loads(pickle.dumps(serializer.serialize(packet),
+                                           TRANSPORT_PROTOCOL))
+    return serializer.deserialize(transported)
+
+
+def main():
+    serializers = [
+        ('noop', NoopSerializer()),
+        ('json', JsonPacketSerializer()),
+        ('binary', BinaryPacketSerializer())
+    ]
+
+    print('{:<12} {:>12} {:>12} {:>12}'.format(
+          'packet', *[name for name, _ in serializers]))
+
+    for packet_name, packet in make_packets():
+        row = []
+        for _, serializer in serializers:
+            try:
+                seconds = timeit.timeit(lambda: round_trip(serializer, packet),
+                                        number=ITERATIONS)
+            except (TypeError, ValueError):
+                row.append('n/a')
+            else:
+                row.append('{:.2f} us'.format(seconds / ITERATIONS * 1e6))
+
+        print('{:<12} {:>12} {:>12} {:>12}'.format(packet_name, *row))
+
+
+if __name__ == '__main__':
+    main()
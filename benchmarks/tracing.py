@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Benchmarks the overhead of packet tracing.
+
+A source sends ``COUNT`` packets through a chain of ``DEPTH`` transforms to a
+sink, without tracing, then with a `Tracer` sampling 1% and 100% of the
+packets. The CPU time the graph used is compared.
+"""
+from pflow.executors.single_process import SingleProcessGraphExecutor, monkey_patch
+monkey_patch()
+
+from pflow.core import Graph, Component
+from pflow.packet import EndOfStream
+from pflow.executors.scheduling import QueueDepthPolicy
+from pflow.tracing import Tracer
+
+COUNT = 2000
+DEPTH = 4
+
+
+class Source(Component):
+    def initialize(self):
+        self.outputs.add('OUT')
+
+    def run(self):
+        for i in range(COUNT):
+            self.outputs['OUT'].send(i)
+
+
+class Increment(Component):
+    def initialize(self):
+        self.inputs.add('IN')
+        self.outputs.add('OUT')
+
+    def run(self):
+        while True:
+            value = self.inputs['IN'].receive()
+            if value is EndOfStream:
+                break
+
+            self.outputs['OUT'].send(value + 1)
+
+
+class Sink(Component):
+    def initialize(self):
+        self.inputs.add('IN')
+
+    def run(self):
+        while self.inputs['IN'].receive() is not EndOfStream:
+            pass
+
+
+def run(sample_rate):
+    graph = Graph('BENCHMARK', initialize=False)
+    port = Source('SOURCE').outputs['OUT']
+    for i in range(DEPTH):
+        transform = Increment('INCREMENT_{}'.format(i))
+        graph.connect(port, transform.inputs['IN'])
+        port = transform.outputs['OUT']
+    graph.connect(port, Sink('SINK').inputs['IN'])
+
+    executor = SingleProcessGraphExecutor(graph, scheduling_policy=QueueDepthPolicy())
+    if sample_rate is not None:
+        executor.tracer = Tracer(graph, sample_rate)
+    executor.execute()
+
+    p99 = executor.tracer.latency.get_percentile(99) if executor.tracer else None
+    return executor.cpu_time, p99
+
+
+def main():
+    print('{:<12} {:>8} {:>12}'.format('sample rate', 'cpu s', 'p99 ms'))
+
+    for sample_rate in (None, 0.01, 1.0):
+        cpu_time, p99 = run(sample_rate)
+        print('{:<12} {:>8.2f} {:>12}'.format(
+              'off' if sample_rate is None else '{:.0%}'.format(sample_rate), cpu_time,
+              '-' if p99 is None else '{:.1f}'.format(p99 * 1000)))
+
+
+if __name__ == '__main__':
+    main()
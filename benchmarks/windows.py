@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Benchmarks time windows with thousands of keys open at once.
+
+A source sends a record for each of ``HOSTS`` hosts, waits, then does it
+again, and per-host processing time windows of ``SIZE`` seconds aggregate
+them. `TumblingWindow` (which sleeps on the executor's timer heap until its
+next window closes) is compared with a window that emulates timers like
+`Binner`, by receiving with a timeout and scanning its windows whenever the
+receive times out. The sink records how long after their end the first
+window of each round arrives, and the CPU time the graph used is measured.
+"""
+import math
+import time
+
+from pflow.executors.single_process import SingleProcessGraphExecutor, monkey_patch
+monkey_patch()
+
+from pflow.core import Graph, Component
+from pflow.packet import EndOfStream
+from pflow.components import TumblingWindow
+from pflow.executors.scheduling import QueueDepthPolicy
+from pflow import exc
+
+HOSTS = 200
+ROUNDS = 3
+SIZE = 1.0
+POLL_TIMEOUT = 0.1
+
+
+class Source(Component):
+    def initialize(self):
+        self.outputs.add('OUT')
+
+    def run(self):
+        for _ in range(ROUNDS):
+            for host in range(HOSTS):
+                self.outputs['OUT'].send({'host': host, 'value': 1})
+            self.suspend(SIZE * 2)
+
+
+class PollingTumblingWindow(Component):
+    def initialize(self):
+        self.inputs.add('IN')
+        self.outputs.add('OUT')
+
+    def run(self):
+        windows = {}
+        while True:
+            try:
+                record = self.inputs['IN'].receive(timeout=POLL_TIMEOUT)
+            except exc.PortTimeout:
+                record = None
+
+            if record is EndOfStream:
+                break
+
+            now = time.time()
+            if record is not None:
+                start = math.floor(now / SIZE) * SIZE
+                counts = windows.setdefault(record['host'], {})
+                counts[start] = counts.get(start, 0) + 1
+
+            for host, counts in windows.items():
+                for start in [s for s in counts if s + SIZE <= now]:
+                    self.outputs['OUT'].send({'key': host, 'start': start,
+                                              'count': counts.pop(start)})
+
+        for host, counts in windows.items():
+            for start, count in counts.items():
+                self.outputs['OUT'].send({'key': host, 'start': start, 'count': count})
+
+
+class Sink(Component):
+    def initialize(self):
+        self.inputs.add('IN')
+        self.delays = {}  # Delay of the first window to arrive, by window start
+
+    def run(self):
+        while True:
+            window = self.inputs['IN'].receive()
+            if window is EndOfStream:
+                break
+
+            self.delays.setdefault(window['start'], time.time() - (window['start'] + SIZE))
+
+
+def run(window):
+    graph = Graph('BENCHMARK', initialize=False)
+    sink = Sink('SINK')
+    graph.connect(Source('SOURCE').outputs['OUT'], window.inputs['IN'])
+    graph.connect(window.outputs['OUT'], sink.inputs['IN'])
+    if isinstance(window, TumblingWindow):
+        graph.set_initial_packet(window.inputs['SIZE'], SIZE)
+        graph.set_initial_packet(window.inputs['KEY'], 'host')
+        graph.set_initial_packet(window.inputs['FIELD'], 'value')
+
+    executor = SingleProcessGraphExecutor(graph, scheduling_policy=QueueDepthPolicy())
+    executor.execute()
+
+    # Windows still open at the end of the stream are flushed early
+    delays = [delay for delay in sink.delays.values() if delay >= 0]
+    return executor.cpu_time, sum(delays) / len(delays), max(delays)
+
+
+def main():
+    print('{:<22} {:>8} {:>14} {:>14}'.format(
+          'window', 'cpu s', 'mean delay ms', 'max delay ms'))
+
+    for window in (PollingTumblingWindow('WINDOW'), TumblingWindow('WINDOW')):
+        cpu_time, mean_delay, max_delay = run(window)
+        print('{:<22} {:>8.2f} {:>14.1f} {:>14.1f}'.format(
+              window.__class__.__name__, cpu_time, mean_delay * 1000,
+              max_delay * 1000))
+
+
+if __name__ == '__main__':
+    main()
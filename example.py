@@ -5,8 +5,10 @@ use_multi_process = (os.environ.get('PFLOW_MULTIPROCESS', '') == '1')
 if use_multi_process:
     from pflow.executors.multi_process import MultiProcessGraphExecutor as GraphExecutorImpl
 else:
-    # Need to load before logging
-    from pflow.executors.single_process import SingleProcessGraphExecutor as GraphExecutorImpl
+    # Need to patch before logging
+    from pflow.executors.single_process import (SingleProcessGraphExecutor as GraphExecutorImpl,
+                                                monkey_patch)
+    monkey_patch()
 
 import logging
 
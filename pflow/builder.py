@@ -3,6 +3,7 @@ Utility module for constructing graphs in a similar fashion to the FBP DSL
 """
 
 import contextlib
+from .core import Graph
 from .states import ComponentState
 
 
@@ -58,7 +59,6 @@ def build_graph(*args, **kwargs):
 
 
 if __name__ == '__main__':
-    from .core import Graph
     from pflow.components import *
     with build_graph('foo') as V:
         limit = 3
@@ -1,8 +1,14 @@
 import logging
 import collections
+import heapq
+import itertools
+import math
+import operator
 import sys
 import os
 import copy
+import time
+from abc import abstractmethod
 
 try:
     import queue  # 3.x
@@ -12,9 +18,50 @@ except ImportError:
 from .core import (Graph, Component, ComponentState, InputPort, OutputPort,
                    ArrayInputPort, ArrayOutputPort, keepalive, EndOfStream,
                    StartSubStream, EndSubStream, StartMap, EndMap, ControlPacket, SwitchMapNamespace)
+from .packet import get_numpy, is_batch_array, make_batch_array
 from . import exc
 
 
+def _apply(operator, ufunc_name, *operands):
+    """
+    Applies an arithmetic operator to scalars, or element-wise to batch arrays
+    (see ``packet.RecordBatch``), in which case scalar operands apply to every
+    element.
+
+    Parameters
+    ----------
+    operator : callable
+        scalar operator, e.g. ``operator.mul``.
+    ufunc_name : str
+        name of the NumPy ufunc to use instead, for batch arrays.
+    operands : number or typed array
+
+    Returns
+    -------
+    result : number or typed array
+    """
+    batches = [x for x in operands if is_batch_array(x)]
+    if not batches:
+        return operator(*operands)
+
+    numpy = get_numpy()
+    if numpy is not None:
+        return getattr(numpy, ufunc_name)(*operands)
+
+    # Without NumPy, only the Python loop is saved: batches still need
+    # just one packet and scheduler round trip.
+    size = len(batches[0])
+    if any(len(x) != size for x in batches):
+        raise ValueError('Batches of different sizes: {}'.format(
+                         ', '.join(str(len(x)) for x in batches)))
+
+    columns = [x if is_batch_array(x) else itertools.repeat(x, size)
+               for x in operands]
+    values = [operator(*args) for args in zip(*columns)]
+    typecode = 'd' if any(isinstance(v, float) for v in values) else 'l'
+    return make_batch_array(values, typecode)
+
+
 class Repeat(Component):
     """
     Repeats inputs from IN to OUT
@@ -37,12 +84,27 @@ class Constant(Component):
     """
     Repeats a constant VALUE (set once) to OUT, LIMIT times (or infinitely if
     none).
+
+    The number of values sent is saved in checkpoints, so a resumed graph
+    only sends the rest of them.
     """
     def initialize(self):
         self.inputs.add('VALUE'),
         self.inputs.add('LIMIT', optional=True)
         self.outputs.add('OUT')
 
+        self.count = None  # Values sent, once running
+        self._resume_count = None
+
+    def get_checkpoint_state(self):
+        if self.count is None:
+            return self._resume_count
+
+        return self.count
+
+    def restore_checkpoint_state(self, state):
+        self._resume_count = state
+
     def run(self):
         value = self.inputs['VALUE'].receive()
         if value is EndOfStream:
@@ -52,13 +114,17 @@ class Constant(Component):
         if limit is EndOfStream:
             limit = None
 
-        count = 0
+        self.count = self._resume_count or 0
+        self._resume_count = None
         while self.is_alive():
-            count += 1
-            if limit is not None and count > limit:
+            if limit is not None and self.count >= limit:
                 break
 
-            self.outputs['OUT'].send(value)
+            # Counted before sending, since the value is in flight (and part
+            # of any checkpoint) as soon as the send starts
+            self.count += 1
+            with self.quiescent():
+                self.outputs['OUT'].send(value)
 
 
 class Drop(Component):
@@ -179,28 +245,28 @@ class Split(Component):
             self.log.debug(u'Send: {} (OUT_A={}, OUT_B={})'.format(packet.value,
                                                                    out_a.is_open(),
                                                                    out_b.is_open()))
-            if out_a.is_open():
-                out_a.send(packet.value)
-            if out_b.is_open():
-                out_b.send(packet.value)
+            # Both outputs share the packet rather than getting copies
+            self.broadcast_packet(packet, [out_a, out_b])
+            return
 
         self.drop_packet(packet)
 
 
-# class Split(Component):
-#     """
-#     Splits inputs from IN to OUT[]
-#     """
-#     def initialize(self):
-#         self.inputs.add_ports(InputPort('IN'))
-#         self.outputs.add_ports(ArrayOutputPort('OUT', 10))
-#
-#     @keepalive
-#     def run(self):
-#         packet = self.inputs['IN'].receive_packet()
-#         if packet is not EndOfStream:
-#             for outp in self.outputs['OUT']:
-#                 outp.send_packet(packet)
+class Broadcast(Component):
+    """
+    Sends each packet from IN to every connected port of OUT[]
+    """
+    def initialize(self):
+        self.inputs.add_ports(InputPort('IN'))
+        self.outputs.add_ports(ArrayOutputPort('OUT', 10))
+
+    @keepalive
+    def run(self):
+        packet = self.inputs['IN'].receive_packet()
+        if packet is EndOfStream:
+            self.terminate()
+        else:
+            self.outputs['OUT'].broadcast_packet(packet)
 
 
 class Cons(Component):
@@ -278,7 +344,8 @@ class DictValueExtractor(Component):
             return
 
         while self.is_alive():
-            d = self.inputs['IN'].receive()
+            with self.quiescent():
+                d = self.inputs['IN'].receive()
             if d is EndOfStream:
                 self.terminate()
                 break
@@ -316,7 +383,8 @@ class RegexFilter(Component):
         pattern = re.compile(regex_value)
 
         while self.is_alive():
-            packet = self.inputs['IN'].receive_packet()
+            with self.quiescent():
+                packet = self.inputs['IN'].receive_packet()
             if packet is EndOfStream:
                 self.terminate()
                 break
@@ -347,10 +415,45 @@ class RegexFilter(Component):
 #             self.outputs['OUT'].send_packet(packet)
 
 
+class Merge(Component):
+    """
+    Merges inputs from IN[] into OUT, in the order they arrive
+    """
+    def initialize(self):
+        self.inputs.add_ports(ArrayInputPort('IN', 10))
+        self.outputs.add_ports(OutputPort('OUT'))
+
+    def run(self):
+        while True:
+            with self.quiescent():
+                packet, port = self.receive_any(self.inputs['IN'])
+            if packet is EndOfStream:
+                break
+
+            # Keep substreams together, rather than interleaving them with
+            # packets from other ports
+            depth = 0
+            while packet is not EndOfStream:
+                if isinstance(packet, (StartSubStream, StartMap)):
+                    depth += 1
+                elif isinstance(packet, (EndSubStream, EndMap)):
+                    depth -= 1
+
+                self.outputs['OUT'].send_packet(packet)
+                if depth <= 0:
+                    break
+
+                packet = port.receive_packet()
+
+
 class Multiply(Component):
+    """
+    Multiplies X by Y. Either may be a ``RecordBatch``, which is multiplied
+    element-wise, and results in a batch.
+    """
     def initialize(self):
-        self.inputs.add_ports(InputPort('X'),
-                              InputPort('Y'))
+        self.inputs.add_ports(InputPort('X', receive_batches=True),
+                              InputPort('Y', receive_batches=True))
         self.outputs.add_ports(OutputPort('OUT'))
 
     @keepalive
@@ -362,17 +465,23 @@ class Multiply(Component):
             self.terminate()
             return
 
-        result = x * y
+        result = _apply(operator.mul, 'multiply', x, y)
 
-        self.log.debug('Multiply {} * {} = {}'.format(x, y, result))
-
-        self.outputs['OUT'].send(result)
+        if is_batch_array(result):
+            self.outputs['OUT'].send_batch(result)
+        else:
+            self.log.debug('Multiply {} * {} = {}'.format(x, y, result))
+            self.outputs['OUT'].send(result)
 
 
 class Modulo(Component):
+    """
+    Sends the (float) remainder of IN divided by MODULO. Either may be a
+    ``RecordBatch``, which is divided element-wise, and results in a batch.
+    """
     def initialize(self):
-        self.inputs.add('IN')
-        self.inputs.add('MODULO')
+        self.inputs.add('IN', receive_batches=True)
+        self.inputs.add('MODULO', receive_batches=True)
         self.outputs.add('OUT')
 
     @keepalive
@@ -387,11 +496,15 @@ class Modulo(Component):
             self.terminate()
             return
 
-        result = float(value) % float(modulo)
-
-        self.log.debug('Modulo {} %% {} = {}'.format(value, modulo, result))
+        value, modulo = [make_batch_array(x) if is_batch_array(x) else float(x)
+                         for x in (value, modulo)]
+        result = _apply(operator.mod, 'mod', value, modulo)
 
-        self.outputs['OUT'].send(result)
+        if is_batch_array(result):
+            self.outputs['OUT'].send_batch(result)
+        else:
+            self.log.debug('Modulo {} %% {} = {}'.format(value, modulo, result))
+            self.outputs['OUT'].send(result)
 
 
 class Binner(Component):
@@ -475,11 +588,372 @@ class Binner(Component):
             bracket_sent_packets += 1
 
 
+class WindowAggregate(object):
+    """
+    Incremental aggregates (count, sum, min, max and mean) of the values in
+    a time window.
+    """
+    NAMES = ('count', 'sum', 'min', 'max', 'mean')
+
+    def __init__(self, key, start, end):
+        self.key = key
+        self.start = start
+        self.end = end  # Time the window closes at
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.is_open = True
+
+    @property
+    def mean(self):
+        return float(self.sum) / self.count if self.count else None
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Merges another window's aggregates into this one (e.g. when a value
+        bridges two sessions).
+        """
+        self.start = min(self.start, other.start)
+        self.end = max(self.end, other.end)
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                if self.min is None or value < self.min:
+                    self.min = value
+                if self.max is None or value > self.max:
+                    self.max = value
+
+    def to_dict(self):
+        result = {'key': self.key, 'start': self.start, 'end': self.end}
+        for name in self.NAMES:
+            result[name] = getattr(self, name)
+        return result
+
+
+class Window(Component):
+    """
+    Base class of the windowing components, which aggregate the numbers
+    received on IN over time windows, and send the aggregates of each window
+    to OUT once it closes.
+
+    Windows are by processing time (when values are received) unless
+    TIME_FIELD is set, in which case they are by event time. Event time
+    windows close once a value LATENESS seconds past their end is received,
+    and values for windows that have already closed are dropped.
+
+    The aggregates of the open windows (and the event time watermark) are
+    saved in checkpoints, so a resumed graph carries on aggregating them.
+    """
+    def initialize(self):
+        self.inputs.add('IN',
+                        description='Numbers, or records (e.g. dicts) with the '
+                                    'number in FIELD')
+        self.inputs.add('KEY',
+                        optional=True,
+                        description='Record field to aggregate separately by '
+                                    '(e.g. host)')
+        self.inputs.add('FIELD',
+                        optional=True,
+                        description='Record field with the number to aggregate')
+        self.inputs.add('TIME_FIELD',
+                        optional=True,
+                        description='Record field with the event time (in '
+                                    'seconds since the epoch)')
+        self.inputs.add('LATENESS',
+                        allowed_types=[int, float],
+                        optional=True,
+                        description='Number of seconds event time windows stay '
+                                    'open past their end (default: 0)')
+        self.inputs.add('BRACKETS',
+                        allowed_types=[bool],
+                        optional=True,
+                        description='Send each window as a substream of (name, '
+                                    'value) tuples rather than as a dict')
+        self.outputs.add('OUT',
+                         description='Aggregates of each window, as it closes')
+
+        self._deadlines = None  # Heap of (end, sequence, window) of open windows, once running
+        self._resume_state = None
+
+    def get_checkpoint_state(self):
+        if self._deadlines is None:
+            return self._resume_state
+
+        return {'watermark': self._watermark, 'windows': self.get_open_windows()}
+
+    def restore_checkpoint_state(self, state):
+        self._resume_state = state
+
+    def receive_parameters(self):
+        """
+        Receives the parameters of the windows from the input ports.
+        """
+        pass
+
+    @abstractmethod
+    def restore_window(self, window):
+        """
+        Adds an open window restored from a checkpoint, before it is opened.
+        """
+        pass
+
+    @abstractmethod
+    def add(self, key, timestamp, value):
+        """
+        Adds a value to the windows it falls in.
+        """
+        pass
+
+    def open_window(self, window):
+        """
+        Opens a window, scheduling it to close at its end.
+        """
+        heapq.heappush(self._deadlines, (window.end, next(self._sequence), window))
+
+    def get_open_windows(self):
+        """
+        Gets the windows that are open, in the order they close.
+        """
+        return [window for end, _, window in sorted(self._deadlines)
+                if window.is_open and window.end == end]
+
+    def close_windows(self, now):
+        """
+        Sends the aggregates of the windows that end by `now`, in the order
+        they end.
+        """
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            end, _, window = heapq.heappop(deadlines)
+            if not window.is_open or window.end != end:
+                continue  # Merged into another window, or extended
+
+            window.is_open = False
+            self.on_window_closed(window)
+            self.send_window(window)
+
+    def on_window_closed(self, window):
+        """
+        Called when a window closes, before it is sent.
+        """
+        pass
+
+    def is_late(self, end):
+        """
+        Have windows ending at `end` already closed?
+        """
+        return self._watermark is not None and end <= self._watermark
+
+    def send_window(self, window):
+        outport = self.outputs['OUT']
+        if not self._brackets:
+            outport.send(window.to_dict())
+            return
+
+        outport.start_substream()
+        if self._key_field is not None:
+            outport.send(('key', window.key))
+        outport.send(('start', window.start))
+        outport.send(('end', window.end))
+        for name in WindowAggregate.NAMES:
+            outport.send((name, getattr(window, name)))
+        outport.end_substream()
+
+    def run(self):
+        def receive_optional(port_name, default=None):
+            value = self.inputs[port_name].receive()
+            return default if value is EndOfStream else value
+
+        self._key_field = receive_optional('KEY')
+        self._field = receive_optional('FIELD')
+        self._time_field = receive_optional('TIME_FIELD')
+        self._lateness = receive_optional('LATENESS', 0)
+        self._brackets = receive_optional('BRACKETS', False)
+        self.receive_parameters()
+
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._watermark = None  # Event time up to which windows are closed
+        in_port = self.inputs['IN']
+
+        state = self._resume_state
+        self._resume_state = None
+        if state is not None:
+            self._watermark = state['watermark']
+            for window in state['windows']:
+                self.restore_window(window)
+                self.open_window(window)
+
+        while True:
+            timeout = None
+            if self._time_field is None and self._deadlines:
+                # Wake up when the next window closes
+                timeout = max(0.0, self._deadlines[0][0] - time.time())
+
+            try:
+                # Closed windows have all been sent, so the open ones are
+                # all that the component holds
+                with self.quiescent():
+                    packet, _ = self.receive_any([in_port], timeout=timeout)
+            except exc.PortTimeout:
+                self.close_windows(time.time())
+                continue
+
+            if packet is EndOfStream:
+                break
+
+            record = packet.value
+            self.drop_packet(packet)
+            if isinstance(packet, ControlPacket):
+                continue  # Ignore incoming brackets
+
+            key = record[self._key_field] if self._key_field is not None else None
+            value = record[self._field] if self._field is not None else record
+
+            if self._time_field is None:
+                now = time.time()
+                self.add(key, now, value)
+                self.close_windows(now)
+            else:
+                timestamp = record[self._time_field]
+                self.add(key, timestamp, value)
+                watermark = timestamp - self._lateness
+                if self._watermark is None or watermark > self._watermark:
+                    self._watermark = watermark
+                    self.close_windows(watermark)
+
+        # Send the windows that are still open
+        self.close_windows(float('inf'))
+
+
+class TumblingWindow(Window):
+    """
+    Aggregates the numbers received on IN over consecutive, non-overlapping
+    windows of SIZE seconds (e.g. per minute).
+    """
+    def initialize(self):
+        super(TumblingWindow, self).initialize()
+        self.inputs.add('SIZE',
+                        allowed_types=[int, float],
+                        description='Length of each window in seconds')
+
+    def receive_parameters(self):
+        self._size = self.inputs['SIZE'].receive()
+        self._windows = {}  # Open windows by (key, start)
+
+    def add(self, key, timestamp, value):
+        start = math.floor(timestamp / self._size) * self._size
+        self.add_to_window(key, start, value)
+
+    def restore_window(self, window):
+        self._windows[(window.key, window.start)] = window
+
+    def add_to_window(self, key, start, value):
+        window = self._windows.get((key, start))
+        if window is None:
+            end = start + self._size
+            if self.is_late(end):
+                self.log.debug('Dropped late value {!r} for {}'.format(value, key))
+                return
+
+            window = self._windows[(key, start)] = WindowAggregate(key, start, end)
+            self.open_window(window)
+
+        window.add(value)
+
+    def on_window_closed(self, window):
+        del self._windows[(window.key, window.start)]
+
+
+class SlidingWindow(TumblingWindow):
+    """
+    Aggregates the numbers received on IN over windows of SIZE seconds that
+    start every SLIDE seconds, so that each number falls in SIZE / SLIDE
+    overlapping windows (e.g. the last 5 minutes, every minute).
+    """
+    def initialize(self):
+        super(SlidingWindow, self).initialize()
+        self.inputs.add('SLIDE',
+                        allowed_types=[int, float],
+                        description='Number of seconds between the starts of '
+                                    'windows')
+
+    def receive_parameters(self):
+        super(SlidingWindow, self).receive_parameters()
+        self._slide = self.inputs['SLIDE'].receive()
+
+    def add(self, key, timestamp, value):
+        start = math.floor(timestamp / self._slide) * self._slide
+        while start > timestamp - self._size:
+            self.add_to_window(key, start, value)
+            start -= self._slide
+
+
+class SessionWindow(Window):
+    """
+    Aggregates the numbers received on IN over sessions of activity: a
+    session closes once no number has been received for it in GAP seconds.
+    """
+    def initialize(self):
+        super(SessionWindow, self).initialize()
+        self.inputs.add('GAP',
+                        allowed_types=[int, float],
+                        description='Number of seconds of inactivity that '
+                                    'close a session')
+
+    def receive_parameters(self):
+        self._gap = self.inputs['GAP'].receive()
+        self._sessions = collections.defaultdict(list)  # Open sessions by key
+
+    def add(self, key, timestamp, value):
+        end = timestamp + self._gap
+        if self.is_late(end):
+            self.log.debug('Dropped late value {!r} for {}'.format(value, key))
+            return
+
+        # Merge the sessions the value falls in (or bridges) into one
+        window = WindowAggregate(key, timestamp, end)
+        sessions = self._sessions[key]
+        for session in list(sessions):
+            if session.start - self._gap <= timestamp <= session.end:
+                window.merge(session)
+                session.is_open = False
+                sessions.remove(session)
+
+        window.add(value)
+        sessions.append(window)
+        self.open_window(window)
+
+    def restore_window(self, window):
+        self._sessions[window.key].append(window)
+
+    def on_window_closed(self, window):
+        sessions = self._sessions[window.key]
+        sessions.remove(window)
+        if not sessions:
+            del self._sessions[window.key]
+
+
 class FileTailReader(Component):
     """
     Tails a file specified in input port PATH and follows it,
     emitting new lines that are added to output port OUT.
+
+    The byte offset of the next line is saved in checkpoints, so a resumed
+    graph continues tailing from where it left off.
     """
+    ENCODING = 'utf-8'  # Encoding of the tailed file
+
     def initialize(self):
         self.inputs.add('PATH',
                         description='File to tail',
@@ -487,6 +961,19 @@ class FileTailReader(Component):
         self.outputs.add('OUT',
                          description='Lines that are added to file')
 
+        self.file_path = None  # Path of the file being tailed
+        self.offset = 0        # Byte offset of the next line to emit
+        self._resume_state = None
+
+    def get_checkpoint_state(self):
+        if self.file_path is None:
+            return self._resume_state
+
+        return {'path': self.file_path, 'offset': self.offset}
+
+    def restore_checkpoint_state(self, state):
+        self._resume_state = state
+
     @keepalive
     def run(self):
         import sh
@@ -496,13 +983,26 @@ class FileTailReader(Component):
             self.terminate()
             return
 
-        self.log.debug(u'Tailing file: {}'.format(file_path))
+        state = self._resume_state
+        self._resume_state = None
+        if state is not None and state['path'] == file_path:
+            self.offset = state['offset']
+        else:
+            self.offset = 0
+        self.file_path = file_path
+
+        self.log.debug(u'Tailing file: {} (from byte {})'.format(file_path, self.offset))
 
-        for line in sh.tail('-f', file_path, _iter=True):
+        for line in sh.tail('-c', '+{:d}'.format(self.offset + 1), '-f', file_path,
+                            _iter=True, _encoding=self.ENCODING):
             stripped_line = line.rstrip()
             self.log.debug(u'Tailed line: {}'.format(stripped_line))
 
-            self.outputs['OUT'].send(stripped_line)
+            # Advanced before sending, since the line is in flight (and part
+            # of any checkpoint) as soon as the send starts.
+            self.offset += len(line.encode(self.ENCODING))
+            with self.quiescent():
+                self.outputs['OUT'].send(stripped_line)
 
             if self.is_terminated():
                 break
@@ -531,7 +1031,10 @@ class ConsoleLineWriter(Component):
 
         depth = 0
         while self.is_alive():
-            packet = self.inputs['IN'].receive_packet()
+            # Packets are forwarded as they are, so only the indentation of
+            # a substream is lost if the graph resumes from a checkpoint
+            with self.quiescent():
+                packet = self.inputs['IN'].receive_packet()
             if packet is EndOfStream:
                 self.terminate()
                 break
@@ -794,6 +1297,12 @@ class RandomNumberGenerator(Component):
     Generates an sequence of random numbers, sending
     them all to the OUT port.
 
+    If BLOCK_SIZE is set, the numbers are generated in blocks of that many
+    at once (using NumPy if it is installed), and each block is sent as a
+    ``RecordBatch``. Ports that don't receive batches still receive one
+    number at a time. With NumPy, a given SEED generates different numbers
+    in blocks than it does one by one.
+
     This component is a generator.
     """
     def initialize(self):
@@ -806,6 +1315,11 @@ class RandomNumberGenerator(Component):
                         optional=True,
                         description='Number of times to iterate (default: '
                                     'infinite)')
+        self.inputs.add('BLOCK_SIZE',
+                        allowed_types=[int],
+                        optional=True,
+                        description='Number of values to generate and send '
+                                    'at once (default: 1, unbatched)')
         self.outputs.add('OUT')
 
     def run(self):
@@ -821,7 +1335,13 @@ class RandomNumberGenerator(Component):
         if limit_value is EndOfStream:
             limit_value = None
 
-        if limit_value is None or limit_value > 0:
+        block_size = self.inputs['BLOCK_SIZE'].receive()
+        if block_size is not EndOfStream:
+            if seed_value is EndOfStream:
+                seed_value = None
+
+            self._generate_blocks(prng, seed_value, limit_value, block_size)
+        elif limit_value is None or limit_value > 0:
             i = 1
             while self.is_alive():
                 random_value = prng.randint(1, 100)
@@ -836,3 +1356,25 @@ class RandomNumberGenerator(Component):
                         break
 
                 i += 1
+
+    def _generate_blocks(self, prng, seed_value, limit_value, block_size):
+        if block_size < 1:
+            raise ValueError('BLOCK_SIZE must be positive')
+
+        numpy = get_numpy()
+        if numpy is not None:
+            numpy_prng = numpy.random.RandomState(seed_value)
+
+        remaining = limit_value
+        while self.is_alive() and (remaining is None or remaining > 0):
+            size = block_size if remaining is None else min(block_size, remaining)
+            if numpy is not None:
+                values = numpy_prng.randint(1, 101, size)
+            else:
+                values = [prng.randint(1, 100) for _ in range(size)]
+
+            self.log.debug('Generated block of {}'.format(size))
+            self.outputs['OUT'].send_batch(values, 'l')
+
+            if remaining is not None:
+                remaining -= size
@@ -1,8 +1,9 @@
 from abc import ABCMeta, abstractmethod
+import contextlib
 import logging
 import json
-import inspect
 import functools
+import time
 
 try:
     import queue  # 3.x
@@ -15,12 +16,18 @@ from . import parsefbp
 from .port import (PortRegistry, Port, InputPort, OutputPort, ArrayInputPort,
                    ArrayOutputPort)
 from .packet import (Packet, EndOfStream, ControlPacket, StartSubStream,
-                     EndSubStream, StartMap, EndMap, SwitchMapNamespace)
+                     EndSubStream, StartMap, EndMap, SwitchMapNamespace,
+                     EndOfWorkUnit, RecordBatch)
 from .states import (ComponentState, assert_component_state,
                      assert_not_component_state)
 
 log = logging.getLogger(__name__)
 
+_TERMINATED_STATES = frozenset([ComponentState.TERMINATED,
+                                ComponentState.ERROR])
+_SUSPENDED_STATES = frozenset([ComponentState.SUSP_RECV,
+                               ComponentState.SUSP_SEND])
+
 
 def keepalive(fn):
     """
@@ -36,7 +43,13 @@ def keepalive(fn):
     def keepalive_wrapper(self):
         while self.is_alive():
             fn(self)
-            self.suspend()
+
+            # Between runs the component holds no packets
+            self._quiescent = True
+            try:
+                self.suspend()
+            finally:
+                self._quiescent = False
 
     return keepalive_wrapper
 
@@ -80,6 +93,11 @@ class Component(object):
     ])
 
     _state = ComponentState.NOT_INITIALIZED
+    _parent_graph = None  # Graph this component was added to
+    _quiescent = False    # Is the component at a quiescent point (see `quiescent()`)?
+    _trace = None         # Trace of the last packet received (see tracing.py)
+    _state_port = None    # Name of the port the component last waited on (see executors.flight_recorder)
+    _executor = None
 
     def __init__(self, name, initialize=True):
         """
@@ -94,6 +112,7 @@ class Component(object):
             raise ValueError('name must be a string')
 
         self.name = name
+        self.metadata = {}  # Arbitrary key/values (e.g. from graph definitions)
         self.inputs = PortRegistry(self, InputPort, ArrayInputPort)
         self.outputs = PortRegistry(self, OutputPort, ArrayOutputPort)
 
@@ -108,8 +127,7 @@ class Component(object):
 
         self._executor = None
 
-        # FIXME: not actually used:
-        self.stack = queue.LifoQueue()  # Used for simple bracket packets
+        self._stack = None
         self.owned_packet_count = 0
 
     @property
@@ -130,15 +148,24 @@ class Component(object):
         # Ensure state transition is a valid one.
         if (old_state, new_state) not in self._valid_transitions:
             raise exc.ComponentStateError(
-                'Invalid state transition for {}: {} -> {}'.format(
+                self, 'Invalid state transition for {}: {} -> {}'.format(
                     self, old_state.value, new_state.value))
 
         self._state = new_state
 
+        if self._parent_graph is not None:
+            self._parent_graph._child_state_changed(self, old_state, new_state)
+
+        executor = self._executor
+        if executor is not None and executor.flight_recorder is not None:
+            executor.flight_recorder.record(self, old_state, new_state)
+
         self.log.debug('State transitioned from {} -> {}'.format(
             old_state.value, new_state.value))
 
         if self.LOG_STATE_CHANGE_STACK_TRACES:
+            import inspect  # Deferred, since it is slow to import
+
             # If supported by interpreter, show the caller to this property method
             # to determine where the state was changed from.
             curr_frame = inspect.currentframe()
@@ -159,6 +186,18 @@ class Component(object):
 
         # TODO: Fire a transition event
 
+    @property
+    def stack(self):
+        """
+        Used for simple bracket packets.
+        """
+        # FIXME: not actually used. Created lazily, since queues are
+        # relatively expensive to construct for large graphs.
+        if self._stack is None:
+            self._stack = queue.LifoQueue()
+
+        return self._stack
+
     @property
     def executor(self):
         if self._executor is None:
@@ -196,6 +235,59 @@ class Component(object):
         """
         self.log.debug('Destroyed')
 
+    def get_checkpoint_state(self):
+        """
+        Implementations can override this to declare state that should be
+        saved in checkpoints, so that the component can resume where it left
+        off (e.g. a source's read offset) when its graph is restarted.
+
+        Checkpoints are only taken while the component is at a quiescent
+        point (see `quiescent()`), so the state must be consistent with the
+        packets it has already sent at those points.
+
+        Returns
+        -------
+        state : object
+            picklable state, or None if the component has none.
+        """
+        return None
+
+    def restore_checkpoint_state(self, state):
+        """
+        Restores state returned by `get_checkpoint_state()` from a checkpoint.
+        This is called before the component runs.
+
+        Parameters
+        ----------
+        state : object
+            the saved state.
+        """
+        pass
+
+    @contextlib.contextmanager
+    def quiescent(self):
+        """
+        Declares a quiescent point: within the block, the component holds no
+        packets or other data besides its checkpoint state (see
+        `get_checkpoint_state()`), so a checkpoint can be taken while it waits
+        there. Components that run once per packet (see `keepalive`) are
+        quiescent between runs, while components that loop should declare
+        their point of rest, e.g. receiving the next packet::
+
+            while True:
+                with self.quiescent():
+                    packet = self.inputs['IN'].receive_packet()
+
+        The block must end as soon as a packet is received, since the packet
+        is no longer part of a checkpoint once it leaves its edge.
+        """
+        quiescent = self._quiescent
+        self._quiescent = True
+        try:
+            yield
+        finally:
+            self._quiescent = quiescent
+
     @assert_not_component_state(ComponentState.TERMINATED,
                                 ComponentState.ERROR)
     def create_packet(self, value):
@@ -227,6 +319,30 @@ class Component(object):
         self.owned_packet_count += 1
         return packet
 
+    def create_batch(self, values, typecode='d'):
+        """
+        Create a new packet holding a batch of numbers.
+
+        Like `create_packet`, this sets this component as the owner.
+
+        Parameters
+        ----------
+        values : iterable
+            numbers for the batch, or a typed array of them.
+        typecode : str
+            type code of the numbers (see ``packet.make_batch_array()``).
+
+        Returns
+        -------
+        packet : ``packet.RecordBatch``
+            newly created packet
+        """
+        packet = RecordBatch(values, typecode)
+        packet.owner = self
+
+        self.owned_packet_count += 1
+        return packet
+
     # FIXME: shouldn't this be:
     # @assert_component_state(ComponentState.ACTIVE)
     @assert_not_component_state(ComponentState.TERMINATED,
@@ -243,6 +359,11 @@ class Component(object):
         if not isinstance(packet, Packet):
             raise ValueError('packet must be a Packet')
 
+        if packet._share_count > 1:
+            # Shared, and still to be dropped by other components
+            packet._share_count -= 1
+            return
+
         owner = packet.owner
 
         if owner is None:
@@ -257,6 +378,113 @@ class Component(object):
 
         del packet
 
+    def broadcast_packet(self, packet, ports):
+        """
+        Send a single packet on several output ports.
+
+        Rather than a copy of the packet being created (and later dropped) for
+        each port, the packet is shared between the downstream components, and
+        each of them drops it as usual. The cost of sending it barely grows
+        with the number of ports: no copies are made, executors can send to
+        all of the ports at once, and the component only yields once.
+
+        Parameters
+        ----------
+        packet : ``Packet``
+            the Packet to send. It must not be modified once sent.
+        ports : iterable of ``port.OutputPort``
+            output ports of this component. Those that are disconnected or
+            closed are skipped.
+        """
+        if not isinstance(packet, Packet):
+            raise ValueError('packet must be a Packet instance')
+
+        port_names = []
+        for port in ports:
+            if not isinstance(port, OutputPort) or port.component is not self:
+                raise ValueError('{} is not an output port of {}'.format(port, self))
+
+            if port.is_connected() and port.is_open():
+                port_names.append(port.name)
+
+        if not port_names:
+            self.drop_packet(packet)
+            return
+
+        if packet.owner is None:
+            packet.owner = self
+            self.owned_packet_count += 1
+
+        tracer = self.executor.tracer
+        if tracer is not None:
+            packet = tracer.on_send(self, packet)
+
+        packet.share(len(port_names))
+        self.executor.broadcast_port(self, port_names, packet)
+
+    def receive_any(self, ports, timeout=None):
+        """
+        Receive the next Packet to arrive on any of several input ports.
+
+        Ports are served in turn, so packets arriving at different rates on
+        different ports are merged fairly, without polling each port.
+
+        Parameters
+        ----------
+        ports : iterable of ``port.InputPort``
+            input ports of this component (e.g. an ``ArrayInputPort``).
+            Those that are disconnected are skipped.
+        timeout : float
+            number of seconds to wait for a packet before raising a
+            `exc.PortTimeout`. (optional)
+
+        Returns
+        -------
+        packet : ``Packet`` or ``EndOfStream``
+            Packet that was received, or ``EndOfStream`` once all of the
+            ports are closed.
+        port : ``port.InputPort``
+            the port the packet was received on (or None).
+        """
+        port_names = []
+        for port in ports:
+            if not isinstance(port, InputPort) or port.component is not self:
+                raise ValueError('{} is not an input port of {}'.format(port, self))
+
+            if port.is_connected():
+                if port._batch_values:
+                    # Values of a batch that was split are received first
+                    return self.create_packet(port._batch_values.popleft()), port
+
+                port_names.append(port.name)
+            else:
+                port._check_ready_state()
+
+        while port_names:
+            packet, port_name = self.executor.receive_any_port(self, port_names,
+                                                               timeout=timeout)
+            if packet is EndOfStream:
+                break
+
+            tracer = self.executor.tracer
+            if tracer is not None:
+                tracer.on_receive(self, packet)
+
+            port = self.inputs[port_name]
+            if isinstance(packet, EndOfWorkUnit) and port.forward_work_units:
+                # See port.InputPort.receive_packet()
+                self.broadcast_packet(packet, self.outputs)
+                continue
+
+            if isinstance(packet, RecordBatch) and not port.receive_batches:
+                packet = port._split_batch(packet)
+                if packet is None:
+                    continue
+
+            return packet, port
+
+        return EndOfStream, None
+
     def is_terminated(self):
         """
         Returns whether the component has been terminated.
@@ -266,8 +494,7 @@ class Component(object):
         is_terminated : bool
             whether the component has been terminated.
         """
-        return self.state in (ComponentState.TERMINATED,
-                              ComponentState.ERROR)
+        return self._state in _TERMINATED_STATES
 
     def is_alive(self):
         """
@@ -290,8 +517,7 @@ class Component(object):
         is_suspended : bool
             whether the component is suspended.
         """
-        return self.state in (ComponentState.SUSP_RECV,
-                              ComponentState.SUSP_SEND)
+        return self._state in _SUSPENDED_STATES
 
     @assert_not_component_state(ComponentState.TERMINATED,
                                 ComponentState.ERROR)
@@ -353,6 +579,104 @@ class InitialPacketGenerator(Component):
         self.outputs['OUT'].send(self.value)
 
 
+def _convert_iip_value(port, value):
+    """
+    IIPs are strings in the FBP DSL, so those of ports that only accept
+    numbers (e.g. ``'3' -> LIMIT``) are converted to the port's type. IIPs of
+    other ports are left as they are.
+    """
+    if (not isinstance(value, basestring) or not port.allowed_types or
+            isinstance(value, tuple(port.allowed_types))):
+        return value
+
+    for type_ in (int, float):
+        if type_ in port.allowed_types:
+            try:
+                return type_(value)
+            except ValueError:
+                pass
+
+    return value
+
+
+class ReplicaDispatcher(Component):
+    """
+    Sends units of work from IN to the replicas of a component in turn (see
+    `Graph.replicate()`), ending each with an `EndOfWorkUnit` marker.
+
+    A unit of work is a single packet, or a whole bracketed substream/map, so
+    that brackets are never split between replicas.
+    """
+    def __init__(self, name, count):
+        self.count = count  # Number of replicas
+        super(ReplicaDispatcher, self).__init__(name)
+
+    def initialize(self):
+        self.inputs.add('IN')
+        for i in range(self.count):
+            self.outputs.add('OUT_{:d}'.format(i))
+
+    def run(self):
+        sequence = 0
+        depth = 0
+        while True:
+            packet = self.inputs['IN'].receive_packet()
+            if packet is EndOfStream:
+                break
+
+            out_port = self.outputs['OUT_{:d}'.format(sequence % self.count)]
+            out_port.send_packet(packet)
+
+            if isinstance(packet, (StartSubStream, StartMap)):
+                depth += 1
+            elif isinstance(packet, (EndSubStream, EndMap)):
+                depth -= 1
+
+            if depth == 0:
+                marker = EndOfWorkUnit(sequence)
+                marker.owner = self
+                self.owned_packet_count += 1
+                out_port.send_packet(marker)
+                sequence += 1
+
+
+class ReplicaMerge(Component):
+    """
+    Merges the outputs of the replicas of a component back into OUT, in the
+    order their units of work were dispatched (see `Graph.replicate()`).
+    """
+    def __init__(self, name, count):
+        self.count = count  # Number of replicas
+        super(ReplicaMerge, self).__init__(name)
+
+    def initialize(self):
+        for i in range(self.count):
+            port = self.inputs.add('IN_{:d}'.format(i))
+            port.forward_work_units = False
+        self.outputs.add('OUT')
+
+    def run(self):
+        sequence = 0
+        while True:
+            # Units were dispatched to replicas in turn
+            in_port = self.inputs['IN_{:d}'.format(sequence % self.count)]
+            packet = in_port.receive_packet()
+            if packet is EndOfStream:
+                # The replica that would have the next unit has finished, so
+                # there are no units left
+                break
+
+            if isinstance(packet, EndOfWorkUnit):
+                if packet.sequence != sequence:
+                    raise exc.ComponentError(self, 'expected the end of work unit {:d} on {}, but got {}'.format(
+                                             sequence, in_port, packet.sequence))
+
+                self.drop_packet(packet)
+                sequence += 1
+            else:
+                self.outputs['OUT'].send_packet(packet)
+
+
 class Graph(Component):
     """
     Execution graph.
@@ -361,24 +685,23 @@ class Graph(Component):
     """
     __metaclass__ = ABCMeta
 
+    # Modules searched for components that are referenced by their bare class
+    # name in graph definitions.
+    COMPONENT_MODULES = ['pflow.components']
+
     def __init__(self, *args, **kwargs):
         self.components = set()  # Nodes
+        self._components_by_name = {}  # Index of self.components by name
+        self._subgraphs = set()  # Graphs in self.components
+        self._topology = None  # Cached _GraphTopology (see _get_topology())
+        self._state_counts = None  # [terminated, suspended] leaf components
         super(Graph, self).__init__(*args, **kwargs)
 
-    @classmethod
-    def get_upstream(cls, component):
+    @staticmethod
+    def _find_upstream(component):
         """
-        Immediate upstream components.
-
-        Parameters
-        ----------
-        component : ``Component``
-            the Component to check.
-
-        Returns
-        -------
-        components : the upstream components
-            set of ``Component``
+        Walks a component's input ports to find its immediate upstream
+        components (uncached).
         """
         parents = set()
 
@@ -415,8 +738,123 @@ class Graph(Component):
 
         return parents
 
-    @classmethod
-    def is_upstream_terminated(cls, component):
+    def _get_root_graph(self):
+        graph = self
+        while graph._parent_graph is not None:
+            graph = graph._parent_graph
+
+        return graph
+
+    def _iter_graph_tree(self):
+        """
+        Yields this graph and all of its nested subgraphs.
+        """
+        visited = set()
+        pending = [self]
+        while pending:
+            graph = pending.pop()
+            if graph in visited:
+                continue  # cycle
+
+            visited.add(graph)
+            pending.extend(graph._subgraphs)
+            yield graph
+
+    def _invalidate_topology(self):
+        """
+        Drops the cached topology of every graph in this graph's tree.
+
+        Parent graphs flatten their subgraphs, and subgraph adjacency depends
+        on how the parent wires the exported ports, so the whole tree is
+        invalidated rather than just this graph.
+        """
+        for graph in self._get_root_graph()._iter_graph_tree():
+            graph._topology = None
+            graph._state_counts = None
+
+    def _invalidate_state_counts(self):
+        """
+        Drops the live state counters of every graph in this graph's tree.
+
+        Must be called after component states have been changed without
+        going through the `Component.state` setter.
+        """
+        for graph in self._get_root_graph()._iter_graph_tree():
+            graph._state_counts = None
+
+    def _get_topology(self):
+        if self._topology is None:
+            self._topology = _GraphTopology(self)
+
+        return self._topology
+
+    def _get_state_counts(self):
+        if self._state_counts is None:
+            components = self._get_topology().components
+            self._state_counts = [
+                sum(1 for c in components if c.is_terminated()),
+                sum(1 for c in components if c.is_suspended())
+            ]
+
+        return self._state_counts
+
+    def _child_state_changed(self, component, old_state, new_state):
+        """
+        Keeps the live state counters in sync. Called by `Component.state`
+        for components of this graph, and forwarded up through parent graphs.
+        """
+        if isinstance(component, Graph):
+            return  # Only leaf components are counted
+
+        counts = self._state_counts
+        if counts is not None:
+            counts[0] += ((new_state in _TERMINATED_STATES) -
+                          (old_state in _TERMINATED_STATES))
+            counts[1] += ((new_state in _SUSPENDED_STATES) -
+                          (old_state in _SUSPENDED_STATES))
+
+        if self._parent_graph is not None:
+            self._parent_graph._child_state_changed(component, old_state,
+                                                    new_state)
+
+    def get_upstream(self, component):
+        """
+        Immediate upstream components.
+
+        Parameters
+        ----------
+        component : ``Component``
+            the Component to check.
+
+        Returns
+        -------
+        components : the upstream components
+            frozenset of ``Component``
+        """
+        upstream = self._get_topology().upstream.get(component)
+        if upstream is None:
+            # Not part of this graph
+            upstream = frozenset(self._find_upstream(component))
+
+        return upstream
+
+    def get_downstream(self, component):
+        """
+        Immediate downstream components.
+
+        Parameters
+        ----------
+        component : ``Component``
+            the Component to check.
+
+        Returns
+        -------
+        components : the downstream components
+            frozenset of ``Component``
+        """
+        return self._get_topology().downstream.get(component, frozenset())
+
+    def is_upstream_terminated(self, component):
         """
         Are all of a component's upstream components terminated?
 
@@ -430,7 +868,7 @@ class Graph(Component):
         is_terminated : bool
             whether or not the upstream components have been terminated.
         """
-        return all(c.is_terminated() for c in cls.get_upstream(component))
+        return all(c.is_terminated() for c in self.get_upstream(component))
 
     @assert_component_state(ComponentState.NOT_INITIALIZED)
     def add_component(self, component):
@@ -455,8 +893,7 @@ class Graph(Component):
             return component
 
         # Unique name?
-        used_names = utils.pluck(self.components, 'name')
-        if component.name in used_names:
+        if component.name in self._components_by_name:
             raise ValueError('component name "{}" has already been used in '
                              'this graph'.format(component.name))
 
@@ -466,50 +903,75 @@ class Graph(Component):
             component.state = ComponentState.INITIALIZED
 
         self.components.add(component)
+        self._components_by_name[component.name] = component
+        component._parent_graph = self
+        if isinstance(component, Graph):
+            self._subgraphs.add(component)
+
+        self._invalidate_topology()
         return component
 
     def get_component(self, name):
-        for component in self.components:
-            if component.name == name:
-                return component
+        """
+        Get a component by name.
+
+        Parameters
+        ----------
+        name : str
+            name of the component. Components of subgraphs can be referenced
+            by a dotted path of names (e.g. ``'SUBGRAPH.COMPONENT'``).
+
+        Returns
+        -------
+        component : ``Component``
+            the component.
+        """
+        component = self._components_by_name.get(name)
+        if component is not None:
+            return component
+
+        graph = self
+        for part in name.split('.'):
+            if not isinstance(graph, Graph):
+                break
+
+            graph = graph._components_by_name.get(part)
+            if graph is None:
+                break
+        else:
+            return graph
 
         raise ValueError('Component name "{}" does not exist in this graph'.format(name))
 
     def get_all_components(self, include_graphs=False):
-        visited = set()
-        results = set()
-
-        def bfs_walk(graph):
-            if len(graph.components) == 0:
-                return  # finished
+        """
+        All components of this graph, including those of nested subgraphs.
 
-            adjacent = set()
-            for node in graph.components:
-                if node in visited:
-                    continue  # cycle
+        The result is cached until the graph is next modified, and must not
+        be mutated.
 
-                visited.add(node)
-                if isinstance(node, Graph):
-                    adjacent.add(node)
-                    if include_graphs:
-                        results.add((node, graph))
-                else:
-                    if include_graphs:
-                        results.add((node, graph))
-                    else:
-                        results.add(node)
+        Parameters
+        ----------
+        include_graphs : bool
+            if True, subgraphs are included and (component, parent graph)
+            tuples are returned instead of components.
 
-            for node in adjacent:
-                bfs_walk(node)
+        Returns
+        -------
+        components : frozenset
+            set of ``Component``, or of (``Component``, ``Graph``) tuples.
+        """
+        topology = self._get_topology()
+        if include_graphs:
+            return topology.components_with_graphs
 
-        bfs_walk(self)
-        return results
+        return topology.components
 
     @assert_component_state(ComponentState.NOT_INITIALIZED)
     def remove_component(self, component):
         """
         Remove a component from the graph.
-        Also disconnects its ports.
+        Also disconnects its ports, and removes its IIPs.
 
         Parameters
         ----------
@@ -517,11 +979,7 @@ class Graph(Component):
             the Component to remove.
         """
         if isinstance(component, basestring):
-            component_name = component
-            for c in self.components:
-                if c.name == component_name:
-                    component = c
-                    break
+            component = self._components_by_name.get(component, component)
 
         if not isinstance(component, Component):
             raise ValueError('component must either be a Component object or '
@@ -531,9 +989,22 @@ class Graph(Component):
             self.disconnect(outport)
 
         for inport in component.inputs:
+            source_port = inport.source_port
             self.disconnect(inport)
 
+            # IIPs are owned by the port they feed
+            if (source_port is not None and
+                    isinstance(source_port.component, InitialPacketGenerator) and
+                    source_port.component in self.components):
+                self.remove_component(source_port.component)
+
+        self._invalidate_topology()
+
         self.components.remove(component)
+        del self._components_by_name[component.name]
+        self._subgraphs.discard(component)
+        if component._parent_graph is self:
+            component._parent_graph = None
 
     @assert_component_state(ComponentState.NOT_INITIALIZED)
     def set_initial_packet(self, port, value):
@@ -613,10 +1084,15 @@ class Graph(Component):
         target_input_port : ``port.InputPort``
             the input port on the target component.
         """
-        if not isinstance(source_output_port, (OutputPort, ArrayOutputPort)):
+        for port in (source_output_port, target_input_port):
+            if isinstance(port, (ArrayInputPort, ArrayOutputPort)):
+                raise ValueError('{} is an array port: connect one of its '
+                                 'elements (e.g. port[0]) instead'.format(port))
+
+        if not isinstance(source_output_port, OutputPort):
             raise ValueError('source_output_port must be an output port')
 
-        if not isinstance(target_input_port, (InputPort, ArrayInputPort)):
+        if not isinstance(target_input_port, InputPort):
             raise ValueError('target_input_port must be an input port')
 
         if target_input_port.source_port is not None:
@@ -634,6 +1110,8 @@ class Graph(Component):
         source_output_port.target_port = target_input_port
         target_input_port.source_port = source_output_port
 
+        self._invalidate_topology()
+
     @assert_component_state(ComponentState.NOT_INITIALIZED)
     def disconnect(self, port):
         """
@@ -646,35 +1124,115 @@ class Graph(Component):
         port : ``port.Port``
             the port to disconnect.
         """
-        if not port.is_connected():
+        if port.is_connected():
             if isinstance(port, OutputPort):
-                log.debug('%s disconnected from %s' % (port, port.target_port))
+                target_port = port.target_port
+                log.debug('%s disconnected from %s' % (port, target_port))
                 port.target_port = None
+                if (target_port is not None and
+                        target_port.source_port is port):
+                    target_port.source_port = None
             elif isinstance(port, InputPort):
-                log.debug('%s disconnected from %s' % (port, port.source_port))
+                source_port = port.source_port
+                log.debug('%s disconnected from %s' % (port, source_port))
                 port.source_port = None
+                if (isinstance(source_port, OutputPort) and
+                        source_port.target_port is port):
+                    source_port.target_port = None
+
+            self._invalidate_topology()
+
+    @assert_component_state(ComponentState.NOT_INITIALIZED)
+    def replicate(self, component, count, in_port='IN', out_port='OUT'):
+        """
+        Replicates a stateless component, so that several packets can be
+        processed at once (in separate greenlets or processes, depending on
+        the executor).
+
+        A `ReplicaDispatcher` is inserted in front of the replicas, which
+        sends them units of work in turn, and a `ReplicaMerge` after them,
+        which sends their outputs on in the original order. A bracketed
+        substream is always processed by a single replica. Replicas are
+        created with ``component.__class__(name)``, and get the same IIPs as
+        the component.
+
+        Parameters
+        ----------
+        component : ``Component``
+            the component to replicate. Besides IIPs, only `in_port` and
+            `out_port` may be connected.
+        count : int
+            total number of replicas (including the component itself).
+        in_port : str
+            name of the input port that work is received on.
+        out_port : str
+            name of the output port that results are sent on.
+
+        Returns
+        -------
+        replicas : list
+            the component, followed by its new replicas.
+        """
+        if count < 1:
+            raise ValueError('count must be at least 1')
+
+        if component not in self.components:
+            raise ValueError('{} is not a component of {}'.format(component, self))
+
+        data_in = component.inputs[in_port]
+        data_out = component.outputs[out_port]
+        source_port = data_in.source_port
+        target_port = data_out.target_port
+        if source_port is None or target_port is None:
+            raise ValueError('{} and {} must both be connected to replicate {}'.format(
+                             data_in, data_out, component))
+
+        iips = {}
+        for port in component.inputs:
+            if port is data_in or port.source_port is None:
+                continue
+
+            if not isinstance(port.source_port.component, InitialPacketGenerator):
+                raise ValueError('Unable to replicate {}, since {} is connected to a component '
+                                 'other than an IIP'.format(component, port))
+            iips[port.name] = port.source_port.component.value
+
+        for port in component.outputs:
+            if port is not data_out and port.is_connected():
+                raise ValueError('Unable to replicate {}, since its output {} is also '
+                                 'connected'.format(component, port))
+
+        replicas = [component]
+        if count == 1:
+            return replicas
+
+        self.disconnect(data_in)
+        self.disconnect(data_out)
+
+        dispatcher = ReplicaDispatcher('{}_DISPATCH'.format(component.name), count)
+        merge = ReplicaMerge('{}_MERGE'.format(component.name), count)
+        self.connect(source_port, dispatcher.inputs['IN'])
+        self.connect(merge.outputs['OUT'], target_port)
+
+        for i in range(1, count):
+            replica = component.__class__('{}_{:d}'.format(component.name, i))
+            replica.metadata = dict(component.metadata)
+            for port_name, value in iips.iteritems():
+                self.set_initial_packet(replica.inputs[port_name], value)
+            replicas.append(replica)
+
+        for i, replica in enumerate(replicas):
+            self.connect(dispatcher.outputs['OUT_{:d}'.format(i)], replica.inputs[in_port])
+            self.connect(replica.outputs[out_port], merge.inputs['IN_{:d}'.format(i)])
+
+        return replicas
 
     @property
     def get_self_starters(self):
         """
         Returns a set of all self-starter components.
         """
-        # Has only disconnected optional inputs
-        def is_self_starter_input(input_port):
-            return (input_port.optional and
-                    input_port.source_port is None)
-
-        self_starters = set()
-        for node in self.get_all_components(include_graphs=False):
-            # Self-starter nodes should have either no inputs or only
-            # have disconnected optional inputs.
-            if len(node.inputs) == 0:
-                # No inputs
-                self_starters.add(node)
-            elif all(map(is_self_starter_input, node.inputs)):
-                self_starters.add(node)
-
-        return self_starters
+        return self._get_topology().self_starters
 
     def run(self):
         raise RuntimeError('Instead of calling Graph.run(), please use a '
@@ -689,12 +1247,20 @@ class Graph(Component):
         is_terminated : bool
             whether the graph has terminated.
         """
-        return all([component.is_terminated()
-                    for component in self.get_all_components(include_graphs=False)])
+        terminated, _ = self._get_state_counts()
+        return terminated == len(self._get_topology().components)
 
     def is_suspended(self):
-        return any([component.is_suspended()
-                    for component in self.get_all_components(include_graphs=False)])
+        """
+        Is any component of this graph suspended?
+
+        Returns
+        -------
+        is_suspended : bool
+            whether a component of the graph is suspended.
+        """
+        _, suspended = self._get_state_counts()
+        return suspended > 0
 
     def terminate(self, ex=None):
         # Terminate all components
@@ -707,27 +1273,202 @@ class Graph(Component):
 
     # TODO: move all serializers to their own module / abstract class
 
+    @classmethod
+    def get_component_class(cls, component_path):
+        """
+        Resolves a component class from a graph definition.
+
+        Parameters
+        ----------
+        component_path : str
+            either a fully qualified class path (``'package.module/Class'`` or
+            ``'package.module.Class'``) or a bare class name that is looked up
+            in `COMPONENT_MODULES`.
+
+        Returns
+        -------
+        component_class : type
+            the ``Component`` subclass.
+        """
+        if '/' in component_path or '.' in component_path:
+            component_class = utils.import_object(component_path)
+        else:
+            for module_name in cls.COMPONENT_MODULES:
+                try:
+                    component_class = utils.import_object(
+                        '{}/{}'.format(module_name, component_path))
+                    break
+                except ImportError:
+                    pass
+            else:
+                raise ValueError('Component {} was not found in any of: '
+                                 '{}'.format(component_path,
+                                             ', '.join(cls.COMPONENT_MODULES)))
+
+        if not (isinstance(component_class, type) and
+                issubclass(component_class, Component)):
+            raise ValueError('{} is not a Component class'.format(component_path))
+
+        return component_class
+
     @assert_component_state(ComponentState.NOT_INITIALIZED)
-    def load_fbp_string(self, fbp_script):
+    def load_fbp_string(self, fbp_script, use_cache=True):
+        """
+        Builds this graph from an FBP DSL script.
+
+        Parameters
+        ----------
+        fbp_script : str
+            the FBP DSL source.
+        use_cache : bool
+            whether previously parsed results for the same script content may
+            be reused (see ``parsefbp.cache``).
+        """
         if not isinstance(fbp_script, basestring):
             raise ValueError('fbp_script must be a string')
 
-        # TODO: parse fbp string and build graph
-        # raise NotImplementedError
-        pass
+        graph_definition = parsefbp.parse(fbp_script, use_cache=use_cache)
+        self.load_json_dict(graph_definition)
 
     @assert_component_state(ComponentState.NOT_INITIALIZED)
-    def load_fbp_file(self, file_path):
+    def load_fbp_file(self, file_path, use_cache=True):
         if not isinstance(file_path, basestring):
             raise ValueError('file_path must be a string')
 
         with open(file_path, 'r') as f:
-            self.load_fbp_string(f.read())
+            self.load_fbp_string(f.read(), use_cache=use_cache)
 
     @assert_component_state(ComponentState.NOT_INITIALIZED)
     def load_json_dict(self, json_dict):
-        # TODO: parse json dict and build graph
-        raise NotImplementedError
+        """
+        Builds this graph from a definition in the FBP JSON graph format
+        (``processes``, ``connections``, ``inports`` and ``outports``).
+
+        Components and edges are created in bulk: the whole definition is
+        validated up front, and then ports are wired directly rather than
+        through per-edge `connect()` calls. If validation fails, the graph is
+        left untouched.
+
+        Parameters
+        ----------
+        json_dict : dict
+            the graph definition.
+        """
+        if not isinstance(json_dict, dict):
+            raise ValueError('json_dict must be a dict')
+
+        start_time = time.time()
+
+        processes = json_dict.get('processes') or {}
+        connections = json_dict.get('connections') or []
+
+        # Create components
+        component_classes = {}
+        new_components = {}
+        for name, process in processes.items():
+            if name in new_components:
+                raise ValueError('component name "{}" has already been used '
+                                 'in this graph'.format(name))
+
+            component_path = process['component']
+            component_class = component_classes.get(component_path)
+            if component_class is None:
+                component_class = component_classes[component_path] = \
+                    self.get_component_class(component_path)
+
+            component = component_class(name)
+            component.metadata.update(process.get('metadata') or {})
+            new_components[name] = component
+
+        for name in new_components:
+            if name in self._components_by_name:
+                raise ValueError('component name "{}" has already been used '
+                                 'in this graph'.format(name))
+
+        def get_port(endpoint, is_input):
+            component = new_components.get(endpoint['process'])
+            if component is None:
+                component = self.get_component(endpoint['process'])
+
+            ports = component.inputs if is_input else component.outputs
+            port = ports[endpoint['port']]
+
+            index = endpoint.get('index')
+            if index is not None:
+                port = port[index]
+
+            return port
+
+        # Resolve and validate edges
+        edges = []
+        iips = []
+        source_ports = set()
+        target_ports = set()
+        for connection in connections:
+            target_port = get_port(connection['tgt'], True)
+            if target_port.source_port is not None or target_port in target_ports:
+                raise exc.PortError(target_port,
+                                    'target_input_port is already connected '
+                                    'to another source')
+            target_ports.add(target_port)
+
+            if 'data' in connection:
+                iips.append((target_port, _convert_iip_value(target_port,
+                                                             connection['data'])))
+            else:
+                source_port = get_port(connection['src'], False)
+                if not isinstance(source_port, OutputPort):
+                    raise ValueError('source {} must be an output '
+                                     'port'.format(source_port))
+                if source_port.target_port is not None or source_port in source_ports:
+                    raise exc.PortError(source_port,
+                                        'source_output_port is already '
+                                        'connected to another target')
+                source_ports.add(source_port)
+                edges.append((source_port, target_port))
+
+        exports = [
+            (self.inputs, name, get_port(endpoint, True))
+            for name, endpoint in (json_dict.get('inports') or {}).items()
+        ] + [
+            (self.outputs, name, get_port(endpoint, False))
+            for name, endpoint in (json_dict.get('outports') or {}).items()
+        ]
+        for _, name, port in exports:
+            if port.is_connected() or port in source_ports or port in target_ports:
+                raise ValueError('Unable to export {} as {} because it is '
+                                 'already connected'.format(port, name))
+
+        # Build graph
+        self.components.update(new_components.values())
+        self._components_by_name.update(new_components)
+        for component in new_components.values():
+            component._parent_graph = self
+            if isinstance(component, Graph):
+                self._subgraphs.add(component)
+
+        for source_port, target_port in edges:
+            source_port.target_port = target_port
+            target_port.source_port = source_port
+
+        for target_port, value in iips:
+            iip = InitialPacketGenerator(value)
+            self.components.add(iip)
+            self._components_by_name[iip.name] = iip
+            iip._parent_graph = self
+            source_port = iip.outputs['OUT']
+            source_port.target_port = target_port
+            target_port.source_port = source_port
+
+        for registry, name, port in exports:
+            registry.export(name, port)
+
+        self._invalidate_topology()
+
+        self.log.info('Loaded {:d} components and {:d} connections in '
+                      '{:.3f} seconds'.format(len(new_components),
+                                              len(connections),
+                                              time.time() - start_time))
 
     @assert_component_state(ComponentState.NOT_INITIALIZED)
     def load_json_file(self, file_path):
@@ -738,7 +1479,7 @@ class Graph(Component):
             json_dict = json.loads(f.read())
             self.load_json_dict(json_dict)
 
-    def write_graphml(self, file_path):
+    def write_graphml(self, file_path, node_attributes=None, edge_attributes=None):
         """
         Writes this Graph as a *.graphml file.
 
@@ -746,6 +1487,10 @@ class Graph(Component):
         to visualize purely with code.
 
         :param file_path: the file to write to (should have a .graphml extension)
+        :param node_attributes: extra attributes of the nodes, as dicts keyed
+            by component name (e.g. from ``executors.profiling.BottleneckReport``).
+        :param edge_attributes: extra attributes of the edges, as dicts keyed
+            by (source component name, target component name).
         """
         import networkx as nx
 
@@ -768,7 +1513,8 @@ class Graph(Component):
                     'description': (component.__class__.__doc__ or '')
                 }
 
-                graph.node[component.name].update(node_attribs)
+                node_attribs.update((node_attributes or {}).get(component.name, {}))
+                graph.add_node(component.name, **node_attribs)
 
         def build_edges(components, visited_nodes=None):
             if visited_nodes is None:
@@ -791,9 +1537,11 @@ class Graph(Component):
                                 'description': (output.description or '')
                             }
 
-                            graph.add_edge(component.name,
-                                           output.target_port.component.name,
-                                           edge_attribs)
+                            target_name = output.target_port.component.name
+                            edge_attribs.update((edge_attributes or {}).get(
+                                (component.name, target_name), {}))
+                            graph.add_edge(component.name, target_name,
+                                           **edge_attribs)
 
                     visited_nodes.add(component)
 
@@ -805,3 +1553,53 @@ class Graph(Component):
 
         self.log.debug('Writing %s to "%s"...' % (self, file_path))
         nx.write_graphml(graph, file_path)
+
+
+class _GraphTopology(object):
+    """
+    Flattened view of a graph and its subgraphs, cached by `Graph` until the
+    graph is next modified.
+    """
+    __slots__ = ('components', 'components_with_graphs', 'upstream',
+                 'downstream', 'self_starters')
+
+    def __init__(self, graph):
+        components = set()
+        components_with_graphs = set()
+
+        visited = set()
+        pending = [graph]
+        while pending:
+            parent = pending.pop()
+            for node in parent.components:
+                if node in visited:
+                    continue  # cycle
+
+                visited.add(node)
+                components_with_graphs.add((node, parent))
+                if isinstance(node, Graph):
+                    pending.append(node)
+                else:
+                    components.add(node)
+
+        upstream = {}
+        downstream = dict((c, set()) for c in components)
+        for component in components:
+            parents = upstream[component] = frozenset(
+                Graph._find_upstream(component))
+            for parent in parents:
+                downstream.setdefault(parent, set()).add(component)
+
+        # Self-starter nodes should have either no inputs or only have
+        # disconnected optional inputs.
+        self_starters = frozenset(
+            c for c in components
+            if all(port.optional and port.source_port is None
+                   for port in c.inputs))
+
+        self.components = frozenset(components)
+        self.components_with_graphs = frozenset(components_with_graphs)
+        self.upstream = upstream
+        self.downstream = dict((c, frozenset(children))
+                               for c, children in downstream.items())
+        self.self_starters = self_starters
@@ -9,6 +9,22 @@ class GraphExecutorError(FlowError):
     pass
 
 
+class CheckpointError(GraphExecutorError):
+    """
+    A graph checkpoint couldn't be read or doesn't match the graph.
+    """
+    pass
+
+
+class DeadlockError(GraphExecutorError):
+    """
+    Components of a running graph are deadlocked, waiting on each other.
+    """
+    def __init__(self, deadlock):
+        super(DeadlockError, self).__init__(deadlock.format())
+        self.deadlock = deadlock
+
+
 class ComponentError(Exception):
     """
     Component-level error.
@@ -54,3 +70,16 @@ class PortTimeout(PortError):
     """
     def __init__(self, port):
         super(PortTimeout, self).__init__(port, 'Port communication timed out')
+
+
+class FbpSyntaxError(FlowError):
+    """
+    Syntax error in an FBP DSL graph definition.
+    """
+    def __init__(self, message, line=None, column=None):
+        if line is not None:
+            message = 'line {:d}, column {:d}: {}'.format(line, column, message)
+
+        super(FbpSyntaxError, self).__init__(message)
+        self.line = line
+        self.column = column
@@ -13,6 +13,42 @@ class GraphExecutor(object):
     """
     __metaclass__ = ABCMeta
 
+    # Approximate number of seconds the graph's components spent running
+    # during the current (or last) execution, if the executor tracks it.
+    cpu_time = None
+
+    # EdgeInspector that packets sent on watched edges are reported to (see
+    # inspection.py), if any. Executors that support it check this on send.
+    edge_inspector = None
+
+    # EdgeRecorder that packets sent on recorded edges are written to (see
+    # recording.py), if any. Executors that support it check this on send, and
+    # close it once the graph finishes.
+    edge_recorder = None
+
+    # Tracer that packets are traced through the graph by (see
+    # ``pflow.tracing``), if any. Components and ports report the packets they
+    # send and receive to it.
+    tracer = None
+
+    # FlightRecorder that components record their state transitions to (see
+    # flight_recorder.py), if any.
+    flight_recorder = None
+
+    # ExecutionProfile of the current (or last) execution (see profiling.py),
+    # if the executor records one.
+    profile = None
+
+    # MemoryBudget that packets put on and taken off edges are accounted to
+    # (see budget.py), if any. Executors that support it apply backpressure to
+    # the components it throttles.
+    memory_budget = None
+
+    # Directory that edge queues spill packets to (see spill.py). A temporary
+    # directory, removed after execution, is used if this isn't set.
+    SPILL_DIR = None
+    _spill_dir = None  # Spill directory in use
+
     def __init__(self, graph):
         from ..core import Graph
         import logging
@@ -28,6 +64,76 @@ class GraphExecutor(object):
         # for component in graph.get_all_components():
         #     component.executor = self
 
+    def _get_spill_dir(self):
+        """
+        Gets the directory that edge queues spill to, creating it if needed.
+        """
+        if self._spill_dir is None:
+            import os
+            import tempfile
+
+            if self.SPILL_DIR is None:
+                self._spill_dir = tempfile.mkdtemp(prefix='pflow-spill-')
+            else:
+                self._spill_dir = self.SPILL_DIR
+                if not os.path.isdir(self._spill_dir):
+                    os.makedirs(self._spill_dir)
+
+        return self._spill_dir
+
+    def _remove_spill_dir(self):
+        """
+        Removes a temporary spill directory created by `_get_spill_dir()`.
+        """
+        if self._spill_dir is not None:
+            if self.SPILL_DIR is None:
+                import shutil
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+            self._spill_dir = None
+
+    def get_queue_size(self, port):
+        """
+        Gets the number of packets waiting on the edge leading to an input
+        port.
+
+        Returns
+        -------
+        size : int
+            or None if the executor doesn't know (e.g. the edge's queue is in
+            another process).
+        """
+        return None
+
+    def get_metrics(self):
+        """
+        Formats this executor's metrics (see metrics.py).
+
+        Returns
+        -------
+        text : str
+            metrics in the Prometheus text exposition format.
+        """
+        from .metrics import format_metrics
+
+        return format_metrics({self.graph.name: self})
+
+    def get_bottleneck_report(self):
+        """
+        Analyses the profile of the last execution, to find the component
+        that limited the graph's throughput.
+
+        Returns
+        -------
+        report : ``profiling.BottleneckReport``
+        """
+        if self.profile is None:
+            raise ValueError('{} has no profile of an execution'.format(self))
+
+        from .profiling import BottleneckReport
+
+        return BottleneckReport(self.graph, self.profile)
+
     def _create_component_runner(self, component):
         """
         Creates a run loop for a component thread.
@@ -68,6 +174,12 @@ class GraphExecutor(object):
                               'drop_packet()'.format(component,
                                                      component.owned_packet_count))
 
+        if self.memory_budget is not None:
+            for entry in self.memory_budget.get_report(self.graph):
+                self.log.debug('{} had a high-water mark of {:d} bytes in flight'.format(
+                               entry['component'], entry['high_water_mark']))
+            self.memory_budget.release(self.graph)
+
     def _reset_components(self):
         def reset_ports(ports):
             for port in ports:
@@ -94,6 +206,9 @@ class GraphExecutor(object):
 
             # TODO: component.stack
 
+        # States were reset without going through Component.state
+        self.graph._invalidate_state_counts()
+
     @abstractmethod
     def is_running(self):
         pass
@@ -137,6 +252,31 @@ class GraphExecutor(object):
         """
         pass
 
+    def broadcast_port(self, component, port_names, packet, timeout=None):
+        """
+        Sends the same packet on several of a component's output ports (see
+        `core.Component.broadcast_packet()`). Executors can override this to
+        avoid paying the full cost of a send for each port.
+
+        A broadcast that times out is partial: the packet has already been
+        sent on the ports before the one that timed out (which the
+        `exc.PortTimeout` names), and isn't sent on the ones after it.
+
+        Parameters
+        ----------
+        component : ``core.Component``
+            the component the packet is being sent from.
+        port_names : list of str
+            the names of the component's output ports.
+        packet : ``port.Packet``
+            the packet to send.
+        timeout : float
+            number of seconds to wait to send the packet on each port before
+            raising a `exc.PortTimeout`. (optional)
+        """
+        for port_name in port_names:
+            self.send_port(component, port_name, packet, timeout=timeout)
+
     @abstractmethod
     def receive_port(self, component, port_name, timeout=None):
         """
@@ -159,6 +299,33 @@ class GraphExecutor(object):
         """
         pass
 
+    @abstractmethod
+    def receive_any_port(self, component, port_names, timeout=None):
+        """
+        Receives the first packet to arrive on any of a component's input
+        ports. Ports are checked in turn, starting after the one that was last
+        received from, so that a busy port can't starve the others.
+
+        Parameters
+        ----------
+        component : ``core.Component``
+            the component the packet is being received from.
+        port_names : list of str
+            the names of the component's input ports.
+        timeout : float
+            number of seconds to wait to receive a packet before raising a
+            `exc.PortTimeout`. (optional)
+
+        Returns
+        -------
+        packet : ``port.Packet`` or ``EndOfStream``
+            the received packet, or ``EndOfStream`` once all of the ports are
+            closed.
+        port_name : str
+            the name of the port the packet was received on (or None).
+        """
+        pass
+
     @abstractmethod
     def close_input_port(self, component, port_name):
         """
@@ -0,0 +1,204 @@
+"""
+Memory budgets for in-flight packets.
+
+Executors report the estimated size of each packet put on and taken off an
+edge to a `MemoryBudget`. Once the packets in flight reach the budget's
+limit, the components with the most bytes in flight are made to wait before
+sending more, until their consumers catch up. A single budget can be shared
+by the executors of several graphs to put a ceiling on all of them.
+"""
+import collections
+
+
+class MemoryBudget(object):
+    """
+    Accounts for the estimated bytes of packets waiting on graph edges, per
+    edge and per sending component, and tells executors which components to
+    apply backpressure to.
+    """
+    # Number of high-water marks of the components of released graphs to keep
+    # reporting (see `release()`)
+    MAX_RELEASED_COMPONENTS = 1024
+
+    def __init__(self, limit):
+        """
+        Parameters
+        ----------
+        limit : int
+            estimated bytes of packets in flight at which the heaviest
+            producers are throttled.
+        """
+        if limit <= 0:
+            raise ValueError('limit must be positive')
+
+        self.limit = limit
+        self.total = 0            # Estimated bytes in flight
+        self.high_water_mark = 0  # Max of total
+
+        self._edge_bytes = collections.defaultdict(int)  # Bytes in flight, by target input port
+        self._edge_senders = {}  # Sending component, by target input port
+        self._component_bytes = collections.defaultdict(int)  # Bytes in flight, by sending component
+        self._high_water_marks = collections.defaultdict(int)  # Max bytes in flight, by sending component
+        self._graphs = {}  # Root graph, by sending component
+        # Max bytes in flight of the components of released graphs, by
+        # (graph name, component name)
+        self._released = collections.OrderedDict()
+
+    def add(self, graph, component, edge, size):
+        """
+        Accounts for a packet put on an edge.
+
+        Parameters
+        ----------
+        graph : ``core.Graph``
+            the graph being executed.
+        component : ``core.Component``
+            the sending component.
+        edge : ``port.InputPort``
+            the input port the packet was sent to.
+        size : int
+            estimated size of the packet.
+        """
+        self._edge_bytes[edge] += size
+        self._edge_senders[edge] = component
+        if component not in self._graphs:
+            self._graphs[component] = graph
+            if self._released:
+                # Carry the high-water mark over from previous executions
+                self._high_water_marks[component] = self._released.pop(
+                    (graph.name, component.name), 0)
+
+        component_bytes = self._component_bytes[component] + size
+        self._component_bytes[component] = component_bytes
+        if component_bytes > self._high_water_marks[component]:
+            self._high_water_marks[component] = component_bytes
+
+        self.total += size
+        if self.total > self.high_water_mark:
+            self.high_water_mark = self.total
+
+    def remove(self, edge, size):
+        """
+        Accounts for a packet taken off an edge.
+        """
+        component = self._edge_senders.get(edge)
+        if component is None:
+            return  # Not put through this budget (e.g. restored from a checkpoint)
+
+        # Sizes are re-estimated, so clamp in case a packet's value changed
+        size = min(size, self._edge_bytes[edge])
+        self._edge_bytes[edge] -= size
+        self._component_bytes[component] -= size
+        self.total -= size
+
+    def release(self, graph):
+        """
+        Releases the bytes still accounted to a graph's edges once it has
+        finished executing, and stops tracking its components. Their
+        high-water marks are kept (by name) for the most recently released
+        `MAX_RELEASED_COMPONENTS` components.
+        """
+        components = set(component for component, component_graph in self._graphs.items()
+                         if component_graph is graph)
+        for edge, component in list(self._edge_senders.items()):
+            if component in components:
+                del self._edge_senders[edge]
+                self.total -= self._edge_bytes.pop(edge, 0)
+
+        for component in sorted(components, key=lambda c: c.name):
+            del self._graphs[component]
+            self._component_bytes.pop(component, None)
+            key = (graph.name, component.name)
+            self._released.pop(key, None)
+            self._released[key] = self._high_water_marks.pop(component, 0)
+
+        while len(self._released) > self.MAX_RELEASED_COMPONENTS:
+            self._released.popitem(last=False)
+
+    def get_edges(self, component):
+        """
+        Gets the edges a component has packets in flight on.
+
+        Returns
+        -------
+        edges : list of ``port.InputPort``
+            target ports of the edges.
+        """
+        return [edge for edge, sender in self._edge_senders.items()
+                if sender is component and self._edge_bytes[edge] > 0]
+
+    def get_graphs(self):
+        """
+        Gets the graphs whose components have sent packets through this
+        budget, and haven't been released.
+
+        Returns
+        -------
+        graphs : set of ``core.Graph``
+        """
+        return set(self._graphs.values())
+
+    def is_exceeded(self):
+        return self.total >= self.limit
+
+    def should_throttle(self, component):
+        """
+        Should a component wait before sending another packet? That's the
+        case while the budget is exceeded and the component has the most bytes
+        in flight.
+        """
+        if self.total < self.limit:
+            return False
+
+        component_bytes = self._component_bytes.get(component, 0)
+        return component_bytes > 0 and component_bytes >= max(self._component_bytes.values())
+
+    def get_report(self, graph=None):
+        """
+        Reports in-flight bytes per sending component.
+
+        Parameters
+        ----------
+        graph : ``core.Graph``
+            only report components of this graph. (optional)
+
+        Returns
+        -------
+        report : list
+            dicts with the ``graph`` and ``component`` names, ``bytes`` in
+            flight, ``high_water_mark`` and the bytes in flight on each of
+            the component's outgoing ``edges`` (keyed by target port ID),
+            heaviest components first. Components of released graphs have
+            no bytes in flight or edges.
+        """
+        edges = collections.defaultdict(dict)
+        for edge, component in self._edge_senders.items():
+            edges[component][edge.id] = self._edge_bytes[edge]
+
+        report = []
+        for component, component_graph in self._graphs.items():
+            if graph is not None and component_graph is not graph:
+                continue
+
+            report.append({
+                'graph': component_graph.name,
+                'component': component.name,
+                'bytes': self._component_bytes[component],
+                'high_water_mark': self._high_water_marks[component],
+                'edges': edges[component]
+            })
+
+        for (graph_name, component_name), high_water_mark in self._released.items():
+            if graph is not None and graph_name != graph.name:
+                continue
+
+            report.append({
+                'graph': graph_name,
+                'component': component_name,
+                'bytes': 0,
+                'high_water_mark': high_water_mark,
+                'edges': {}
+            })
+
+        report.sort(key=lambda entry: entry['high_water_mark'], reverse=True)
+        return report
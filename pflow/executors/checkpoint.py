@@ -0,0 +1,115 @@
+"""
+Checkpoints of running graphs.
+
+A checkpoint captures what's needed to resume a graph where it left off: the
+packets waiting in each edge queue, the resumable state declared by each
+component (see `core.Component.get_checkpoint_state()`), and which components
+had already terminated. Sources keep their read positions in their state (e.g.
+the byte offset of `components.FileTailReader`), so a resumed graph carries on
+from the last checkpoint instead of reprocessing its input from scratch.
+
+Executors decide when the graph is at a consistent point to take one; this
+module only deals with the checkpoint contents and file format.
+"""
+import os
+import time
+import collections
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from ..packet import BinaryPacketSerializer
+from .. import utils
+from .. import exc
+
+
+class Checkpoint(object):
+    """
+    A consistent snapshot of a graph's execution.
+    """
+    VERSION = 1  # Bumped whenever the file format changes
+
+    _packet_serializer = BinaryPacketSerializer()
+
+    def __init__(self, graph_name):
+        self.graph_name = graph_name
+        self.timestamp = time.time()
+        self.queues = collections.defaultdict(list)  # (owner path, serialized packet) tuples, keyed by queue key
+        self.states = {}          # Resumable component states, keyed by component path
+        self.terminated = set()   # Paths of components that had terminated
+
+    def add_packet(self, queue_key, packet, owner_path):
+        """
+        Adds an in-flight packet to the end of an edge queue.
+
+        Parameters
+        ----------
+        queue_key : str
+            key of the queue the packet is waiting in.
+        packet : ``packet.Packet``
+            the packet.
+        owner_path : str
+            path of the component that owns the packet, if any.
+        """
+        self.queues[queue_key].append(
+            (owner_path, self._packet_serializer.serialize(packet)))
+
+    def iter_packets(self, queue_key):
+        """
+        Iterates over the packets that were waiting in an edge queue, in order.
+
+        Returns
+        -------
+        packets : iterator
+            (``packet.Packet``, owner path) tuples.
+        """
+        for owner_path, serialized_packet in self.queues.get(queue_key, ()):
+            yield self._packet_serializer.deserialize(serialized_packet), owner_path
+
+    def save(self, file_path):
+        """
+        Atomically writes the checkpoint to a file, replacing any previous
+        checkpoint.
+        """
+        data = {
+            'version': self.VERSION,
+            'graph_name': self.graph_name,
+            'timestamp': self.timestamp,
+            'queues': dict(self.queues),
+            'states': self.states,
+            'terminated': self.terminated
+        }
+        utils.write_file_atomic(file_path,
+                                pickle.dumps(data, pickle.HIGHEST_PROTOCOL),
+                                binary=True)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Reads a checkpoint from a file.
+
+        Returns
+        -------
+        checkpoint : ``Checkpoint``
+            the checkpoint, or None if the file doesn't exist.
+        """
+        if not os.path.exists(file_path):
+            return None
+
+        try:
+            with open(file_path, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as ex:
+            raise exc.CheckpointError('Unable to read checkpoint {}: {}'.format(file_path, ex))
+
+        if not isinstance(data, dict) or data.get('version') != cls.VERSION:
+            raise exc.CheckpointError('Checkpoint {} has an unsupported format'.format(file_path))
+
+        checkpoint = cls(data['graph_name'])
+        checkpoint.timestamp = data['timestamp']
+        checkpoint.queues.update(data['queues'])
+        checkpoint.states = data['states']
+        checkpoint.terminated = data['terminated']
+        return checkpoint
@@ -0,0 +1,287 @@
+"""
+Detection of deadlocks between the components of a running graph.
+
+With bounded edge queues (see ``port.InputPort.max_queue_size``), a cycle in
+a graph, or a diamond whose branches are consumed in a different order than
+they are produced, can leave each component waiting on the next one: a
+producer blocked sending on a full queue whose consumer is waiting to receive
+on an empty queue from that same producer, for instance. Nothing fails, the
+graph just stops.
+
+Executors that support it keep track of which ports each waiting component is
+waiting on, and which components a memory budget is throttling. A
+`WaitForGraph` built from those waits and the state of the edges' queues finds
+the components that can never make progress again: those waiting only on
+other components that can't make progress either. A `Deadlock` then reports
+the cycle of edges they're stuck on.
+"""
+from ..port import OutputPort
+
+SEND = 'send'          # Waiting to send on a full queue
+RECEIVE = 'receive'    # Waiting to receive on empty queues
+THROTTLE = 'throttle'  # Waiting for a memory budget to free up
+
+
+def _get_consumer_port(port):
+    """
+    Follows exported input ports to the port that actually receives packets
+    sent to `port`.
+    """
+    while port is not None and port.proxied_port is not None:
+        port = port.proxied_port
+
+    return port
+
+
+def _get_producer_port(port):
+    """
+    Follows exported ports to the output port that actually sends the packets
+    `port` receives.
+    """
+    source_port = port.source_port
+    while source_port is not None and not isinstance(source_port, OutputPort):
+        source_port = source_port.source_port
+
+    # Output ports exported by a subgraph proxy one of its components' ports
+    while source_port is not None and getattr(source_port, 'proxied_outport', None) is not None:
+        source_port = source_port.proxied_outport
+
+    return source_port
+
+
+class Deadlock(object):
+    """
+    A set of components of a running graph that can never make progress
+    again.
+
+    Attributes
+    ----------
+    components : set of ``core.Component``
+        the deadlocked components.
+    cycle : list of dict
+        the cycle of waits the components are stuck on, in order: each
+        component waits on the next one (and the last one on the first). Each
+        wait is a dict with keys ``component``, ``kind`` (`SEND`, `RECEIVE`
+        or `THROTTLE`), ``source_port`` and ``target_port`` (the edge it's
+        waiting on), ``queue`` (the edge's queue), ``queue_size`` and
+        ``max_queue_size``.
+    """
+    def __init__(self, components, cycle):
+        self.components = components
+        self.cycle = cycle
+
+    def get_full_queues(self):
+        """
+        Gets the full queues of the cycle, i.e. those that would let a
+        blocked producer continue if they were expanded.
+
+        Returns
+        -------
+        queues : list
+        """
+        return [wait['queue'] for wait in self.cycle if wait['kind'] == SEND]
+
+    def format(self):
+        """
+        Formats the deadlock as a human readable report.
+
+        Returns
+        -------
+        text : str
+        """
+        lines = ['{:d} components are deadlocked, waiting on each other in a cycle:'.format(
+                 len(self.components))]
+        for wait in self.cycle:
+            if wait['kind'] == THROTTLE:
+                if wait['target_port'] is None:
+                    lines.append('  {} is throttled by a memory budget'.format(wait['component']))
+                else:
+                    lines.append('  {} is throttled by a memory budget, with packets in flight '
+                                 'on {} -> {}'.format(wait['component'], wait['source_port'].id,
+                                                      wait['target_port'].id))
+                continue
+
+            if wait['target_port'] is None:
+                # Waiting on the rest of its upstream components
+                lines.append('  {} is waiting for its upstream components to terminate'.format(
+                             wait['component']))
+                continue
+
+            edge = '{} -> {}'.format(wait['source_port'].id, wait['target_port'].id)
+            if wait['kind'] == SEND:
+                lines.append('  {} is blocked sending on {} (queue full, {}/{} packets)'.format(
+                             wait['component'], edge, wait['queue_size'],
+                             wait['max_queue_size']))
+            else:
+                lines.append('  {} is waiting to receive on {} (queue empty)'.format(
+                             wait['component'], edge))
+
+        others = self.components.difference(wait['component'] for wait in self.cycle)
+        if others:
+            lines.append('Also waiting on the cycle: {}'.format(
+                         ', '.join(sorted(str(c) for c in others))))
+
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.format()
+
+
+class WaitForGraph(object):
+    """
+    Which components of a running graph are waiting on which others.
+
+    A component waiting to send on a full queue waits on the queue's consumer.
+    A component waiting to receive on empty queues waits on their producers
+    (or, once those have terminated, on the rest of its upstream components,
+    since its ports are only closed when they have all terminated). A
+    component throttled by a memory budget waits on every other component of
+    the graph: the consumers of its packets in flight free the budget up, but
+    so can any other consumer, or a producer sending more than it. A
+    component that isn't waiting (running, sleeping, or receiving with a
+    timeout) can always make progress.
+    """
+    def __init__(self, graph, waits, get_queue):
+        """
+        Parameters
+        ----------
+        graph : ``core.Graph``
+            the running graph.
+        waits : dict
+            (kind, ports) tuples of the components waiting on edges, keyed by
+            component: `SEND` and the target (input) port of the edge,
+            `RECEIVE` and the component's input ports, or `THROTTLE` and the
+            target ports of the edges the component has packets in flight on.
+        get_queue : callable
+            returns the queue of the edge leading to an input port.
+        """
+        self.graph = graph
+        self.kinds = {}  # SEND or RECEIVE, by stuck component
+        self.edges = {}  # (source port, target port, queue) edges waited on, by stuck component
+        self.waits_for = {}  # Components each stuck component waits on, by component
+
+        for component, (kind, ports) in waits.items():
+            if not component.is_alive():
+                continue
+
+            if kind == THROTTLE:
+                others = set(c for c in graph.get_all_components()
+                             if c is not component and c.is_alive())
+                if not others:
+                    continue
+
+                edges = []
+                for port in ports:
+                    consumer_port = _get_consumer_port(port)
+                    if consumer_port is not None and consumer_port.component.is_alive():
+                        edges.append((_get_producer_port(consumer_port), consumer_port,
+                                      get_queue(consumer_port)))
+
+                self.kinds[component] = THROTTLE
+                self.edges[component] = edges
+                self.waits_for[component] = others
+            elif kind == SEND:
+                port = ports[0]
+                q = get_queue(port)
+                consumer_port = _get_consumer_port(port)
+                if not q.full() or consumer_port is None or not consumer_port.component.is_alive():
+                    continue
+
+                self.kinds[component] = SEND
+                self.edges[component] = [(_get_producer_port(consumer_port), consumer_port, q)]
+                self.waits_for[component] = set([consumer_port.component])
+            else:
+                open_ports = [port for port in ports if port.is_open()]
+                queues = [get_queue(port) for port in open_ports]
+                if not open_ports or any(not q.empty() for q in queues):
+                    continue
+
+                edges = []
+                producers = set()
+                for port, q in zip(open_ports, queues):
+                    producer_port = _get_producer_port(port)
+                    if producer_port is not None and producer_port.component.is_alive():
+                        edges.append((producer_port, port, q))
+                        producers.add(producer_port.component)
+
+                if not producers:
+                    producers = set(c for c in graph.get_upstream(component) if c.is_alive())
+                    if not producers:
+                        continue
+
+                self.kinds[component] = RECEIVE
+                self.edges[component] = edges
+                self.waits_for[component] = producers
+
+    def find_deadlock(self):
+        """
+        Finds the components that can never make progress again.
+
+        Returns
+        -------
+        deadlock : `Deadlock`
+            or None if every waiting component may still make progress.
+        """
+        # Components waiting on a component that may make progress may do
+        # so too, once it does
+        stuck = set(self.waits_for)
+        changed = True
+        while changed:
+            changed = False
+            for component in list(stuck):
+                if not self.waits_for[component].issubset(stuck):
+                    stuck.remove(component)
+                    changed = True
+
+        if not stuck:
+            return None
+
+        # Every stuck component only waits on stuck components, so following
+        # the waits from any of them ends in a cycle. Throttled components
+        # are followed to the consumers of their packets in flight if those
+        # are stuck, since they're the ones holding the budget up.
+        component = min(stuck, key=lambda c: c.name)
+        path = []
+        visited = {}
+        while component not in visited:
+            visited[component] = len(path)
+            path.append(component)
+            next_components = self.waits_for[component] & stuck
+            if self.kinds[component] == THROTTLE:
+                consumers = set(target_port.component
+                                for _, target_port, _ in self.edges[component])
+                next_components = (consumers & stuck) or next_components
+            component = min(next_components, key=lambda c: c.name)
+
+        cycle = []
+        members = path[visited[component]:]
+        for i, component in enumerate(members):
+            next_component = members[(i + 1) % len(members)]
+            kind = self.kinds[component]
+            source_port, target_port, q = self._get_edge(component, next_component, kind)
+            cycle.append({
+                'component': component,
+                'kind': kind,
+                'source_port': source_port,
+                'target_port': target_port,
+                'queue': q,
+                'queue_size': q.qsize() if q is not None else 0,
+                'max_queue_size': q.maxsize if q is not None else None
+            })
+
+        return Deadlock(stuck, cycle)
+
+    def _get_edge(self, component, next_component, kind):
+        """
+        Gets the (source port, target port, queue) edge a component waits on
+        the next component of a cycle over.
+        """
+        for source_port, target_port, q in self.edges[component]:
+            other = target_port.component if kind != RECEIVE else source_port.component
+            if other is next_component:
+                return source_port, target_port, q
+
+        # Waiting on the rest of its upstream components, since the
+        # producers of its ports have terminated (or, if throttled, on
+        # components other than the consumers of its packets)
+        return None, None, None
@@ -0,0 +1,224 @@
+"""
+A flight recorder of the state transitions of a graph's components.
+
+Executors that support it keep a `FlightRecorder`: a fixed-size ring buffer
+in memory, holding the most recent state transitions of their components as
+packed binary entries (when, which component, its old and new state, and the
+port it was sending or receiving on), so that recording every transition is
+cheap enough to leave on in production. The executor dumps the buffer to a
+file when a component fails, or the graph deadlocks or stalls, and the dump
+can be read with::
+
+    python -m pflow.executors.flight_recorder /tmp/MY_GRAPH.error.1500000000.flight
+
+Dump files start with a header (`MAGIC`, the format version, the number of
+transitions recorded and the size of the ring), followed by the length of a
+JSON table of component, port and state names, the table, and the entries
+in the ring, oldest first.
+"""
+import argparse
+import datetime
+import json
+import struct
+import time
+
+from ..states import ComponentState
+
+MAGIC = b'PFLOWFLT'
+VERSION = 1
+
+_file_header = struct.Struct('>8sBQI')  # Magic, version, transitions recorded, ring size
+_table_header = struct.Struct('>I')     # Length of the JSON table
+_entry = struct.Struct('>dIBBI')        # Time, component ID, old state, new state, port ID
+
+NO_PORT = 0xFFFFFFFF  # Port ID of transitions that didn't involve a port
+
+_states = sorted(ComponentState, key=lambda state: state.value)
+_state_ids = dict((state, i) for i, state in enumerate(_states))
+_suspended_states = frozenset([ComponentState.SUSP_SEND, ComponentState.SUSP_RECV])
+
+
+class FlightRecorder(object):
+    """
+    Ring buffer of the most recent component state transitions.
+    """
+    def __init__(self, size=4096):
+        """
+        Parameters
+        ----------
+        size : int
+            number of transitions to keep.
+        """
+        if size < 1:
+            raise ValueError('size must be positive')
+
+        self.size = size
+        self.count = 0  # Transitions recorded, including those overwritten since
+        self._buffer = bytearray(size * _entry.size)
+        self._component_ids = {}  # IDs of components, keyed by component
+        self._component_names = []  # Names of components, by ID
+        self._port_ids = {}  # IDs of ports, keyed by (component ID, port name)
+        self._port_names = []  # Names of ports (e.g. 'COMPONENT.IN'), by ID
+
+    def record(self, component, old_state, new_state):
+        """
+        Called when a component changes state. Transitions to or from a
+        suspended state record the port the component was waiting on (see
+        ``core.Component._state_port``).
+        """
+        component_id = self._component_ids.get(component)
+        if component_id is None:
+            component_id = self._component_ids[component] = len(self._component_names)
+            self._component_names.append(component.name)
+
+        port_id = NO_PORT
+        port_name = component._state_port
+        if port_name is not None and (old_state in _suspended_states or
+                                      new_state in _suspended_states):
+            key = (component_id, port_name)
+            port_id = self._port_ids.get(key)
+            if port_id is None:
+                port_id = self._port_ids[key] = len(self._port_names)
+                self._port_names.append('{}.{}'.format(component.name, port_name))
+
+        _entry.pack_into(self._buffer, (self.count % self.size) * _entry.size,
+                         time.time(), component_id, _state_ids[old_state],
+                         _state_ids[new_state], port_id)
+        self.count += 1
+
+    def _get_table(self):
+        return {
+            'components': self._component_names,
+            'ports': self._port_names,
+            'states': [state.value for state in _states]
+        }
+
+    def _get_ring_bytes(self):
+        """
+        Gets the entries in the ring, oldest first.
+        """
+        if self.count <= self.size:
+            return bytes(self._buffer[:self.count * _entry.size])
+
+        offset = (self.count % self.size) * _entry.size
+        return bytes(self._buffer[offset:] + self._buffer[:offset])
+
+    def get_entries(self):
+        """
+        Gets the transitions in the ring, oldest first.
+
+        Returns
+        -------
+        entries : list
+            (time, component name, old state, new state, port name or None)
+            tuples, with states as ``ComponentState`` values.
+        """
+        return list(_iter_entries(self._get_table(), self._get_ring_bytes()))
+
+    def dump(self, path, **info):
+        """
+        Writes the transitions in the ring to a file.
+
+        Parameters
+        ----------
+        path : str
+            file to write.
+        info : dict
+            extra information about the dump (e.g. why it was written) to
+            include in its table. (optional)
+        """
+        table = self._get_table()
+        table.update(info)
+        table_data = json.dumps(table).encode('utf-8')
+
+        with open(path, 'wb') as f:
+            f.write(_file_header.pack(MAGIC, VERSION, self.count, self.size))
+            f.write(_table_header.pack(len(table_data)))
+            f.write(table_data)
+            f.write(self._get_ring_bytes())
+
+
+def _iter_entries(table, data):
+    components = table['components']
+    ports = table['ports']
+    states = table['states']
+    for offset in range(0, len(data) - _entry.size + 1, _entry.size):
+        timestamp, component_id, old_state, new_state, port_id = _entry.unpack_from(data, offset)
+        yield (timestamp, components[component_id], states[old_state], states[new_state],
+               ports[port_id] if port_id != NO_PORT else None)
+
+
+def read_dump(path):
+    """
+    Reads a flight recorder dump.
+
+    Parameters
+    ----------
+    path : str
+        path of the dump.
+
+    Returns
+    -------
+    table : dict
+        names of the components, ports and states, along with extra
+        information given when the dump was written, and ``count`` (the
+        number of transitions recorded) and ``size`` (the size of the ring).
+    entries : list
+        (time, component name, old state, new state, port name or None)
+        tuples, oldest first.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_file_header.size)
+        if len(header) < _file_header.size:
+            raise ValueError('{} is not a flight recorder dump'.format(path))
+
+        magic, version, count, size = _file_header.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('{} is not a flight recorder dump'.format(path))
+        if version != VERSION:
+            raise ValueError('{} is a version {} flight recorder dump, but only version {} '
+                             'is supported'.format(path, version, VERSION))
+
+        table_length, = _table_header.unpack(f.read(_table_header.size))
+        table = json.loads(f.read(table_length).decode('utf-8'))
+        table['count'] = count
+        table['size'] = size
+        return table, list(_iter_entries(table, f.read()))
+
+
+def _non_negative_int(value):
+    count = int(value)
+    if count < 0:
+        raise argparse.ArgumentTypeError('must not be negative: {}'.format(value))
+
+    return count
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Print the component state transitions in a flight recorder dump.')
+    parser.add_argument('path', help='dump file')
+    parser.add_argument('-c', '--component', action='append', default=[], metavar='NAME',
+                        help='only print the transitions of a component')
+    parser.add_argument('-n', '--last', type=_non_negative_int, metavar='COUNT',
+                        help='only print the last COUNT transitions')
+    args = parser.parse_args(args)
+
+    table, entries = read_dump(args.path)
+    if args.component:
+        entries = [entry for entry in entries if entry[1] in args.component]
+    if args.last is not None:
+        entries = entries[max(0, len(entries) - args.last):]
+
+    print('{:d} transitions recorded, the last {:d} kept{}'.format(
+          table['count'], min(table['count'], table['size']),
+          ''.join(', {} {}'.format(key, table[key]) for key in ('graph', 'reason')
+                  if key in table)))
+    for timestamp, component, old_state, new_state, port in entries:
+        print('{}  {:<24} {:>15} -> {:<15} {}'.format(
+              datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f'),
+              component, old_state, new_state, port or ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Live inspection of the packets flowing over graph edges.
+
+Clients subscribe to specific edges, and executors report the packets sent
+on them to an `EdgeInspector`. Packets are sampled and rate limited per edge,
+and only a short preview of each is kept, so watching a busy edge doesn't
+slow the graph down. Edges nobody is watching cost a single ``None`` check in
+the executor.
+"""
+import time
+import collections
+
+from ..packet import StartSubStream, EndSubStream, StartMap, EndMap
+
+# Control packets reported as the FBP network protocol's bracket events.
+_begin_group_types = (StartSubStream, StartMap)
+_end_group_types = (EndSubStream, EndMap)
+
+
+class WatchedEdge(object):
+    """
+    An edge (source output port -> target input port) being watched.
+    """
+    __slots__ = ('inspector', 'source_port', 'target_port', 'packet_count',
+                 '_tokens', '_last_refill')
+
+    def __init__(self, inspector, source_port, target_port):
+        self.inspector = inspector
+        self.source_port = source_port
+        self.target_port = target_port
+        self.packet_count = 0  # Packets sent since watching started
+        self._tokens = float(inspector.MAX_EVENTS_PER_SECOND)
+        self._last_refill = time.time()
+
+    @property
+    def id(self):
+        """
+        Edge ID in the FBP network protocol format (``'A() OUT -> IN B()'``).
+        """
+        return '{}() {} -> {} {}()'.format(self.source_port.component.name,
+                                           self.source_port.name,
+                                           self.target_port.name,
+                                           self.target_port.component.name)
+
+    def observe(self, packet):
+        """
+        Called by executors for each packet sent on the edge.
+        """
+        self.packet_count += 1
+
+        inspector = self.inspector
+        if self.packet_count % inspector.SAMPLE_EVERY:
+            return  # Not sampled
+
+        # Token bucket rate limiting
+        now = time.time()
+        self._tokens = min(inspector.MAX_EVENTS_PER_SECOND,
+                           self._tokens + (now - self._last_refill) *
+                           inspector.MAX_EVENTS_PER_SECOND)
+        self._last_refill = now
+        if self._tokens < 1:
+            inspector.dropped_count += 1
+            return
+
+        self._tokens -= 1
+        inspector._add_event(self, packet, now)
+
+
+class EdgeInspector(object):
+    """
+    Collects sampled packet previews from watched edges of a graph, to be
+    sent to clients in batches (see `drain()`).
+    """
+    SAMPLE_EVERY = 1             # Report every Nth packet on an edge
+    MAX_EVENTS_PER_SECOND = 20   # Max reported packets per edge per second
+    MAX_PENDING_EVENTS = 1000    # Events kept between drains (oldest are dropped)
+    PREVIEW_LENGTH = 256         # Max characters of a packet value preview
+
+    def __init__(self):
+        self.edges = {}  # WatchedEdges, keyed by source port
+        self.dropped_count = 0  # Packets that were sampled, but not reported
+        self._events = collections.deque(maxlen=self.MAX_PENDING_EVENTS)
+
+    def set_edges(self, edges):
+        """
+        Replaces the watched edges.
+
+        Parameters
+        ----------
+        edges : list
+            (``port.OutputPort``, ``port.InputPort``) tuples.
+        """
+        watched = {}
+        for source_port, target_port in edges:
+            edge = self.edges.get(source_port)
+            if edge is None or edge.target_port is not target_port:
+                edge = WatchedEdge(self, source_port, target_port)
+            watched[source_port] = edge
+
+        self.edges = watched
+
+    def _get_preview(self, packet):
+        value = packet.value
+        if isinstance(value, (bool, int, long, float)) or value is None:
+            return value
+
+        if not isinstance(value, basestring):
+            value = repr(value)
+
+        if len(value) > self.PREVIEW_LENGTH:
+            value = value[:self.PREVIEW_LENGTH] + '...'
+
+        return value
+
+    def _add_event(self, edge, packet, timestamp):
+        if isinstance(packet, _begin_group_types):
+            command = 'begingroup'
+        elif isinstance(packet, _end_group_types):
+            command = 'endgroup'
+        else:
+            command = 'data'
+
+        self._events.append((command, edge, self._get_preview(packet), timestamp))
+
+    def drain(self):
+        """
+        Removes and returns the pending events.
+
+        Returns
+        -------
+        events : list
+            (command, payload) tuples in the FBP network protocol format
+            (``data``, ``begingroup`` and ``endgroup`` commands). Graph IDs
+            are left for the caller to fill in.
+        """
+        events = []
+        while self._events:
+            command, edge, preview, timestamp = self._events.popleft()
+            payload = {
+                'id': edge.id,
+                'src': {'node': edge.source_port.component.name,
+                        'port': edge.source_port.name},
+                'tgt': {'node': edge.target_port.component.name,
+                        'port': edge.target_port.name},
+                'time': timestamp
+            }
+            if command == 'data':
+                payload['data'] = preview
+            else:
+                payload['group'] = preview
+
+            events.append((command, payload))
+
+        return events
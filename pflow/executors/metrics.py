@@ -0,0 +1,255 @@
+"""
+Metrics of running graphs, in the Prometheus text exposition format.
+
+Metrics are formatted from the counters executors already keep (the
+`ExecutionProfile` of the current execution, see profiling.py, and the
+edges' queues) when they're scraped, so collecting them adds nothing to the
+packet path. Graphs traced by a ``tracing.Tracer`` also have histograms of
+their packets' latencies. A `MetricsServer` serves them over HTTP, for the
+runtime (see ``runtime.Runtime.get_metrics()``) or a single executor (see
+``SingleProcessGraphExecutor.METRICS_PORT``).
+
+Components are labelled with their graph and name, and edges with their graph
+and source and target port IDs, e.g.::
+
+    pflow_edge_packets_total{graph="MY_GRAPH",source="TAIL_1.OUT",target="FILTER_1.IN"} 1024
+"""
+from collections import OrderedDict
+
+from ..core import ComponentState, InitialPacketGenerator
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\')
+                      .replace('"', '\\"')
+                      .replace('\n', '\\n'))
+
+
+class MetricsWriter(object):
+    """
+    Accumulates samples of metric families, and formats them.
+    """
+    def __init__(self):
+        self._families = OrderedDict()  # (type, help, samples), keyed by metric name
+
+    def add(self, name, metric_type, help_text, labels, value):
+        """
+        Adds a sample.
+
+        Parameters
+        ----------
+        name : str
+            metric name.
+        metric_type : str
+            ``counter`` or ``gauge``.
+        help_text : str
+            description of the metric.
+        labels : list
+            (name, value) label tuples.
+        value : float
+        """
+        self._get_samples(name, metric_type, help_text).append((name, labels, value))
+
+    def add_histogram(self, name, help_text, labels, histogram):
+        """
+        Adds the samples of a histogram.
+
+        Parameters
+        ----------
+        name : str
+            metric name.
+        help_text : str
+            description of the metric.
+        labels : list
+            (name, value) label tuples.
+        histogram : ``tracing.LatencyHistogram``
+        """
+        samples = self._get_samples(name, 'histogram', help_text)
+        for bound, count in histogram.get_cumulative_counts():
+            samples.append((name + '_bucket',
+                            labels + [('le', '+Inf' if bound == float('inf') else repr(bound))],
+                            count))
+        samples.append((name + '_sum', labels, histogram.sum))
+        samples.append((name + '_count', labels, histogram.count))
+
+    def _get_samples(self, name, metric_type, help_text):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (metric_type, help_text, [])
+
+        return family[2]
+
+    def format(self):
+        """
+        Formats the samples in the text exposition format.
+
+        Returns
+        -------
+        text : str
+        """
+        lines = []
+        for name, (metric_type, help_text, samples) in self._families.items():
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for sample_name, labels, value in samples:
+                lines.append('{}{{{}}} {!r}'.format(
+                    sample_name, ','.join('{}="{}"'.format(label, _escape(label_value))
+                                   for label, label_value in labels),
+                    float(value)))
+
+        return '\n'.join(lines) + '\n'
+
+
+def collect_metrics(writer, graph_id, executor):
+    """
+    Adds the metrics of a graph's executor to a `MetricsWriter`.
+
+    Parameters
+    ----------
+    writer : `MetricsWriter`
+    graph_id : str
+        the graph ID, used as the ``graph`` label.
+    executor : ``base.GraphExecutor``
+    """
+    graph_labels = [('graph', graph_id)]
+    writer.add('pflow_graph_running', 'gauge', 'Whether the graph is executing.',
+               graph_labels, executor.is_running())
+    if executor.cpu_time is not None:
+        writer.add('pflow_graph_cpu_seconds_total', 'counter',
+                   'Approximate seconds the graph\'s components spent running.',
+                   graph_labels, executor.cpu_time)
+
+    components = [c for c in executor.graph.get_all_components()
+                  if not isinstance(c, InitialPacketGenerator)]
+    profile = executor.profile
+    for component in components:
+        labels = graph_labels + [('component', component.name)]
+        for state in ComponentState:
+            writer.add('pflow_component_state', 'gauge',
+                       'Whether the component is in a state.',
+                       labels + [('state', state.value)], component.state == state)
+
+        if profile is None:
+            continue
+
+        writer.add('pflow_component_busy_seconds_total', 'counter',
+                   'Seconds the component ran for.',
+                   labels, profile.busy_times.get(component, 0.0))
+        writer.add('pflow_component_yielded_seconds_total', 'counter',
+                   'Seconds the component yielded to other components after sends.',
+                   labels, profile.yielded_times.get(component, 0.0))
+
+    for component in components:
+        for port in component.outputs:
+            if not port.is_connected():
+                continue
+
+            target_port = port.target_port
+            labels = graph_labels + [('source', port.id), ('target', target_port.id)]
+            queue_size = executor.get_queue_size(target_port)
+            if queue_size is not None:
+                writer.add('pflow_edge_queue_size', 'gauge',
+                           'Packets waiting on the edge.', labels, queue_size)
+
+            if profile is None:
+                continue
+
+            writer.add('pflow_edge_packets_total', 'counter',
+                       'Packets sent on the edge.',
+                       labels, profile.packet_counts.get(port, 0))
+            writer.add('pflow_edge_blocked_seconds_total', 'counter',
+                       'Seconds the producer was blocked sending on the edge.',
+                       labels, profile.blocked_times.get(port, 0.0))
+            writer.add('pflow_edge_starved_seconds_total', 'counter',
+                       'Seconds the consumer was waiting to receive on the edge.',
+                       labels, profile.starved_times.get(target_port, 0.0))
+
+    tracer = executor.tracer
+    if tracer is not None:
+        writer.add('pflow_traces_total', 'counter', 'Packet traces started at sources.',
+                   graph_labels, tracer.trace_count)
+        writer.add_histogram('pflow_trace_latency_seconds',
+                             'Seconds traced packets took from a source to a sink.',
+                             graph_labels, tracer.latency)
+        for (source, target), histogram in sorted(tracer.hop_latencies.items()):
+            writer.add_histogram('pflow_trace_hop_latency_seconds',
+                                 'Seconds traced packets took from one component to the next.',
+                                 graph_labels + [('source', source), ('target', target)],
+                                 histogram)
+
+
+def format_metrics(executors):
+    """
+    Formats the metrics of graphs' executors.
+
+    Parameters
+    ----------
+    executors : dict
+        ``base.GraphExecutor`` instances, keyed by graph ID.
+
+    Returns
+    -------
+    text : str
+        metrics in the Prometheus text exposition format.
+    """
+    writer = MetricsWriter()
+    for graph_id in sorted(executors):
+        collect_metrics(writer, graph_id, executors[graph_id])
+
+    return writer.format()
+
+
+class MetricsServer(object):
+    """
+    Serves metrics over HTTP at ``/metrics``, from a gevent server.
+    """
+    def __init__(self, get_metrics, host='localhost', port=9100):
+        """
+        Parameters
+        ----------
+        get_metrics : callable
+            returns the metrics text (e.g. from `format_metrics()`) on each
+            scrape.
+        host : str
+            address to listen on.
+        port : int
+            port to listen on (0 picks a free port).
+        """
+        self.get_metrics = get_metrics
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def application(self, environ, start_response):
+        """
+        WSGI application serving the metrics.
+        """
+        if environ.get('PATH_INFO', '/') not in ('/', '/metrics'):
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not found\n']
+
+        body = self.get_metrics().encode('utf-8')
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+    def start(self):
+        """
+        Starts serving in the background, and returns the port it serves on.
+        """
+        from gevent.pywsgi import WSGIServer
+
+        self._server = WSGIServer((self.host, self.port), self.application, log=None)
+        self._server.start()
+        return self._server.server_port
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+
+    def serve_forever(self):
+        self.start()
+        self._server.serve_forever()
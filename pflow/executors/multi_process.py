@@ -17,11 +17,91 @@ except ImportError:
     import Queue as queue  # 2.x
 
 from .base import GraphExecutor
+from .spill import SpillingChannel
 from ..core import ComponentState
-from ..packet import NoopSerializer
+from ..packet import BinaryPacketSerializer, EndOfStream
 from .. import exc
 
 
+class Arrivals(object):
+    """
+    Counts the packets put on a consumer's edges and not received yet, so
+    that a consumer waiting for a packet on any of several edges is woken up
+    as soon as one arrives.
+    """
+    def __init__(self):
+        self._semaphore = mp.Semaphore(0)
+        self._waited = 0  # Arrivals taken by wait() but not received yet (consumer process)
+
+    def notify(self):
+        """
+        Called by producers once they've put a packet.
+        """
+        self._semaphore.release()
+
+    def wait(self, timeout):
+        """
+        Waits up to `timeout` seconds for a packet to arrive.
+
+        Returns
+        -------
+        arrived : bool
+        """
+        if self._semaphore.acquire(True, timeout):
+            self._waited += 1
+            return True
+
+        return False
+
+    def consume(self):
+        """
+        Called by the consumer once it has received a packet, so that the
+        count only includes packets still waiting to be received.
+        """
+        if self._waited:
+            self._waited -= 1
+        else:
+            # A receive can beat the producer's notify(), leaving a count
+            # behind for the next wait() to take
+            self._semaphore.acquire(False)
+
+
+class NotifyingChannel(object):
+    """
+    Wraps the queue of an edge, counting the packets put on it in the
+    consumer's `Arrivals`.
+    """
+    def __init__(self, q, arrivals):
+        self.queue = q
+        self.arrivals = arrivals
+        self._closed = False
+
+    def put(self, serialized_packet, timeout=None):
+        self.queue.put(serialized_packet, timeout=timeout)
+        self.arrivals.notify()
+
+    def get(self, block=True, timeout=None):
+        serialized_packet = self.queue.get(block, timeout)
+        self.arrivals.consume()
+        return serialized_packet
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.queue.close()
+
+    def flush(self):
+        """
+        Closes the channel, and waits for the packets put on it to be
+        written to the underlying pipe (see ``multiprocessing.Queue.join_thread``).
+        """
+        self.close()
+        q = self.queue
+        if isinstance(q, SpillingChannel):
+            q = q.queue
+        q.join_thread()
+
+
 # TODO: update this, since it has fallen behind single_proces updates
 class MultiProcessGraphExecutor(GraphExecutor):
     """
@@ -31,11 +111,31 @@ class MultiProcessGraphExecutor(GraphExecutor):
     This runtime is useful for work that needs to take advantage of multicore
     execution and is best suited for components that may tend to be CPU bound.
     """
-    def __init__(self, graph):
+    # Longest wait between checks for packets in receive_any_port(). A put
+    # wakes the consumer before the packet has necessarily made it through
+    # the queue's pipe, so the consumer checks again after this long.
+    RECEIVE_ANY_POLL_TIME = 0.01
+
+    def __init__(self, graph, checkpoint_path=None):
+        """
+        Parameters
+        ----------
+        graph : ``core.Graph``
+            the graph to execute.
+        checkpoint_path : str
+            unsupported: checkpoints are only taken by single process
+            executors, so this raises a ValueError if it's set.
+        """
+        if checkpoint_path is not None:
+            raise ValueError('{} does not support checkpoints'.format(self.__class__.__name__))
+
         super(MultiProcessGraphExecutor, self).__init__(graph)
-        self._packet_serializer = NoopSerializer()
+        self._packet_serializer = BinaryPacketSerializer()
         self._in_queues = None
         self._out_queues = None
+        self._receive_any_offset = 0  # Index of the port to check first in receive_any_port()
+        self._arrivals = None  # `Arrivals` of each consumer, keyed by component name
+        self._terminated = None  # Events set once components terminate, keyed by component name
         self._running = False
 
     def _create_wrapped_runner(self, component):
@@ -66,30 +166,48 @@ class MultiProcessGraphExecutor(GraphExecutor):
                     c.terminate()
 
                 raise ex
+            finally:
+                self._signal_terminated(component)
 
         return wrapped_runner
 
     def execute(self):
+        self._check_supported()
         self._running = True
         self.log.debug('Executing %s' % self.graph)
 
         self._in_queues = {}
         self._out_queues = {}
 
-        # Create queues for all edges
+        # Create queues for all edges, counting arrivals per consumer
+        self._arrivals = dict((component.name, Arrivals())
+                              for component in self.graph.components)
+        self._terminated = dict((component.name, mp.Event())
+                                for component in self.graph.components)
         edges = set()
         # TODO: Get components of subgraphs
         for component in self.graph.components:
             for out_port in component.outputs:
                 if out_port.is_connected():
+                    target_port = out_port.target_port
+                    q = mp.Queue(maxsize=target_port.max_queue_size or 0)
+                    if target_port.spill_threshold is not None:
+                        q = SpillingChannel(q, self._get_spill_dir(),
+                                            '{}.{}'.format(target_port.component.name, target_port.name),
+                                            target_port.spill_threshold)
+                    q = NotifyingChannel(q, self._arrivals[target_port.component.name])
+
                     edges.add(((component.name, out_port.name),
-                               (out_port.target_port.component.name, out_port.target_port.name),
-                               mp.Queue(maxsize=out_port.target_port.max_queue_size)))
+                               (target_port.component.name, target_port.name),
+                               q))
 
         # Start all processes
         self.log.debug('Starting %d processes...' % len(self.graph.components))
         self._processes = []
         for component in self.graph.components:
+            component.executor = self
+            component.state = ComponentState.ACTIVE
+
             out_edges = filter(lambda edge: edge[0][0] == component.name, edges)
             in_edges  = filter(lambda edge: edge[1][0] == component.name, edges)
 
@@ -117,10 +235,28 @@ class MultiProcessGraphExecutor(GraphExecutor):
         self.graph.terminate()  # TODO: get last exception
         self._final_checks()
         self._reset_components()
+        self._remove_spill_dir()
 
         self._running = False
         self.log.debug('Finished graph execution')
 
+    def _check_supported(self):
+        """
+        Raises a ValueError if a feature only single process executors support
+        is set on this executor.
+        """
+        name = self.__class__.__name__
+        if self.tracer is not None:
+            raise ValueError('{} does not support tracing'.format(name))
+        if self.edge_inspector is not None:
+            raise ValueError('{} does not support edge inspection'.format(name))
+        if self.edge_recorder is not None:
+            raise ValueError('{} does not support edge recording'.format(name))
+        if self.memory_budget is not None:
+            raise ValueError('{} does not support memory budgets'.format(name))
+        if getattr(self, 'METRICS_PORT', None) is not None:
+            raise ValueError('{} does not support serving metrics'.format(name))
+
     def is_running(self):
         return self._running
 
@@ -136,55 +272,141 @@ class MultiProcessGraphExecutor(GraphExecutor):
         except queue.Full:
             # Send timed out
             component.state = ComponentState.ACTIVE
-            raise exc.PortTimeout
+            raise exc.PortTimeout(component.outputs[port_name])
 
-    def receive_port(self, component, port_name, timeout=None):
-        self.log.debug('Receiving packet on port %s.%s' % (component.name, port_name))
+    def broadcast_port(self, component, port_names, packet, timeout=None):
+        self.log.debug('Broadcasting packet to ports %s.%s' % (component.name, port_names))
+
+        # Serialize once for all of the ports
+        serialized_packet = self._packet_serializer.serialize(packet)
+        component.state = ComponentState.SUSP_SEND
+
+        for port_name in port_names:
+            q = self._get_outport_queue(component, port_name)
+            try:
+                q.put(serialized_packet, timeout=timeout)
+            except queue.Full:
+                # Send timed out. The packet stays on the ports before this
+                # one: queues can't be reserved ahead across processes.
+                component.state = ComponentState.ACTIVE
+                raise exc.PortTimeout(component.outputs[port_name])
 
-        q = self._get_inport_queue(component, port_name)
+        component.state = ComponentState.ACTIVE
+
+    def receive_any_port(self, component, port_names, timeout=None):
+        self.log.debug('Receiving packet on ports %s.%s' % (component.name, port_names))
+
+        port_names = [port_name for port_name in port_names
+                      if port_name in self._get_inport_queues(component)]
+        if not port_names:
+            return EndOfStream, None
+
+        queues = [self._get_inport_queue(component, port_name) for port_name in port_names]
+        arrivals = queues[0].arrivals
         component.state = ComponentState.SUSP_RECV
-        try:
-            serialized_packet = q.get()
-            component.state = ComponentState.ACTIVE
-        except queue.Full as err:
-            # Timed out
-            component.state = ComponentState.ACTIVE
-            raise exc.PortTimeout
 
-        self.log.debug('Packet received on %s.%s: %s' % (component.name, port_name, serialized_packet))
-        packet = self._packet_serializer.deserialize(serialized_packet)
+        start_time = time.time()
+        while True:
+            # Upstream components flush their queues before signalling that
+            # they've terminated, so once they have, empty queues stay empty
+            upstream_terminated = self._is_upstream_terminated(component)
+
+            for i in range(len(queues)):
+                index = (self._receive_any_offset + i) % len(queues)
+                try:
+                    serialized_packet = queues[index].get(block=False)
+                except queue.Empty:
+                    continue
+
+                self._receive_any_offset = index + 1
+                component.state = ComponentState.ACTIVE
+                return self._packet_serializer.deserialize(serialized_packet), port_names[index]
+
+            if upstream_terminated:
+                # No more data left to receive and upstream has terminated
+                self.log.debug('{} is closing {} because its upstream is terminated'.format(
+                               component, ', '.join(port_names)))
+                component.state = ComponentState.ACTIVE
+                for port_name in port_names:
+                    port = component.inputs[port_name]
+                    if port.is_open():
+                        port.close()
+
+                return EndOfStream, None
+
+            wait_time = self.RECEIVE_ANY_POLL_TIME
+            if timeout is not None:
+                remaining = start_time + timeout - time.time()
+                if remaining <= 0:
+                    component.state = ComponentState.ACTIVE
+                    raise exc.PortTimeout(component.inputs[port_names[0]])
+                wait_time = min(wait_time, remaining)
+
+            arrivals.wait(wait_time)
 
+    def receive_port(self, component, port_name, timeout=None):
+        packet, _ = self.receive_any_port(component, [port_name], timeout=timeout)
         return packet
 
-    def _get_inport_queue(self, component, port_name):
+    def _is_upstream_terminated(self, component):
+        """
+        Have all of a component's upstream components terminated? Their
+        states aren't shared between processes, so they signal it through
+        `_terminated` events instead.
+        """
+        return all(self._terminated[c.name].is_set()
+                   for c in self.graph.get_upstream(component))
+
+    def _signal_terminated(self, component):
+        """
+        Called in a component's process once it has finished running: flushes
+        its output queues, and signals its downstream components that it has
+        terminated.
+        """
+        for q in self._get_outport_queues(component).values():
+            q.flush()
+
+        self._terminated[component.name].set()
+        for downstream in self.graph.get_downstream(component):
+            self._arrivals[downstream.name].notify()
+
+    def _get_inport_queues(self, component):
         # TODO: handle proxied ports
         if hasattr(component, '_in_queues'):
             # Called from component process
-            return component._in_queues[port_name]
+            return component._in_queues
         else:
             # Called from master process
-            return self._in_queues[component.name][port_name]
+            return self._in_queues[component.name]
 
-    def _get_outport_queue(self, component, port_name):
+    def _get_inport_queue(self, component, port_name):
+        return self._get_inport_queues(component)[port_name]
+
+    def _get_outport_queues(self, component):
         # TODO: handle proxied ports
         if hasattr(component, '_out_queues'):
             # Called from component process
-            return component._out_queues[port_name]
+            return component._out_queues
         else:
             # Called from master process
-            return self._out_queues[component.name][port_name]
+            return self._out_queues[component.name]
+
+    def _get_outport_queue(self, component, port_name):
+        return self._get_outport_queues(component)[port_name]
 
     def close_input_port(self, component, port_name):
         self.log.debug('Closing input port %s.%s' % (component.name, port_name))
 
-        q = self._get_inport_queue(component, port_name)
-        q.close()
+        q = self._get_inport_queues(component).get(port_name)
+        if q is not None:  # Unconnected elements of array ports have no queue
+            q.close()
 
     def close_output_port(self, component, port_name):
         self.log.debug('Closing output port %s.%s' % (component.name, port_name))
 
-        q = self._get_outport_queue(component, port_name)
-        q.close()
+        q = self._get_outport_queues(component).get(port_name)
+        if q is not None:  # Unconnected elements of array ports have no queue
+            q.close()
 
     def terminate_thread(self, component):
         if component.is_alive():
@@ -0,0 +1,265 @@
+"""
+Bottleneck analysis of graph executions.
+
+Executors that support it record an `ExecutionProfile` of each execution:
+how long each component ran for, and how long it spent waiting, either
+starved (waiting to receive a packet on an input port), blocked (waiting to
+send a packet on an output port, because the edge's queue was full or the
+component was throttled), or yielding to other components after a send (for
+as long as the scheduling policy decided). A `BottleneckReport` then works
+out which component limited the graph's throughput, which side of each edge
+was waiting on the other, and how much replicating a component would help.
+"""
+import time
+import collections
+
+
+class ExecutionProfile(object):
+    """
+    Where the components of a graph spent their time during an execution.
+    """
+    def __init__(self):
+        self.start_time = time.time()
+        self.end_time = None
+        self.busy_times = collections.defaultdict(float)     # Seconds components ran for, by component
+        self.finish_times = {}                                # When components finished, by component
+        self.starved_times = collections.defaultdict(float)  # Seconds waiting to receive, by input port
+        self.blocked_times = collections.defaultdict(float)  # Seconds blocked sending, by output port
+        self.yielded_times = collections.defaultdict(float)  # Seconds yielding after sends, by component
+        self.packet_counts = collections.defaultdict(int)    # Packets sent, by output port
+
+    def finish(self):
+        """
+        Called by executors once the graph has finished.
+        """
+        self.end_time = time.time()
+
+    def get_elapsed_time(self, component=None):
+        """
+        Gets the number of seconds the graph (or one of its components) ran.
+        """
+        end_time = self.end_time if self.end_time is not None else time.time()
+        if component is not None:
+            end_time = self.finish_times.get(component, end_time)
+
+        return end_time - self.start_time
+
+
+class BottleneckReport(object):
+    """
+    Analysis of an `ExecutionProfile`.
+
+    A component's working time is the time it was neither starved, blocked
+    nor yielding after a send: running, or waiting on something other than
+    its edges (e.g. an external service). The component with the most working
+    time is the bottleneck, since the rest of the graph waited on it.
+
+    Attributes
+    ----------
+    elapsed_time : float
+        seconds the graph ran.
+    components : list of dict
+        per component, by descending working time: ``component``,
+        ``elapsed_time``, ``busy_time``, ``starved_time``, ``blocked_time``,
+        ``yielded_time``, ``working_time`` (all in seconds) and
+        ``utilization`` (working time as a fraction of the graph's elapsed
+        time).
+    edges : list of dict
+        per edge: ``source_port``, ``target_port``, ``packet_count``,
+        ``blocked_time`` (of the producer), ``starved_time`` (of the consumer)
+        and ``status``: `STARVED` if the consumer mostly waited on the
+        producer, `BLOCKED` if the producer mostly waited on the consumer, or
+        `BALANCED` if neither waited long.
+    bottleneck : ``core.Component``
+        the component that limited the graph's throughput (or None).
+    """
+    STARVED = 'consumer starved'
+    BLOCKED = 'producer blocked'
+    BALANCED = 'balanced'
+
+    # Edges where neither side waited for more than this fraction of the
+    # graph's elapsed time are balanced.
+    BALANCED_FRACTION = 0.05
+
+    def __init__(self, graph, profile, parallel=False):
+        """
+        Parameters
+        ----------
+        graph : ``core.Graph``
+            the graph that was executed.
+        profile : ``ExecutionProfile``
+            profile of its execution.
+        parallel : bool
+            whether components run in parallel (e.g. in separate processes),
+            rather than sharing a single CPU. This decides whether replicas
+            of a component can share its busy time.
+        """
+        from ..core import InitialPacketGenerator
+
+        self.graph = graph
+        self.profile = profile
+        self.parallel = parallel
+        self.elapsed_time = profile.get_elapsed_time()
+
+        components = [c for c in graph.get_all_components()
+                      if not isinstance(c, InitialPacketGenerator)]
+
+        self.components = []
+        for component in components:
+            elapsed_time = profile.get_elapsed_time(component)
+            starved_time = sum(profile.starved_times.get(port, 0.0)
+                               for port in component.inputs)
+            blocked_time = sum(profile.blocked_times.get(port, 0.0)
+                               for port in component.outputs)
+            yielded_time = profile.yielded_times.get(component, 0.0)
+            working_time = max(0.0, elapsed_time - starved_time - blocked_time - yielded_time)
+            self.components.append({
+                'component': component,
+                'elapsed_time': elapsed_time,
+                'busy_time': profile.busy_times.get(component, 0.0),
+                'starved_time': starved_time,
+                'blocked_time': blocked_time,
+                'yielded_time': yielded_time,
+                'working_time': working_time,
+                'utilization': working_time / self.elapsed_time if self.elapsed_time else 0.0
+            })
+
+        self.components.sort(key=lambda entry: entry['working_time'], reverse=True)
+        self.bottleneck = self.components[0]['component'] if self.components else None
+        self._entries = dict((entry['component'], entry) for entry in self.components)
+
+        self.edges = []
+        threshold = self.elapsed_time * self.BALANCED_FRACTION
+        for component in components:
+            for port in component.outputs:
+                if not port.is_connected():
+                    continue
+
+                target_port = port.target_port
+                blocked_time = profile.blocked_times.get(port, 0.0)
+                starved_time = profile.starved_times.get(target_port, 0.0)
+                if max(blocked_time, starved_time) <= threshold:
+                    status = self.BALANCED
+                elif blocked_time > starved_time:
+                    status = self.BLOCKED
+                else:
+                    status = self.STARVED
+
+                self.edges.append({
+                    'source_port': port,
+                    'target_port': target_port,
+                    'packet_count': profile.packet_counts.get(port, 0),
+                    'blocked_time': blocked_time,
+                    'starved_time': starved_time,
+                    'status': status
+                })
+
+    def estimate_speedup(self, component, replicas):
+        """
+        Estimates how much faster the graph would run if a component were
+        replicated (see ``core.Graph.replicate()``).
+
+        The replicas are assumed to split the component's working time
+        evenly, except for its busy time when they'd share a CPU. The graph
+        is then limited by whichever component has the most working time
+        left (or, on a shared CPU, by the total busy time of the graph).
+
+        Parameters
+        ----------
+        component : ``core.Component``
+            the component to replicate.
+        replicas : int
+            number of replicas.
+
+        Returns
+        -------
+        speedup : float
+            estimated ratio of the current to the new elapsed time.
+        """
+        if replicas < 1:
+            raise ValueError('replicas must be positive')
+
+        entry = self._entries.get(component)
+        if entry is None:
+            raise ValueError('{} is not a component of {}'.format(component, self.graph))
+
+        current_limit = self.components[0]['working_time']
+        if not current_limit:
+            return 1.0
+
+        if self.parallel:
+            working_time = entry['working_time'] / replicas
+        else:
+            busy_time = min(entry['busy_time'], entry['working_time'])
+            working_time = busy_time + (entry['working_time'] - busy_time) / replicas
+
+        limits = [working_time] + [e['working_time'] for e in self.components
+                                   if e['component'] is not component]
+        if not self.parallel:
+            limits.append(sum(e['busy_time'] for e in self.components))
+
+        return current_limit / max(max(limits), 1e-9)
+
+    def format_table(self):
+        """
+        Formats the report as text tables of the components and edges.
+
+        Returns
+        -------
+        text : str
+        """
+        lines = ['{:<32} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+                 'component', 'util', 'working s', 'busy s', 'starved s', 'blocked s',
+                 'yielded s')]
+        for entry in self.components:
+            component = entry['component']
+            lines.append('{:<32} {:>5.0f}% {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                '{}{} ({})'.format('*' if component is self.bottleneck else ' ',
+                                   component.name, component.__class__.__name__),
+                entry['utilization'] * 100, entry['working_time'], entry['busy_time'],
+                entry['starved_time'], entry['blocked_time'], entry['yielded_time']))
+
+        lines.append('')
+        lines.append('{:<40} {:>8} {:>10} {:>10}  {}'.format(
+                     'edge', 'packets', 'blocked s', 'starved s', 'status'))
+        for edge in self.edges:
+            lines.append('{:<40} {:>8d} {:>10.3f} {:>10.3f}  {}'.format(
+                '{} -> {}'.format(edge['source_port'].id, edge['target_port'].id),
+                edge['packet_count'], edge['blocked_time'], edge['starved_time'],
+                edge['status']))
+
+        if self.bottleneck is not None:
+            lines.append('')
+            lines.append('Bottleneck: {} ({:.0f}% utilized). Replicating it would give an estimated '
+                         '{:.1f}x speed-up with 2 replicas, {:.1f}x with 4.'.format(
+                             self.bottleneck.name,
+                             self.components[0]['utilization'] * 100,
+                             self.estimate_speedup(self.bottleneck, 2),
+                             self.estimate_speedup(self.bottleneck, 4)))
+
+        return '\n'.join(lines)
+
+    def write_graphml(self, file_path):
+        """
+        Writes the graph as a *.graphml file (see ``core.Graph.write_graphml()``),
+        annotated with the report: components have ``utilization``,
+        ``working_time`` and ``bottleneck`` attributes, and edges have
+        ``packet_count``, ``blocked_time``, ``starved_time`` and ``status``
+        attributes.
+        """
+        node_attributes = {}
+        for entry in self.components:
+            component = entry['component']
+            node_attributes[component.name] = {
+                'utilization': entry['utilization'],
+                'working_time': entry['working_time'],
+                'bottleneck': component is self.bottleneck
+            }
+
+        edge_attributes = {}
+        for edge in self.edges:
+            key = (edge['source_port'].component.name, edge['target_port'].component.name)
+            edge_attributes[key] = dict((name, edge[name]) for name in (
+                'packet_count', 'blocked_time', 'starved_time', 'status'))
+
+        self.graph.write_graphml(file_path, node_attributes, edge_attributes)
@@ -0,0 +1,147 @@
+"""
+Recordings of the packets flowing over graph edges.
+
+An `EdgeRecorder` set on an executor writes every packet sent on selected
+edges to a compact local file per edge, including substream and map
+brackets, along with when each packet was sent. The recorded streams can then
+be fed into a single component in isolation (see replay.py), to benchmark it
+against real traffic without running the rest of its graph.
+
+Recording files start with a header (`MAGIC`, the format version and the time
+recording started), followed by a record per packet: the seconds since
+recording started, the length of the serialized packet, and the packet
+serialized by ``packet.BinaryPacketSerializer`` (a single byte for brackets).
+"""
+import os
+import struct
+import time
+
+from ..packet import BinaryPacketSerializer
+
+MAGIC = b'PFLOWREC'
+VERSION = 1
+
+_file_header = struct.Struct('>8sBd')  # Magic, version, start time
+_record_header = struct.Struct('>dI')  # Seconds since start, packet length
+
+_packet_serializer = BinaryPacketSerializer()
+
+
+def get_recording_path(directory, port):
+    """
+    Gets the path of the recording of the edge leading to an input port.
+
+    Parameters
+    ----------
+    directory : str
+        directory the recordings are written to.
+    port : ``port.InputPort``
+        target port of the edge.
+    """
+    return os.path.join(directory, '{}.rec'.format(port.id))
+
+
+class RecordedEdge(object):
+    """
+    An edge (source output port -> target input port) being recorded.
+    """
+    __slots__ = ('path', 'packet_count', '_file', '_start_time')
+
+    def __init__(self, path):
+        self.path = path
+        self.packet_count = 0  # Packets recorded
+        self._file = None
+        self._start_time = None
+
+    def record(self, packet):
+        """
+        Called by executors for each packet sent on the edge.
+        """
+        now = time.time()
+        if self._file is None:
+            # Opened once the first packet is sent, by the process sending it
+            self._file = open(self.path, 'wb')
+            self._start_time = now
+            self._file.write(_file_header.pack(MAGIC, VERSION, now))
+
+        data = _packet_serializer.serialize(packet)
+        self._file.write(_record_header.pack(now - self._start_time, len(data)))
+        self._file.write(data)
+        self.packet_count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class EdgeRecorder(object):
+    """
+    Records the packets sent on selected edges of a graph, to a file per edge
+    (see `get_recording_path()`). Files are overwritten each time the graph
+    is executed.
+    """
+    def __init__(self, directory, ports):
+        """
+        Parameters
+        ----------
+        directory : str
+            directory to write the recordings to.
+        ports : list of ``port.InputPort``
+            target ports of the edges to record.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.edges = {}  # RecordedEdges, keyed by source port
+        for port in ports:
+            if port.source_port is None:
+                raise ValueError('{} is not connected to an output port'.format(port))
+
+            self.edges[port.source_port] = RecordedEdge(
+                get_recording_path(directory, port))
+
+    def close(self):
+        """
+        Flushes and closes the recordings. Called by executors once the graph
+        finishes.
+        """
+        for edge in self.edges.values():
+            edge.close()
+
+
+def read_recording(path):
+    """
+    Reads the packets of a recording, in the order they were sent.
+
+    Parameters
+    ----------
+    path : str
+        path of the recording.
+
+    Returns
+    -------
+    packets : iterator
+        (seconds since recording started, ``packet.Packet``) tuples. The
+        packets have no owner.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_file_header.size)
+        if len(header) < _file_header.size:
+            raise ValueError('{} is not a recording'.format(path))
+
+        magic, version, _ = _file_header.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('{} is not a recording'.format(path))
+        if version != VERSION:
+            raise ValueError('{} is a version {} recording, but only version {} '
+                             'is supported'.format(path, version, VERSION))
+
+        while True:
+            record_header = f.read(_record_header.size)
+            if not record_header:
+                break
+
+            offset, length = _record_header.unpack(record_header)
+            yield offset, _packet_serializer.deserialize(f.read(length))
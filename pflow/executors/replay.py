@@ -0,0 +1,238 @@
+"""
+Replays recorded edge traffic (see recording.py) into a single component.
+
+The component is run on its own, with each recorded input port fed by a
+source that sends the recorded packets as fast as possible, and each output
+port connected to a sink that drops what it receives. This benchmarks the
+component against real traffic without the rest of its graph or the external
+services it talks to, e.g.::
+
+    python -m pflow.executors.replay pflow.components/RegexFilter \\
+        IN=recordings/FILTER_1.IN.rec --param 'REGEX=" (USER|DEAD)_PROCESS: "'
+"""
+import argparse
+import json
+import logging
+import time
+
+from ..core import Graph, Component, EndOfStream
+from .. import utils
+from .recording import read_recording
+from .scheduling import SchedulingPolicy
+from .single_process import SingleProcessGraphExecutor, monkey_patch
+
+
+class RecordingSource(Component):
+    """
+    Sends the packets of a recording, which are read before the graph runs.
+    """
+    def initialize(self):
+        self.outputs.add('OUT')
+        self.packets = []
+
+    def run(self):
+        for packet in self.packets:
+            packet.owner = self
+            self.owned_packet_count += 1
+            self.outputs['OUT'].send_packet(packet)
+
+
+class ReplaySink(Component):
+    """
+    Counts and drops the packets it receives.
+    """
+    def initialize(self):
+        self.inputs.add('IN')
+        self.packet_count = 0
+
+    def run(self):
+        while True:
+            packet = self.inputs['IN'].receive_packet()
+            if packet is EndOfStream:
+                break
+
+            self.packet_count += 1
+            self.drop_packet(packet)
+
+
+class ReplayPolicy(SchedulingPolicy):
+    """
+    Components only ever wait `MIN_SUSPEND_TIME`, so that the replayed
+    component runs as fast as it can.
+    """
+    def get_send_suspend_time(self, component, q):
+        return self.MIN_SUSPEND_TIME
+
+    def get_receive_suspend_time(self, component, q):
+        return self.MIN_SUSPEND_TIME
+
+
+class ReplayExecutor(SingleProcessGraphExecutor):
+    """
+    Executes a replay, measuring how long the replayed component takes to
+    process each packet (from receiving it until it asks for the next one).
+    """
+    def __init__(self, graph, component):
+        super(ReplayExecutor, self).__init__(graph, scheduling_policy=ReplayPolicy())
+        self.component = component
+        self.latencies = []   # Seconds the component took to process each packet
+        self._receive_time = None  # When the component received its current packet
+
+    def _finish_packet(self):
+        if self._receive_time is not None:
+            self.latencies.append(time.time() - self._receive_time)
+            self._receive_time = None
+
+    def _start_packet(self, packet):
+        if packet is not EndOfStream:
+            self._receive_time = time.time()
+
+    def receive_port(self, component, port_name, timeout=None):
+        if component is not self.component:
+            return super(ReplayExecutor, self).receive_port(component, port_name,
+                                                            timeout=timeout)
+
+        self._finish_packet()
+        packet = super(ReplayExecutor, self).receive_port(component, port_name,
+                                                          timeout=timeout)
+        self._start_packet(packet)
+        return packet
+
+    def receive_any_port(self, component, port_names, timeout=None):
+        if component is not self.component:
+            return super(ReplayExecutor, self).receive_any_port(component, port_names,
+                                                                timeout=timeout)
+
+        self._finish_packet()
+        packet, port_name = super(ReplayExecutor, self).receive_any_port(
+            component, port_names, timeout=timeout)
+        self._start_packet(packet)
+        return packet, port_name
+
+
+def _get_percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100.0))
+    return sorted_values[index]
+
+
+def replay(component, recordings, initial_packets=None):
+    """
+    Replays recordings into a component, as fast as possible.
+
+    Parameters
+    ----------
+    component : ``core.Component``
+        the component, which mustn't be part of a graph.
+    recordings : dict
+        paths of the recordings to send to the component's input ports, keyed
+        by port name.
+    initial_packets : dict
+        initial packet values of other input ports, keyed by port name.
+        (optional)
+
+    Returns
+    -------
+    report : dict
+        with keys:
+
+        * ``packet_count``: number of packets replayed (including brackets).
+        * ``output_count``: number of packets the component sent.
+        * ``recorded_time``: seconds the recorded traffic took to send.
+        * ``elapsed_time``: seconds the replay took.
+        * ``busy_time``: seconds the component spent running.
+        * ``throughput``: packets processed per second the component ran.
+        * ``latency``: seconds the component took to process a packet, as a
+          dict with ``mean``, ``p50``, ``p95``, ``p99`` and ``max`` keys.
+    """
+    graph = Graph('REPLAY', initialize=False)
+    packet_count = 0
+    recorded_time = 0.0
+    for port_name, path in recordings.items():
+        source = RecordingSource('REPLAY_{}'.format(port_name))
+        for offset, packet in read_recording(path):
+            source.packets.append(packet)
+            recorded_time = max(recorded_time, offset)
+
+        packet_count += len(source.packets)
+        graph.connect(source.outputs['OUT'], component.inputs[port_name])
+
+    for port_name, value in (initial_packets or {}).items():
+        graph.set_initial_packet(component.inputs[port_name], value)
+
+    sinks = []
+    for port in component.outputs:
+        if not port.is_connected():
+            sink = ReplaySink('SINK_{}'.format(port.name))
+            graph.connect(port, sink.inputs['IN'])
+            sinks.append(sink)
+
+    executor = ReplayExecutor(graph, component)
+    start_time = time.time()
+    executor.execute()
+    elapsed_time = time.time() - start_time
+
+    latencies = sorted(executor.latencies)
+    busy_time = executor.profile.busy_times.get(component, 0.0)
+    return {
+        'packet_count': packet_count,
+        'output_count': sum(sink.packet_count for sink in sinks),
+        'recorded_time': recorded_time,
+        'elapsed_time': elapsed_time,
+        'busy_time': busy_time,
+        'throughput': packet_count / busy_time if busy_time else None,
+        'latency': {
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'p50': _get_percentile(latencies, 50),
+            'p95': _get_percentile(latencies, 95),
+            'p99': _get_percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None
+        }
+    }
+
+
+def _parse_assignment(assignment):
+    if '=' not in assignment:
+        raise argparse.ArgumentTypeError('{} is not of the form PORT=VALUE'.format(assignment))
+
+    return assignment.split('=', 1)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Replay recorded edge traffic into a single component, and '
+                    'report its throughput and latency.')
+    parser.add_argument('component',
+                        help='component class, e.g. pflow.components/Repeat')
+    parser.add_argument('recordings', nargs='+', type=_parse_assignment,
+                        metavar='PORT=RECORDING',
+                        help='recording to send to an input port')
+    parser.add_argument('--param', action='append', default=[], type=_parse_assignment,
+                        metavar='PORT=JSON',
+                        help='initial packet value (as JSON) of an input port')
+    args = parser.parse_args(args)
+
+    monkey_patch()
+    utils.init_logger(default_level=logging.WARN)
+
+    component_class = utils.import_object(args.component)
+    report = replay(component_class(component_class.__name__.upper()),
+                    dict(args.recordings),
+                    dict((port_name, json.loads(value)) for port_name, value in args.param))
+
+    print('packets:    {:d} replayed, {:d} sent'.format(report['packet_count'],
+                                                        report['output_count']))
+    print('time:       {:.3f}s replayed, {:.3f}s recorded, {:.3f}s busy'.format(
+          report['elapsed_time'], report['recorded_time'], report['busy_time']))
+    if report['throughput'] is not None:
+        print('throughput: {:.0f} packets/s'.format(report['throughput']))
+    if report['latency']['mean'] is not None:
+        print('latency:    ' + ', '.join(
+              '{} {:.3f}ms'.format(name, report['latency'][name] * 1000)
+              for name in ('mean', 'p50', 'p95', 'p99', 'max')))
+
+
+if __name__ == '__main__':
+    main()
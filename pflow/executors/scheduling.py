@@ -0,0 +1,138 @@
+"""
+Scheduling policies for the single process executor.
+
+gevent runs greenlets round-robin, so every component waits the same amount
+of time whenever it yields after sending a packet, or while it waits for one.
+Sources then get as many turns as sinks, and queues deep in the graph fill
+up. A `SchedulingPolicy` decides those wait times instead, so that work
+already in flight can be favoured over taking in new work.
+"""
+from abc import ABCMeta, abstractmethod
+import collections
+
+
+class SchedulingPolicy(object):
+    """
+    Decides how long a component waits before it is scheduled again when it
+    yields in `send_port()` or `receive_port()`.
+    """
+    __metaclass__ = ABCMeta
+
+    SUSPEND_TIME = 0.1        # Seconds a component waits by default
+    MIN_SUSPEND_TIME = 0.001  # Shortest wait (waits <= 0 can starve greenlets waiting on I/O)
+
+    def prepare(self, executor):
+        """
+        Called once the executor has set up the graph, before any component
+        runs.
+
+        Parameters
+        ----------
+        executor : ``single_process.SingleProcessGraphExecutor``
+            the executor.
+        """
+        pass
+
+    @abstractmethod
+    def get_send_suspend_time(self, component, q):
+        """
+        Seconds a component waits after putting a packet on a queue.
+
+        Parameters
+        ----------
+        component : ``core.Component``
+            the sending component.
+        q : ``queue.Queue``
+            the queue of the packet's edge.
+        """
+        pass
+
+    @abstractmethod
+    def get_receive_suspend_time(self, component, q):
+        """
+        Seconds a component waits before checking an empty queue again.
+
+        Parameters
+        ----------
+        component : ``core.Component``
+            the receiving component.
+        q : ``queue.Queue``
+            the queue of the edge being received from.
+        """
+        pass
+
+
+class RoundRobinPolicy(SchedulingPolicy):
+    """
+    Every component waits `SUSPEND_TIME` seconds, so components take turns
+    regardless of where they are in the graph. This is the default.
+    """
+    def get_send_suspend_time(self, component, q):
+        return self.SUSPEND_TIME
+
+    def get_receive_suspend_time(self, component, q):
+        return self.SUSPEND_TIME
+
+
+class SinkFirstPolicy(SchedulingPolicy):
+    """
+    Components wait in proportion to their distance from the nearest sink:
+    sinks barely wait and sources wait the full `SUSPEND_TIME`, so packets
+    already in the graph are drained before new ones are taken in. Waiting
+    consumers check for packets at most every `RECEIVE_SUSPEND_TIME`
+    seconds, so idle sinks don't poll their empty queues nonstop.
+    """
+    RECEIVE_SUSPEND_TIME = 0.01
+
+    def __init__(self):
+        self._suspend_times = {}
+
+    def prepare(self, executor):
+        graph = executor.graph
+        components = graph.get_all_components()
+
+        # Breadth-first search upstream from the sinks
+        distances = dict((c, 0) for c in components if not graph.get_downstream(c))
+        pending = collections.deque(distances)
+        while pending:
+            component = pending.popleft()
+            for upstream in graph.get_upstream(component):
+                if upstream not in distances:
+                    distances[upstream] = distances[component] + 1
+                    pending.append(upstream)
+
+        max_distance = max(distances.values() or [0]) or 1
+        self._suspend_times = dict(
+            (c, max(self.MIN_SUSPEND_TIME,
+                    self.SUSPEND_TIME * distances.get(c, max_distance) / float(max_distance)))
+            for c in components)
+
+    def get_send_suspend_time(self, component, q):
+        return self._suspend_times.get(component, self.SUSPEND_TIME)
+
+    def get_receive_suspend_time(self, component, q):
+        return max(self.RECEIVE_SUSPEND_TIME,
+                   self._suspend_times.get(component, self.SUSPEND_TIME))
+
+
+class QueueDepthPolicy(SchedulingPolicy):
+    """
+    Producers wait in proportion to the depth of the queue they just sent
+    to, reaching `SUSPEND_TIME` at `TARGET_DEPTH` packets. Consumers with the
+    fullest input queues therefore get the most turns, while producers
+    sending to empty queues carry on almost immediately. Waiting consumers
+    check for packets every `RECEIVE_SUSPEND_TIME` seconds.
+    """
+    TARGET_DEPTH = 10
+    RECEIVE_SUSPEND_TIME = 0.01
+
+    def get_send_suspend_time(self, component, q):
+        depth = q.qsize()
+        if depth >= self.TARGET_DEPTH:
+            return self.SUSPEND_TIME
+
+        return max(self.MIN_SUSPEND_TIME,
+                   self.SUSPEND_TIME * depth / float(self.TARGET_DEPTH))
+
+    def get_receive_suspend_time(self, component, q):
+        return self.RECEIVE_SUSPEND_TIME
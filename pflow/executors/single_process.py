@@ -1,17 +1,49 @@
+import os
 import sys
-if 'threading' in sys.modules:
-    import gevent.threading
-    import threading
+import time
+import collections
+
+try:
+    import queue  # 3.x
+except ImportError:
+    import Queue as queue  # 2.x
 
-    if gevent.threading.Lock != threading.Lock:
-        # Crap!
-        sys.stderr.write('WARNING: The "threading" module was imported before "%s"; gevent could not monkey '
-                         'patch it first, and this may cause graph execution to halt where threads are used!\n' %
-                         __name__)
+import gevent
+import gevent.event
+import gevent.monkey
+import greenlet
 
-else:
-    # Do the monkey patch
-    import gevent.monkey
+from .base import GraphExecutor
+from .checkpoint import Checkpoint
+from .spill import SpillingQueue
+from .scheduling import RoundRobinPolicy
+from .timers import TimerHeap
+from .profiling import ExecutionProfile
+from .deadlock import WaitForGraph, SEND, RECEIVE, THROTTLE
+from .metrics import MetricsServer
+from .flight_recorder import FlightRecorder
+from ..core import Graph, ComponentState, InitialPacketGenerator
+from ..port import Port, InputPort, OutputPort, ArrayInputPort, EndOfStream
+from .. import exc
+
+# States of components that have started running, and not finished
+_RUNNING_STATES = frozenset([ComponentState.ACTIVE,
+                             ComponentState.SUSP_SEND,
+                             ComponentState.SUSP_RECV])
+
+
+def monkey_patch():
+    """
+    Monkey patches the standard library with gevent's cooperative versions
+    (sockets, time.sleep, threads, etc.), so that components making blocking
+    calls yield to other components instead of halting the whole graph.
+
+    This is opt-in: call it once at start-up, before any other modules
+    (especially ``threading``) are imported. Importing this module does not
+    patch anything.
+    """
+    if gevent.monkey.is_module_patched('socket'):
+        return  # Already patched
 
     gevent.monkey.patch_all(socket=True,  # socket
                             dns=True,  # socket dns functions
@@ -26,21 +58,53 @@ else:
                             sys=False,  # stdin, stdout, stderr
                             Event=False)
 
-import time
-import collections
 
-try:
-    import queue  # 3.x
-except ImportError:
-    import Queue as queue  # 2.x
+# All single process executors in this process share one greenlet tracer,
+# which attributes the time between context switches to the executor that
+# owns the greenlet being switched out of.
+_greenlet_owners = {}        # Executor that owns each component greenlet
+_last_switch_time = None     # Time of the last greenlet context switch
+_previous_tracer = None      # Tracer that was set before ours was installed
+_warned_unpatched = False    # Has the missing monkey_patch() warning been logged?
 
-import gevent
-import greenlet
 
-from .base import GraphExecutor
-from ..core import Graph, ComponentState
-from ..port import Port, InputPort, OutputPort, EndOfStream
-from .. import exc
+def _greenlet_tracer(event, args):
+    global _last_switch_time
+
+    if event in ('switch', 'throw'):
+        origin, target = args
+        then = _last_switch_time
+        now = _last_switch_time = time.time()
+
+        if then is not None:
+            executor = _greenlet_owners.get(origin)
+            if executor is not None:
+                executor._greenlet_switched_out(origin, now - then)
+
+    if _previous_tracer is not None:
+        _previous_tracer(event, args)
+
+
+def _register_greenlets(executor, greenlets):
+    global _previous_tracer, _last_switch_time
+
+    if not _greenlet_owners:
+        _previous_tracer = greenlet.settrace(_greenlet_tracer)
+        _last_switch_time = None
+
+    for glet in greenlets:
+        _greenlet_owners[glet] = executor
+
+
+def _unregister_greenlets(greenlets):
+    global _previous_tracer
+
+    for glet in greenlets:
+        _greenlet_owners.pop(glet, None)
+
+    if not _greenlet_owners:
+        greenlet.settrace(_previous_tracer)
+        _previous_tracer = None
 
 
 class SingleProcessGraphExecutor(GraphExecutor):
@@ -54,34 +118,79 @@ class SingleProcessGraphExecutor(GraphExecutor):
     """
     DETECT_BLOCKING = True   # Should blocking greenlets be detected?
     MAX_BLOCKING_TIME = 1.0  # Max number of seconds a greenlet can block before a warning is logged
+    TRACK_CPU_TIME = True    # Should time spent in component greenlets be accumulated in cpu_time?
+    PROFILE = True           # Should where components spend their time be recorded in profile?
+
+    DETECT_DEADLOCKS = True         # Should components waiting on each other forever be detected?
+    DEADLOCK_CHECK_INTERVAL = 1.0   # Seconds between deadlock checks
+    DEADLOCK_ACTION = 'abort'       # 'abort' the graph with a DeadlockError, or 'expand' a full queue
+    STALL_TIMEOUT = None            # Seconds without any packet sent before a stall is logged (optional)
+
+    METRICS_PORT = None             # Port to serve metrics on while executing (optional)
+    METRICS_HOST = 'localhost'      # Address to serve metrics on
 
-    def __init__(self, graph):
+    FLIGHT_RECORDER_SIZE = 4096     # Component state transitions kept in the flight recorder (0 disables it)
+    FLIGHT_RECORDER_DIR = None      # Directory flight recorder dumps are written to (default: temp directory)
+
+    CHECKPOINT_INTERVAL = 60.0       # Seconds between checkpoints (when checkpoint_path is set)
+    CHECKPOINT_QUIESCE_TIMEOUT = 5.0  # Max seconds to wait for a consistent point before skipping a checkpoint
+
+    def __init__(self, graph, checkpoint_path=None, scheduling_policy=None):
+        """
+        Parameters
+        ----------
+        graph : ``core.Graph``
+            the graph to execute.
+        checkpoint_path : str
+            file to periodically write checkpoints to. If it exists when
+            the graph is executed, execution resumes from that checkpoint.
+            (optional)
+        scheduling_policy : ``scheduling.SchedulingPolicy``
+            decides how long components wait when they yield.
+            (default: ``scheduling.RoundRobinPolicy``)
+        """
         super(SingleProcessGraphExecutor, self).__init__(graph)
+        self.checkpoint_path = checkpoint_path
+        self.scheduling_policy = scheduling_policy or RoundRobinPolicy()
         self._graph_lookup = None       # Lookup of graphs by component
         self._recv_queues = None        # Queues for graph edges (port-to-port communication)
         self._running = False           # Is the graph running?
         self._coroutines = None         # Tuples of (greenlet, component)
-        self._last_switch_time = None   # Last context switch (used by _blocking_greenlet_detector)
+        self._components = None         # Lookup of greenlets by component
+        self._blocked_sends = None      # (queue, packet) sends blocked on a full queue, by component
+        self._waits = None              # (kind, ports) of components waiting on edges, by component
+        self._send_count = 0            # Packets sent so far (to detect stalls)
+        self.deadlock = None            # deadlock.Deadlock the graph was aborted because of
+        self._receive_waiters = None    # Events waking up components in receive_any_port(), by queue
+        self._receive_any_offsets = None  # Index of the port to check first in receive_any_port(), by component
+        self._timers = None             # TimerHeap of the graph's timers
+        self._timers_changed = None     # Event waking up the timer greenlet when an earlier timer is scheduled
+        self._stopping = False          # Is the graph being stopped (rather than finishing)?
+        if self.FLIGHT_RECORDER_SIZE:
+            self.flight_recorder = FlightRecorder(self.FLIGHT_RECORDER_SIZE)
 
-    def _blocking_greenlet_detector(self, event, (origin, target)):
+    def _greenlet_switched_out(self, coroutine, elapsed_time):
         """
-        Greenlet tracer that detects greenlets that block for too long.
+        Called by the greenlet tracer when one of this executor's component
+        greenlets yields, with the number of seconds it ran for.
 
-        These are CPU-bound or are making a non-monkeypatched synchronous call,
-        which can cause graph execution to slow down or deadlock. It's not possible
-        to detect deadlocks with this trace function, however.
+        Greenlets that run for too long are CPU-bound or are making a
+        non-monkeypatched synchronous call, which can cause graph execution
+        (and any other graph in this process) to slow down or deadlock. Deadlocks
+        between components waiting on each other are detected separately (see
+        `find_deadlock()`).
         """
-        if event != 'switch':
-            return  # Only care about context switches and not 'throw's
+        if self.TRACK_CPU_TIME:
+            self.cpu_time += elapsed_time
 
-        then = self._last_switch_time
-        now = self._last_switch_time = time.time()
-        if then is None:
-            return
+        profile = self.profile
+        if profile is not None:
+            component = self._coroutines.get(coroutine)
+            if component is not None:
+                profile.busy_times[component] += elapsed_time
 
-        blocking_time = now - then
-        if origin is not gevent.get_hub() and blocking_time > self.MAX_BLOCKING_TIME:
-            component = self._coroutines.get(origin)
+        if self.DETECT_BLOCKING and elapsed_time > self.MAX_BLOCKING_TIME:
+            component = self._coroutines.get(coroutine)
             if component is None:
                 return  # Non-component greenlet
 
@@ -89,24 +198,43 @@ class SingleProcessGraphExecutor(GraphExecutor):
                           'If the component was waiting on a blocking call, be sure to gevent.monkey patch it '
                           'or convert it to an asynchronous call. CPU-bound components aren\'t well suited for '
                           '{}, and should use a different executor altogether.'.format(component,
-                                                                                       blocking_time,
+                                                                                       elapsed_time,
                                                                                        self.__class__.__name__))
             #traceback.print_stack()
 
     def execute(self):
+        global _warned_unpatched
+
         self.log.debug('Executing {}'.format(self.graph))
 
+        if not _warned_unpatched and not gevent.monkey.is_module_patched('socket'):
+            _warned_unpatched = True
+            self.log.warn('gevent monkey patching is not enabled, so blocking calls in components will block '
+                          'every other component. Call {}.monkey_patch() at start-up to enable it.'.format(__name__))
+
         # Initialize graph
         if self.graph.state == ComponentState.NOT_INITIALIZED:
             self.graph.initialize()
             self.graph.state = ComponentState.INITIALIZED
 
-        # Enable tracing
-        old_trace = greenlet.gettrace()
-        if self.DETECT_BLOCKING:
-            greenlet.settrace(self._blocking_greenlet_detector)
-
         self._running = True
+        self._stopping = False
+        self._coroutines = {}
+        self._components = {}
+        self._blocked_sends = {}
+        self._waits = {}
+        self._send_count = 0
+        self.deadlock = None
+        self._receive_waiters = {}
+        self._receive_any_offsets = {}
+        self._timers = TimerHeap()
+        self._timers_changed = gevent.event.Event()
+        self.cpu_time = 0.0
+        self.profile = ExecutionProfile() if self.PROFILE else None
+        checkpointer = None
+        timer_runner = None
+        deadlock_detector = None
+        metrics_server = None
         try:
             all_components = set()
             self._graph_lookup = {}
@@ -129,11 +257,25 @@ class SingleProcessGraphExecutor(GraphExecutor):
                                                          ', '.join(map(str, all_components))))
 
             self._recv_queues = collections.defaultdict(queue.Queue)
+
+            if self.checkpoint_path is not None:
+                checkpoint = Checkpoint.load(self.checkpoint_path)
+                if checkpoint is not None:
+                    self._restore_checkpoint(checkpoint)
+
+            self.scheduling_policy.prepare(self)
+
             self._coroutines = dict(
                 [(gevent.spawn(self._create_component_runner(comp),
                                None,   # in_queues
                                None),  # out_queues
-                  comp) for comp in filter(lambda c: not isinstance(c, Graph), all_components)])
+                  comp) for comp in all_components
+                 if not isinstance(comp, Graph) and not comp.is_terminated()])
+            self._components = dict((comp, coroutine) for coroutine, comp in self._coroutines.items())
+
+            # Enable tracing
+            if self.DETECT_BLOCKING or self.TRACK_CPU_TIME:
+                _register_greenlets(self, self._coroutines)
 
             last_exception = None
 
@@ -153,29 +295,403 @@ class SingleProcessGraphExecutor(GraphExecutor):
                     if c.is_alive():
                         c.terminate(ex=last_exception)
 
+                self.dump_flight_recorder('error')
+
             # Wire up error handler (so that exceptions aren't swallowed)
             for coroutine in self._coroutines.keys():
                 coroutine.link_exception(thread_error_handler)
+                coroutine.link(self._wake_receivers)
+                if self.profile is not None:
+                    coroutine.link(self._record_finish)
+
+            timer_runner = gevent.spawn(self._run_timers)
+
+            if self.checkpoint_path is not None:
+                checkpointer = gevent.spawn(self._run_checkpoints)
+
+            if self.DETECT_DEADLOCKS:
+                deadlock_detector = gevent.spawn(self._run_deadlock_detection)
+
+            if self.METRICS_PORT is not None:
+                metrics_server = MetricsServer(self.get_metrics, self.METRICS_HOST,
+                                               self.METRICS_PORT)
+                metrics_server.start()
 
             # Wait for all coroutines to terminate
             gevent.wait(self._coroutines.keys())
+            if self.profile is not None:
+                self.profile.finish()
 
             self.graph.terminate(ex=last_exception)
             self._final_checks()
+
+            # A graph that ran to completion has nothing left to resume
+            failed = any(c.state == ComponentState.ERROR for c in all_components)
+            if (self.checkpoint_path is not None and not failed and
+                    not self._stopping and os.path.exists(self.checkpoint_path)):
+                os.remove(self.checkpoint_path)
+
             self._reset_components()
 
             self.log.debug('Finished graph execution')
 
+            if self.deadlock is not None:
+                raise exc.DeadlockError(self.deadlock)
+
         finally:
+            if checkpointer is not None:
+                checkpointer.kill()
+            if deadlock_detector is not None:
+                deadlock_detector.kill()
+            if metrics_server is not None:
+                metrics_server.stop()
+            if timer_runner is not None:
+                timer_runner.kill()
+
+            for q in (self._recv_queues or {}).values():
+                if isinstance(q, SpillingQueue):
+                    q.close()
+            self._remove_spill_dir()
+
+            if self.edge_recorder is not None:
+                self.edge_recorder.close()
+
             self._running = False
-            if self.DETECT_BLOCKING:
-                # Unset tracer
-                greenlet.settrace(old_trace)
+            # Unset tracer
+            _unregister_greenlets(self._coroutines)
 
     def is_running(self):
         return self._running
 
-    def _get_or_create_queue(self, port):
+    def schedule_timer(self, deadline, callback):
+        """
+        Schedules a callback on the graph's timer heap.
+
+        Parameters
+        ----------
+        deadline : float
+            time (as returned by ``time.time()``) to call the callback at.
+        callback : callable
+            called without arguments (from the timer greenlet) once the
+            deadline has passed.
+
+        Returns
+        -------
+        timer : ``timers.Timer``
+            handle to cancel the timer with.
+        """
+        next_deadline = self._timers.get_next_deadline()
+        timer = self._timers.schedule(deadline, callback)
+        if next_deadline is None or deadline < next_deadline:
+            self._timers_changed.set()
+
+        return timer
+
+    def _run_timers(self):
+        """
+        Fires timers as they expire, sleeping until the earliest one.
+        """
+        while True:
+            for callback in self._timers.pop_expired(time.time()):
+                callback()
+
+            self._timers_changed.clear()
+            deadline = self._timers.get_next_deadline()
+            if deadline is None:
+                self._timers_changed.wait()
+            else:
+                self._timers_changed.wait(max(0.0, deadline - time.time()))
+
+    def _wake_receivers(self, coroutine):
+        """
+        Wakes up the components waiting in `receive_any_port()` when a
+        component finishes, so they can check whether their upstream has
+        terminated.
+        """
+        for wakeup in set(self._receive_waiters.values()):
+            wakeup.set()
+
+    def _record_finish(self, coroutine):
+        """
+        Records when a component finished in the execution's profile.
+        """
+        component = self._coroutines.get(coroutine)
+        if component is not None:
+            self.profile.finish_times[component] = time.time()
+
+    def _get_component_path(self, component):
+        return '{}.{}'.format(self._graph_lookup[component].name, component.name)
+
+    def _is_consistent(self):
+        """
+        Is the graph at a point where a checkpoint captures every in-flight
+        packet? That's when every running component is at a quiescent point
+        it declared (see ``core.Component.quiescent()``), and holds no values
+        of a split batch, so that the packets it holds are all in its
+        checkpoint state or waiting on its edges. Waiting to send or receive
+        isn't enough on its own, since a component may be holding a packet
+        it received (e.g. `Multiply` waiting on Y with X in hand) or be part
+        way through sending to several ports.
+        """
+        for component in self._components:
+            if (isinstance(component, InitialPacketGenerator) or
+                    component.state not in _RUNNING_STATES):
+                continue  # IIPs are resent on resume
+
+            if not component._quiescent:
+                return False
+
+            for port in component.inputs:
+                ports = port if isinstance(port, ArrayInputPort) else [port]
+                if any(p._batch_values for p in ports):
+                    return False
+
+        return True
+
+    def _capture_checkpoint(self):
+        """
+        Captures a checkpoint of the graph. This doesn't yield, so no
+        component runs while it is captured.
+        """
+        checkpoint = Checkpoint(self.graph.name)
+
+        for component in self._graph_lookup:
+            if isinstance(component, (Graph, InitialPacketGenerator)):
+                continue  # IIPs are always resent when a graph resumes
+
+            path = self._get_component_path(component)
+            if component.is_terminated():
+                checkpoint.terminated.add(path)
+            else:
+                state = component.get_checkpoint_state()
+                if state is not None:
+                    checkpoint.states[path] = state
+
+        def add_packet(queue_key, packet):
+            owner = packet.owner
+            if isinstance(owner, InitialPacketGenerator):
+                return
+
+            owner_path = self._get_component_path(owner) if owner is not None else None
+            checkpoint.add_packet(queue_key, packet, owner_path)
+
+        queue_keys = {}
+        for queue_key, q in self._recv_queues.items():
+            queue_keys[q] = queue_key
+            packets = q.get_packets() if isinstance(q, SpillingQueue) else list(q.queue)
+            for packet in packets:
+                add_packet(queue_key, packet)
+
+        # Packets still waiting for room in a full queue go after the ones in it
+        for q, packet in self._blocked_sends.values():
+            if q in queue_keys:
+                add_packet(queue_keys[q], packet)
+
+        return checkpoint
+
+    def _restore_checkpoint(self, checkpoint):
+        """
+        Restores in-flight packets, component states and terminated components
+        from a checkpoint, before any component runs.
+        """
+        if checkpoint.graph_name != self.graph.name:
+            raise exc.CheckpointError('Checkpoint {} is of graph {!r}, not {!r}'.format(
+                                      self.checkpoint_path, checkpoint.graph_name, self.graph.name))
+
+        self.log.info('Resuming {} from checkpoint taken at {}'.format(
+                      self.graph, time.ctime(checkpoint.timestamp)))
+
+        components = dict((self._get_component_path(c), c) for c in self._graph_lookup)
+
+        for path, state in checkpoint.states.items():
+            component = components.get(path)
+            if component is None:
+                self.log.warn('Ignoring checkpoint state of missing component {}'.format(path))
+                continue
+
+            component.restore_checkpoint_state(state)
+
+        for component in components.values():
+            for port in component.inputs:
+                if not port.is_connected():
+                    continue
+
+                q = self._get_or_create_queue(port)
+                for packet, owner_path in checkpoint.iter_packets(self._get_queue_key(port)):
+                    owner = components.get(owner_path)
+                    if owner is not None:
+                        packet.owner = owner
+                        owner.owned_packet_count += 1
+
+                    # Bypasses maxsize, since sends that were blocked on a
+                    # full queue were checkpointed as well
+                    q._put(packet)
+
+        for path in checkpoint.terminated:
+            component = components.get(path)
+            if component is not None and not component.is_terminated():
+                component.terminate()
+
+        # There's nobody left to receive the IIPs of terminated components
+        for component in components.values():
+            if (isinstance(component, InitialPacketGenerator) and
+                    component.outputs['OUT'].target_port.component.is_terminated()):
+                component.terminate()
+
+    def checkpoint(self):
+        """
+        Waits for the graph to reach a consistent point, and writes a
+        checkpoint of it to `checkpoint_path`.
+
+        Returns
+        -------
+        checkpoint : ``checkpoint.Checkpoint``
+            the written checkpoint, or None if the graph isn't running or
+            didn't reach a consistent point within
+            `CHECKPOINT_QUIESCE_TIMEOUT` seconds.
+        """
+        if self.checkpoint_path is None:
+            raise ValueError('{} has no checkpoint_path set'.format(self))
+
+        deadline = time.time() + self.CHECKPOINT_QUIESCE_TIMEOUT
+        while self.is_running() and not self._is_consistent():
+            if time.time() >= deadline:
+                self.log.warn('Skipping checkpoint, since {} did not reach a consistent point '
+                              'within {:.1f} seconds'.format(self.graph,
+                                                             self.CHECKPOINT_QUIESCE_TIMEOUT))
+                return None
+
+            gevent.sleep(0.01)
+
+        if not self.is_running():
+            return None
+
+        checkpoint = self._capture_checkpoint()
+        checkpoint.save(self.checkpoint_path)
+        self.log.debug('Wrote checkpoint of {} to {}'.format(self.graph, self.checkpoint_path))
+        return checkpoint
+
+    def _run_checkpoints(self):
+        while True:
+            gevent.sleep(self.CHECKPOINT_INTERVAL)
+            try:
+                self.checkpoint()
+            except Exception as ex:
+                self.log.exception('Unable to write checkpoint: {}'.format(ex))
+
+    def find_deadlock(self):
+        """
+        Finds components of the running graph that are waiting on each other
+        forever (see ``deadlock.WaitForGraph``).
+
+        Returns
+        -------
+        deadlock : ``deadlock.Deadlock``
+            or None if there is no deadlock.
+        """
+        waits = self._waits
+        budget = self.memory_budget
+        if budget is not None and budget.get_graphs() - set([self.graph]):
+            # Other graphs sharing the budget may free it up
+            waits = dict((component, wait) for component, wait in waits.items()
+                         if wait[0] != THROTTLE)
+
+        wait_for_graph = WaitForGraph(self.graph, waits, self._get_or_create_queue)
+        return wait_for_graph.find_deadlock()
+
+    def _resolve_deadlock(self, deadlock):
+        """
+        Aborts the graph, or expands a full queue of the deadlock's cycle so
+        that its producer can continue, depending on `DEADLOCK_ACTION`.
+        """
+        queues = deadlock.get_full_queues()
+        if self.DEADLOCK_ACTION == 'expand' and queues:
+            q = queues[0]
+            q.maxsize *= 2
+            self.log.warn('{}\nExpanded a full queue to {:d} packets to resolve it'.format(
+                          deadlock.format(), q.maxsize))
+            self.dump_flight_recorder('deadlock')
+            return
+
+        self.log.error('{}\nAborting {}'.format(deadlock.format(), self.graph))
+        self.deadlock = deadlock
+        error = exc.DeadlockError(deadlock)
+        for component in self._components:
+            if component.is_alive():
+                component.terminate(ex=error)
+
+        self.dump_flight_recorder('deadlock')
+
+    def _run_deadlock_detection(self):
+        last_send_count = self._send_count
+        last_send_time = time.time()
+        while True:
+            gevent.sleep(self.DEADLOCK_CHECK_INTERVAL)
+            deadlock = self.find_deadlock()
+            if deadlock is not None:
+                self._resolve_deadlock(deadlock)
+                continue
+
+            # No deadlock, but no packets are moving either (e.g. a component
+            # is waiting on something other than its edges)
+            now = time.time()
+            if self._send_count != last_send_count:
+                last_send_count = self._send_count
+                last_send_time = now
+            elif (self.STALL_TIMEOUT is not None and
+                    now - last_send_time >= self.STALL_TIMEOUT):
+                self.log.warn('No packets were sent in {} for {:.1f} seconds. Components: {}'.format(
+                              self.graph, now - last_send_time,
+                              ', '.join('{} ({})'.format(c, c.state)
+                                        for c in self._components if c.is_alive())))
+                self.dump_flight_recorder('stall')
+                last_send_time = now
+
+    def dump_flight_recorder(self, reason):
+        """
+        Writes the flight recorder's recent state transitions to a file in
+        `FLIGHT_RECORDER_DIR` (see ``flight_recorder.FlightRecorder.dump()``).
+
+        Parameters
+        ----------
+        reason : str
+            why the dump is written (e.g. 'error'), which is part of the file
+            name.
+
+        Returns
+        -------
+        path : str
+            the written file, or None if there's no flight recorder or it
+            couldn't be written.
+        """
+        if self.flight_recorder is None:
+            return None
+
+        import tempfile
+
+        directory = self.FLIGHT_RECORDER_DIR or tempfile.gettempdir()
+        now = time.time()
+        path = os.path.join(directory, '{}.{}.{:.0f}.flight'.format(self.graph.name, reason, now))
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.flight_recorder.dump(path, graph=self.graph.name, reason=reason, time=now)
+        except Exception as ex:
+            self.log.exception('Unable to write flight recorder dump: {}'.format(ex))
+            return None
+
+        self.log.warn('Wrote flight recorder dump of {} to {}. Read it with: '
+                      'python -m pflow.executors.flight_recorder {}'.format(self.graph, path, path))
+        return path
+
+    def get_queue_size(self, port):
+        if self._recv_queues is None:
+            return None
+
+        q = self._recv_queues.get(self._get_queue_key(port))
+        return q.qsize() if q is not None else 0
+
+    def _get_queue_key(self, port):
         if not isinstance(port, Port):
             raise ValueError('port must be a Port')
 
@@ -187,55 +703,174 @@ class SingleProcessGraphExecutor(GraphExecutor):
         if graph is None:
             raise ValueError('{} component {} has no graph in lookup'.format(port, port.component))
 
-        queue_key = '{}.{}.{}'.format(graph.name, port.component.name, port.name)
+        return '{}.{}.{}'.format(graph.name, port.component.name, port.name)
+
+    def _get_or_create_queue(self, port):
+        queue_key = self._get_queue_key(port)
+        if port.proxied_port is not None:
+            port = port.proxied_port
 
         if queue_key not in self._recv_queues:
             if isinstance(port, InputPort):
                 maxsize = port.max_queue_size
+                spill_threshold = port.spill_threshold
             else:
                 maxsize = None
+                spill_threshold = None
 
-            self._recv_queues[queue_key] = queue.Queue(maxsize=maxsize)
+            if spill_threshold is not None:
+                self._recv_queues[queue_key] = SpillingQueue(self._get_spill_dir(), queue_key,
+                                                             spill_threshold, maxsize=maxsize or 0)
+            else:
+                self._recv_queues[queue_key] = queue.Queue(maxsize=maxsize)
 
         return self._recv_queues[queue_key]
 
     def send_port(self, component, port_name, packet, timeout=None):
+        component._state_port = port_name
+        component.state = ComponentState.SUSP_SEND
+        q = self._put_packet(component, port_name, packet)
+        self._yield_after_send(component, q)
+        component.state = ComponentState.ACTIVE
+
+    def broadcast_port(self, component, port_names, packet, timeout=None):
+        # The same packet object is put on every edge, and the component
+        # only yields once they all have it
+        component._state_port = port_names[0]
+        component.state = ComponentState.SUSP_SEND
+        for port_name in port_names:
+            q = self._put_packet(component, port_name, packet)
+        self._yield_after_send(component, q)
+        component.state = ComponentState.ACTIVE
+
+    def _yield_after_send(self, component, q):
+        suspend_time = self.scheduling_policy.get_send_suspend_time(component, q)
+        if self.profile is None:
+            self.suspend_thread(suspend_time)
+        else:
+            start_time = time.time()
+            self.suspend_thread(suspend_time)
+            self.profile.yielded_times[component] += time.time() - start_time
+
+    def _put_packet(self, component, port_name, packet):
+        """
+        Puts a packet on the edge leading from a component's output port,
+        blocking while the component is throttled or the queue is full.
+
+        Returns
+        -------
+        q : ``queue.Queue``
+            the edge's queue.
+        """
         source_port = component.outputs[port_name]
         dest_port = source_port.target_port
         q = self._get_or_create_queue(dest_port)
 
-        component.state = ComponentState.SUSP_SEND
-
         self.log.debug('Sending packet from {} to {}: {}'.format(
                        source_port, dest_port, packet))
 
+        inspector = self.edge_inspector
+        if inspector is not None:
+            edge = inspector.edges.get(source_port)
+            if edge is not None:
+                edge.observe(packet)
+
+        recorder = self.edge_recorder
+        if recorder is not None:
+            edge = recorder.edges.get(source_port)
+            if edge is not None:
+                edge.record(packet)
+
+        profile = self.profile
+        if profile is not None:
+            profile.packet_counts[source_port] += 1
+        self._send_count += 1
+
+        budget = self.memory_budget
+        if budget is not None:
+            if budget.should_throttle(component):
+                # Backpressure: wait for consumers to catch up with the
+                # packets this component already sent
+                self._blocked_sends[component] = (q, packet)
+                self._waits[component] = (THROTTLE, tuple(budget.get_edges(component)))
+                blocked_time = time.time()
+                try:
+                    while budget.should_throttle(component) and component.is_alive():
+                        self.suspend_thread()
+                finally:
+                    del self._blocked_sends[component]
+                    del self._waits[component]
+                    if profile is not None:
+                        profile.blocked_times[source_port] += time.time() - blocked_time
+
+            edge = dest_port if dest_port.proxied_port is None else dest_port.proxied_port
+            size = packet.estimate_size()
+            budget.add(self.graph, component, edge, size)
+
         try:
-            # TODO: Make this call non-blocking to prevent deadlock
-            # See: https://github.com/LumaPictures/pflow/issues/17
+            if q.full():
+                # The packet is in flight while the send is blocked. The
+                # component yields until there is room, rather than blocking
+                # in put(), so that deadlocks can be detected (and resolved
+                # by expanding the queue).
+                self._blocked_sends[component] = (q, packet)
+                self._waits[component] = (SEND, (dest_port,))
+                blocked_time = time.time()
+                try:
+                    while q.full() and component.is_alive():
+                        self.suspend_thread(self.scheduling_policy.get_send_suspend_time(component, q))
+                finally:
+                    del self._blocked_sends[component]
+                    del self._waits[component]
+                    if profile is not None:
+                        profile.blocked_times[source_port] += time.time() - blocked_time
+
             q.put(packet)
-            self.suspend_thread()
-            component.state = ComponentState.ACTIVE
+
+            wakeup = self._receive_waiters.get(q)
+            if wakeup is not None:
+                wakeup.set()
         except queue.Full:
             # Timed out
             component.state = ComponentState.ACTIVE
+            if budget is not None:
+                budget.remove(edge, size)
             raise exc.PortTimeout(dest_port)
 
+        return q
+
     def receive_port(self, component, port_name, timeout=None):
         source_port = component.inputs[port_name]
         if not source_port.is_open():
             return EndOfStream
 
         q = self._get_or_create_queue(source_port)
+        component._state_port = port_name
         component.state = ComponentState.SUSP_RECV
 
         self.log.debug('{} is waiting for data on {}'.format(component,
                                                              source_port))
         start_time = time.time()
+        try:
+            return self._receive_packet(component, source_port, q, start_time, timeout)
+        finally:
+            self._waits.pop(component, None)
+
+    def _receive_packet(self, component, source_port, q, start_time, timeout):
         while component.is_alive():
             try:
                 packet = q.get(block=False)
                 self.log.debug('{} received packet on {}: {}'.format(
                     component, source_port, packet))
+
+                budget = self.memory_budget
+                if budget is not None:
+                    edge = source_port if source_port.proxied_port is None else source_port.proxied_port
+                    budget.remove(edge, packet.estimate_size())
+
+                if self.profile is not None:
+                    self.profile.starved_times[source_port] += time.time() - start_time
+
                 component.state = ComponentState.ACTIVE
                 return packet
             except queue.Empty:
@@ -257,11 +892,95 @@ class SingleProcessGraphExecutor(GraphExecutor):
                     if source_port.is_open():
                         source_port.close()
 
+                    if self.profile is not None:
+                        self.profile.starved_times[source_port] += curr_time - start_time
+
                     return EndOfStream
                 else:
                     # self.log.debug('%s is waiting for packet on %s' % (component, source_port))
                     component.state = ComponentState.SUSP_RECV
-                    self.suspend_thread()
+                    if timeout is None:
+                        self._waits[component] = (RECEIVE, (source_port,))
+                    self.suspend_thread(self.scheduling_policy.get_receive_suspend_time(component, q))
+
+    def receive_any_port(self, component, port_names, timeout=None):
+        ports = [component.inputs[port_name] for port_name in port_names]
+        queues = [self._get_or_create_queue(port) for port in ports]
+        component._state_port = port_names[0]
+        component.state = ComponentState.SUSP_RECV
+
+        # Senders to any of the queues, components finishing and the timeout
+        # wake the component up, rather than it polling the queues
+        wakeup = gevent.event.Event()
+        for q in queues:
+            self._receive_waiters[q] = wakeup
+
+        start_time = time.time()
+        timer = None
+        if timeout is not None:
+            deadline = start_time + timeout
+            timer = self.schedule_timer(deadline, wakeup.set)
+
+        self.log.debug('{} is waiting for data on {}'.format(component,
+                                                             ', '.join(map(str, ports))))
+        try:
+            while component.is_alive():
+                wakeup.clear()
+                offset = self._receive_any_offsets.get(component, 0)
+                for i in range(len(ports)):
+                    index = (offset + i) % len(ports)
+                    port = ports[index]
+                    q = queues[index]
+                    if not port.is_open() or q.empty():
+                        continue
+
+                    packet = q.get(block=False)
+                    self.log.debug('{} received packet on {}: {}'.format(
+                        component, port, packet))
+
+                    budget = self.memory_budget
+                    if budget is not None:
+                        edge = port if port.proxied_port is None else port.proxied_port
+                        budget.remove(edge, packet.estimate_size())
+
+                    if self.profile is not None:
+                        self.profile.starved_times[port] += time.time() - start_time
+
+                    self._receive_any_offsets[component] = index + 1
+                    component._state_port = port.name
+                    component.state = ComponentState.ACTIVE
+                    return packet, port.name
+
+                open_ports = [port for port in ports if port.is_open()]
+                if not open_ports:
+                    component.state = ComponentState.ACTIVE
+                    return EndOfStream, None
+
+                if timeout is not None and time.time() >= deadline:
+                    component.state = ComponentState.ACTIVE
+                    raise exc.PortTimeout(ports[0])
+
+                if self.graph.is_upstream_terminated(component):
+                    # No more data left to receive and upstream has terminated
+                    component.state = ComponentState.ACTIVE
+                    for port in open_ports:
+                        port.close()
+
+                    if self.profile is not None:
+                        self.profile.starved_times[ports[0]] += time.time() - start_time
+
+                    return EndOfStream, None
+
+                if timeout is None:
+                    self._waits[component] = (RECEIVE, ports)
+                wakeup.wait()
+        finally:
+            self._waits.pop(component, None)
+            for q in queues:
+                if self._receive_waiters.get(q) is wakeup:
+                    del self._receive_waiters[q]
+            if timer is not None:
+                timer.cancel()
 
     def close_input_port(self, component, port_name):
         self.log.debug('Closing input port {}.{}'.format(component.name,
@@ -279,8 +998,39 @@ class SingleProcessGraphExecutor(GraphExecutor):
         if port_id in self._recv_queues:
             del self._recv_queues[port_id]
 
+    def stop(self):
+        if not self.is_running():
+            return
+
+        # Kill the component greenlets; execute() then finishes up in its own
+        # greenlet. Stopped graphs (e.g. for a redeploy) are checkpointed
+        # first, so that they can resume where they left off.
+        self.log.debug('Stopping graph execution...')
+        self._stopping = True
+        if self.checkpoint_path is not None:
+            try:
+                self.checkpoint()
+            except Exception as ex:
+                self.log.exception('Unable to write checkpoint: {}'.format(ex))
+
+        gevent.killall(self._coroutines.keys())
+
+        # Components killed while blocked on a send are no longer sending
+        for component in self._components:
+            if component.state == ComponentState.SUSP_SEND:
+                component.state = ComponentState.ACTIVE
+
     def terminate_thread(self, component):
-        raise gevent.GreenletExit
+        coroutine = self._components.get(component) if self._components else None
+        if coroutine is None:
+            return  # Not a component greenlet (e.g. a subgraph)
+
+        if coroutine is gevent.getcurrent():
+            raise gevent.GreenletExit
+
+        # Terminated from another greenlet (e.g. by an error handler or a
+        # runtime stopping the graph)
+        coroutine.kill(block=False)
 
     def suspend_thread(self, seconds=None):
         if seconds is None or seconds <= 0:
@@ -0,0 +1,281 @@
+"""
+Edge queues that spill to disk.
+
+Once the packets queued on an edge pass a memory threshold, further packets
+are appended to local segment files instead, and paged back in as the
+consumer catches up. Packets are always delivered in the order they were sent
+(so substream and map brackets stay intact), and a slow consumer no longer
+exhausts memory or stalls its producers.
+
+Spilling is enabled per edge by setting `port.InputPort.spill_threshold`. An
+edge's `port.InputPort.max_queue_size` counts its spilled packets too, so
+producers of a spilling edge still block once that many packets are queued.
+"""
+import os
+import collections
+
+try:
+    import queue  # 3.x
+except ImportError:
+    import Queue as queue  # 2.x
+
+from ..packet import BinaryPacketSerializer
+
+# Location of a spilled record within an edge's segment files.
+SpillLocation = collections.namedtuple('SpillLocation', 'segment offset length')
+
+_packet_serializer = BinaryPacketSerializer()
+
+
+def _get_segment_path(directory, name, segment):
+    return os.path.join(directory, '{}.{:06d}.seg'.format(name, segment))
+
+
+class SegmentWriter(object):
+    """
+    Appends records to an edge's segment files, starting a new segment once
+    the current one reaches `SEGMENT_SIZE` bytes.
+    """
+    SEGMENT_SIZE = 64 * 1024 * 1024  # Max bytes per segment file
+
+    def __init__(self, directory, name, segment=0):
+        self.directory = directory
+        self.name = name
+        self.segment = segment
+        self._file = None
+        self._offset = 0
+
+    def append(self, data):
+        """
+        Appends a record, flushing it so that readers (possibly in other
+        processes) can read it right away.
+
+        Returns
+        -------
+        location : ``SpillLocation``
+            where the record was written.
+        """
+        if self._file is not None and self._offset >= self.SEGMENT_SIZE:
+            self.close()
+            self.segment += 1
+
+        if self._file is None:
+            self._file = open(_get_segment_path(self.directory, self.name, self.segment), 'ab')
+            self._offset = self._file.tell()
+
+        location = SpillLocation(self.segment, self._offset, len(data))
+        self._file.write(data)
+        self._file.flush()
+        self._offset += len(data)
+        return location
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SegmentReader(object):
+    """
+    Reads records back from an edge's segment files in the order they were
+    written, removing each segment once reading moves past it (unless
+    `remove_read` is False).
+    """
+    def __init__(self, directory, name, remove_read=True):
+        self.directory = directory
+        self.name = name
+        self.remove_read = remove_read
+        self._segment = None
+        self._file = None
+
+    def read(self, location):
+        """
+        Reads the record at a location.
+        """
+        if location.segment != self._segment:
+            self.close(remove=self.remove_read)
+            self._segment = location.segment
+            self._file = open(_get_segment_path(self.directory, self.name, self._segment), 'rb')
+
+        if self._file.tell() != location.offset:
+            self._file.seek(location.offset)
+
+        return self._file.read(location.length)
+
+    def close(self, remove=False):
+        """
+        Closes the current segment, optionally removing its file.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            if remove:
+                os.remove(_get_segment_path(self.directory, self.name, self._segment))
+
+
+class SpillingQueue(queue.Queue):
+    """
+    Queue of packets for the single process executor, which keeps up to
+    `threshold` bytes of packets in memory and spills the rest to disk.
+    """
+    def __init__(self, directory, name, threshold, maxsize=0):
+        """
+        Parameters
+        ----------
+        directory : str
+            directory to write segment files to.
+        name : str
+            unique name of the edge, used to name its segment files.
+        threshold : int
+            max estimated bytes of packets to keep in memory.
+        maxsize : int
+            max number of packets (in memory and spilled) before puts block.
+        """
+        self.directory = directory
+        self.name = name
+        self.threshold = threshold
+        self.spilled_count = 0  # Packets spilled to disk over the queue's lifetime
+        self._writer = None
+        self._reader = None
+        queue.Queue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        self.queue = collections.deque()    # Packets in memory
+        self._spilled = collections.deque()  # (owner, location) of spilled packets, after those in memory
+        self.memory_size = 0                # Estimated bytes of the packets in memory
+
+    def _qsize(self, len=len):
+        return len(self.queue) + len(self._spilled)
+
+    def _put(self, packet):
+        size = packet.estimate_size()
+        if not self._spilled and (not self.queue or
+                                  self.memory_size + size <= self.threshold):
+            self.queue.append(packet)
+            self.memory_size += size
+            return
+
+        if self._writer is None:
+            self._writer = SegmentWriter(self.directory, self.name)
+            self._reader = SegmentReader(self.directory, self.name)
+
+        if packet._share_count > 1 and packet.owner is not None:
+            # The copy read back is dropped separately from the shared packet
+            packet._share_count -= 1
+            packet.owner.owned_packet_count += 1
+
+        location = self._writer.append(_packet_serializer.serialize(packet))
+        self._spilled.append((packet.owner, location))
+        self.spilled_count += 1
+
+    def _get(self):
+        if not self.queue:
+            self._page_in()
+
+        packet = self.queue.popleft()
+        self.memory_size -= packet.estimate_size()
+        return packet
+
+    def _page_in(self):
+        """
+        Reads spilled packets back into memory, up to the threshold.
+        """
+        while self._spilled and (not self.queue or self.memory_size < self.threshold):
+            owner, location = self._spilled.popleft()
+            packet = _packet_serializer.deserialize(self._reader.read(location))
+            if owner is not None:
+                packet.owner = owner
+
+            self.queue.append(packet)
+            self.memory_size += packet.estimate_size()
+
+        if not self._spilled:
+            # Caught up, so start the next spill with a fresh segment
+            self._reader.close(remove=True)
+            self._writer.close()
+            self._writer.segment += 1
+
+    def get_packets(self):
+        """
+        Gets all queued packets in order, without removing them.
+        """
+        packets = list(self.queue)
+        if self._spilled:
+            reader = SegmentReader(self.directory, self.name, remove_read=False)
+            try:
+                for owner, location in self._spilled:
+                    packet = _packet_serializer.deserialize(reader.read(location))
+                    if owner is not None:
+                        packet.owner = owner
+                    packets.append(packet)
+            finally:
+                reader.close()
+
+        return packets
+
+    def close(self):
+        """
+        Removes any segment files.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._reader.close()
+            for segment in range(self._writer.segment + 1):
+                path = _get_segment_path(self.directory, self.name, segment)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class SpillingChannel(object):
+    """
+    Wraps a ``multiprocessing.Queue`` of serialized packets for the multi
+    process executor. Once the queue's backlog passes `threshold` bytes, the
+    producer writes packets to segment files and only sends their
+    `SpillLocation` through the queue, so the backlog doesn't pile up in the
+    producer's memory. The consumer reads them back as it receives them.
+    """
+    def __init__(self, mp_queue, directory, name, threshold):
+        self.queue = mp_queue
+        self.directory = directory
+        self.name = name
+        self.threshold = threshold
+        self._average_size = 0.0  # Moving average of serialized packet sizes
+        self._writer = None  # Producer side
+        self._reader = None  # Consumer side
+
+    def _get_backlog_size(self):
+        try:
+            return self.queue.qsize() * self._average_size
+        except NotImplementedError:
+            return 0  # qsize() is unsupported on some platforms (e.g. OS X)
+
+    def put(self, serialized_packet, timeout=None):
+        self._average_size += (len(serialized_packet) - self._average_size) * 0.1
+
+        # Packets only go through the queue in order, so the producer can
+        # switch between spilling and not as the backlog changes
+        if self._get_backlog_size() >= self.threshold:
+            if self._writer is None:
+                self._writer = SegmentWriter(self.directory, self.name)
+
+            serialized_packet = self._writer.append(serialized_packet)
+
+        self.queue.put(serialized_packet, timeout=timeout)
+
+    def get(self, block=True, timeout=None):
+        item = self.queue.get(block, timeout)
+        if not isinstance(item, SpillLocation):
+            return item
+
+        if self._reader is None:
+            self._reader = SegmentReader(self.directory, self.name)
+
+        return self._reader.read(item)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader is not None:
+            self._reader.close(remove=True)
+
+        self.queue.close()
@@ -0,0 +1,92 @@
+"""
+Timers for the single process executor.
+
+All of a graph's timers are kept in a single heap, ordered by deadline, and
+fired by one greenlet that sleeps until the earliest of them. Components
+waiting with a timeout (or on thousands of window deadlines) therefore cost
+nothing until a timer is actually due.
+"""
+import heapq
+import itertools
+
+
+class Timer(object):
+    """
+    Timer handle, returned by `TimerHeap.schedule()`.
+    """
+    __slots__ = ('deadline', 'callback')
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+
+    def cancel(self):
+        """
+        Cancels the timer, if it hasn't fired yet.
+        """
+        self.callback = None
+
+    def is_cancelled(self):
+        return self.callback is None
+
+
+class TimerHeap(object):
+    """
+    Heap of timers, ordered by deadline. Cancelled timers stay in the heap
+    until they reach the top, so cancelling is O(1).
+    """
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()  # Orders timers with equal deadlines
+
+    def schedule(self, deadline, callback):
+        """
+        Schedules a callback.
+
+        Parameters
+        ----------
+        deadline : float
+            time (as returned by ``time.time()``) to call the callback at.
+        callback : callable
+            called without arguments once the deadline has passed.
+
+        Returns
+        -------
+        timer : ``Timer``
+            handle to cancel the timer with.
+        """
+        timer = Timer(deadline, callback)
+        heapq.heappush(self._heap, (deadline, next(self._sequence), timer))
+        return timer
+
+    def get_next_deadline(self):
+        """
+        Gets the deadline of the earliest timer, or None if there are none.
+        """
+        heap = self._heap
+        while heap and heap[0][2].is_cancelled():
+            heapq.heappop(heap)
+
+        return heap[0][0] if heap else None
+
+    def pop_expired(self, now):
+        """
+        Removes the timers whose deadline has passed.
+
+        Returns
+        -------
+        callbacks : list of callable
+            callbacks of the expired timers, earliest first.
+        """
+        callbacks = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)[2]
+            if not timer.is_cancelled():
+                callbacks.append(timer.callback)
+                timer.callback = None
+
+        return callbacks
+
+    def __len__(self):
+        return len(self._heap)
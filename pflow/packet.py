@@ -1,8 +1,74 @@
 from abc import ABCMeta, abstractmethod
+import array
 import json
+import struct
+import sys
+
+try:
+    import cPickle as pickle  # 2.x
+except ImportError:
+    import pickle  # 3.x
 
 DEFALT_PACKET_CHANNEL = 'default'
 
+_numpy = False  # numpy module (or None if it isn't installed), once imported
+
+
+def get_numpy():
+    """
+    Gets the numpy module, or None if it isn't installed.
+
+    NumPy is an optional dependency, which is only imported once a
+    `RecordBatch` first needs it.
+    """
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy as _numpy
+        except ImportError:
+            _numpy = None
+
+    return _numpy
+
+
+def is_batch_array(value):
+    """
+    Returns whether a value is a typed array, as held by a `RecordBatch`.
+    """
+    if isinstance(value, array.array):
+        return True
+
+    # If numpy hasn't been imported, value can't be one of its arrays
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def make_batch_array(values, typecode='d'):
+    """
+    Creates a typed array: a ``numpy.ndarray`` if NumPy is installed, or an
+    ``array.array`` otherwise.
+
+    Parameters
+    ----------
+    values : iterable
+        numbers to put in the array.
+    typecode : str
+        ``array`` type code (which is also a NumPy type character) of the
+        array's items, e.g. ``'d'`` for floats or ``'l'`` for integers.
+
+    Returns
+    -------
+    array : ``numpy.ndarray`` or ``array.array``
+    """
+    numpy = get_numpy()
+    if numpy is not None:
+        return numpy.asarray(values, dtype=typecode)
+
+    if isinstance(values, array.array) and values.typecode == typecode:
+        return values
+
+    return array.array(str(typecode), values)
+
 
 class Packet(object):
     """
@@ -14,6 +80,7 @@ class Packet(object):
         """
         self._value = value
         self._owner = None  # Component that owns this
+        self._share_count = 1  # Number of components yet to drop this (see `share()`)
         self.attrs = {}  # Named attributes
 
     @property
@@ -37,10 +104,90 @@ class Packet(object):
         raise ValueError("You can not change a packet's value. "
                          "Create a copy and drop this packet instead.")
 
+    def share(self, count):
+        """
+        Shares the packet between `count` components, e.g. the consumers of a
+        broadcast. The packet object itself is handed to each of them, so it
+        must not be modified (including its `attrs`). Its owner only releases
+        it once all of them have dropped it.
+
+        Parameters
+        ----------
+        count : int
+            number of components that will each drop the packet.
+        """
+        if count < 1:
+            raise ValueError('count must be positive')
+
+        self._share_count += count - 1
+
+    def estimate_size(self):
+        """
+        Estimates the number of bytes of memory used by the packet's value.
+
+        This is a cheap, shallow estimate: the items of a container value are
+        counted, but not anything they reference.
+
+        Returns
+        -------
+        size : int
+            estimated size in bytes.
+        """
+        value = self._value
+        size = sys.getsizeof(value)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            size += sum(sys.getsizeof(item) for item in value)
+        elif isinstance(value, dict):
+            size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+
+        return size
+
     def __repr__(self):
         return 'Packet({!r})'.format(self.value)
 
 
+class RecordBatch(Packet):
+    """
+    Data packet holding a batch of numbers in a typed array (see
+    `make_batch_array()`), so that they can be sent, and processed by
+    vectorised components, all at once.
+
+    Input ports only receive whole batches if they are created with
+    ``receive_batches=True``. Other ports split batches up, and receive
+    their values one at a time.
+    """
+    # Estimated bytes used by an empty array
+    _ARRAY_SIZE = sys.getsizeof(array.array('d'))
+
+    def __init__(self, values, typecode='d'):
+        """
+        values : iterable
+            numbers in the batch, or a typed array to hold as is.
+        typecode : str
+            type code of the numbers, unless `values` is already a typed
+            array.
+        """
+        if not is_batch_array(values):
+            values = make_batch_array(values, typecode)
+
+        super(RecordBatch, self).__init__(values)
+
+    @property
+    def typecode(self):
+        value = self._value
+        if isinstance(value, array.array):
+            return value.typecode
+
+        return value.dtype.char
+
+    def estimate_size(self):
+        value = self._value
+        return self._ARRAY_SIZE + len(value) * value.itemsize
+
+    def __repr__(self):
+        return 'RecordBatch({!r})'.format(self.value)
+
+
 # FIXME: make this singleton
 class EndOfStreamType(object):
     def __repr__(self):
@@ -111,6 +258,21 @@ class SwitchMapNamespace(ControlPacket):
         self.namespace = namespace
 
 
+class EndOfWorkUnit(ControlPacket):
+    """
+    Ends a unit of work sent to one replica of a component (see
+    `core.Graph.replicate()`).
+
+    Input ports don't return these to components: once the component asks for
+    its next packet (i.e. it finished processing the unit), the marker is
+    forwarded to its connected output ports instead, so that the replicas'
+    outputs can be merged back in `sequence` order.
+    """
+    def __init__(self, sequence=None):
+        super(EndOfWorkUnit, self).__init__()
+        self.sequence = sequence
+
+
 class PacketSerializer(object):
     """
     Responsible for serializing/deserializing packet data.
@@ -154,3 +316,120 @@ class NoopSerializer(PacketSerializer):
 
     def deserialize(self, serialized_packet):
         return Packet(serialized_packet)
+
+
+class BinaryPacketSerializer(PacketSerializer):
+    """
+    Compact binary serializer for packets that cross process boundaries.
+
+    Unlike the other serializers, this preserves the packet kind (data,
+    substream/map brackets and map namespaces) as well as packet `attrs`.
+
+    Each serialized packet starts with a single header byte describing the
+    packet kind and how the body is encoded:
+
+    * control packets without attrs have no body at all (1 byte total).
+    * ``bytes`` payloads without attrs are written raw, skipping pickle.
+    * everything else is pickled using the highest available protocol.
+
+    ``memoryview`` payloads can't be pickled, so they're copied and
+    deserialize as ``bytes``.
+    """
+    # Highest pickle protocol supported by this interpreter.
+    PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+    # Serializable packet kinds. The index of each class is its kind code, so
+    # only ever append to this list.
+    _kinds = [Packet, StartSubStream, EndSubStream, StartMap, EndMap,
+              SwitchMapNamespace, EndOfWorkUnit, RecordBatch]
+    _kind_codes = dict((kind, code) for code, kind in enumerate(_kinds))
+
+    # Header byte layout: kind code in the low 4 bits, flags in the rest.
+    _KIND_MASK = 0x0f
+    _HAS_ATTRS = 0x10
+    _HAS_BODY = 0x20
+    _RAW_BYTES = 0x40
+
+    _PACKET = _kind_codes[Packet]
+    _SWITCH_MAP_NAMESPACE = _kind_codes[SwitchMapNamespace]
+    _END_OF_WORK_UNIT = _kind_codes[EndOfWorkUnit]
+    _RECORD_BATCH = _kind_codes[RecordBatch]
+
+    # Pre-packed header bytes, indexed by header value (and vice versa).
+    _headers = [struct.pack('B', i) for i in range(256)]
+    _header_values = dict((h, i) for i, h in enumerate(_headers))
+
+    def _get_kind_code(self, packet):
+        packet_class = packet.__class__
+        for base_class in packet_class.__mro__:
+            if base_class in self._kind_codes:
+                return self._kind_codes[base_class]
+
+        raise ValueError('Unable to serialize packet type {}'.format(
+                         packet_class.__name__))
+
+    def serialize(self, packet):
+        if not isinstance(packet, Packet):
+            raise ValueError('packet must be a Packet')
+
+        header = self._kind_codes.get(packet.__class__)
+        if header is None:
+            header = self._get_kind_code(packet)
+
+        if header == self._PACKET or header == self._RECORD_BATCH:
+            payload = packet._value
+            if isinstance(payload, memoryview):
+                payload = payload.tobytes()
+        elif header == self._SWITCH_MAP_NAMESPACE:
+            payload = packet.namespace
+        elif header == self._END_OF_WORK_UNIT:
+            payload = packet.sequence
+        else:
+            payload = None
+
+        attrs = packet.attrs
+        if attrs:
+            header |= self._HAS_ATTRS | self._HAS_BODY
+            body = (payload, attrs)
+        elif payload is None:
+            return self._headers[header]
+        else:
+            header |= self._HAS_BODY
+            if type(payload) is bytes:
+                return self._headers[header | self._RAW_BYTES] + payload
+
+            body = payload
+
+        return self._headers[header] + pickle.dumps(body, self.PROTOCOL)
+
+    def deserialize(self, serialized_packet):
+        header = self._header_values[serialized_packet[:1]]
+        kind_code = header & self._KIND_MASK
+
+        payload = None
+        attrs = None
+        if header & self._RAW_BYTES:
+            payload = serialized_packet[1:]
+        elif header & self._HAS_BODY:
+            body = pickle.loads(serialized_packet[1:])
+
+            if header & self._HAS_ATTRS:
+                payload, attrs = body
+            else:
+                payload = body
+
+        if kind_code == self._PACKET:
+            packet = Packet(payload)
+        elif kind_code == self._SWITCH_MAP_NAMESPACE:
+            packet = SwitchMapNamespace(payload)
+        elif kind_code == self._END_OF_WORK_UNIT:
+            packet = EndOfWorkUnit(payload)
+        elif kind_code == self._RECORD_BATCH:
+            packet = RecordBatch(payload)
+        else:
+            packet = self._kinds[kind_code]()
+
+        if attrs:
+            packet.attrs = attrs
+
+        return packet
@@ -1,6 +1,9 @@
 __all__ = [
+    'cache',
     'grammar',
-    'nodes'
+    'nodes',
+    'parse'
 ]
 
-from . import grammar, nodes
+from . import cache, grammar, nodes
+from .cache import parse
@@ -0,0 +1,113 @@
+"""
+Cache of parsed FBP DSL scripts, keyed by a hash of the script content.
+
+Parsed graph definitions are kept in memory and written to disk (see
+``utils.get_cache_dir``), so that repeated runtime start-ups loading the same
+``.fbp`` files don't need to re-parse them.
+"""
+import os
+import json
+import hashlib
+import logging
+
+from . import grammar
+from .. import utils
+
+log = logging.getLogger(__name__)
+
+# Maximum number of parsed scripts to keep in memory.
+MAX_MEMORY_ENTRIES = 64
+
+# Serialized graph definitions, keyed by digest.
+_memory_cache = {}
+
+
+def get_digest(fbp_script):
+    """
+    Gets the cache key for an FBP script.
+    """
+    if not isinstance(fbp_script, bytes):
+        fbp_script = fbp_script.encode('utf-8')
+
+    digest = hashlib.sha1(fbp_script)
+    digest.update(b'\0' + str(grammar.GRAMMAR_VERSION).encode('ascii'))
+    return digest.hexdigest()
+
+
+def _read_cache_file(cache_path):
+    try:
+        with open(cache_path, 'r') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def _is_valid_entry(serialized):
+    """
+    Checks that a cache file holds a graph definition, rather than e.g. a
+    truncated write.
+    """
+    try:
+        graph_definition = json.loads(serialized)
+    except ValueError:
+        return False
+
+    return (isinstance(graph_definition, dict) and
+            isinstance(graph_definition.get('processes'), dict) and
+            isinstance(graph_definition.get('connections'), list))
+
+
+def _write_cache_file(cache_path, serialized):
+    try:
+        utils.write_file_atomic(cache_path, serialized)
+    except (IOError, OSError) as ex:
+        log.warn('Unable to write FBP parse cache file {}: {}'.format(
+                 cache_path, ex))
+
+
+def parse(fbp_script, use_cache=True, cache_dir=None):
+    """
+    Parses an FBP DSL script, using cached results where possible.
+
+    Parameters
+    ----------
+    fbp_script : str
+        the FBP DSL source.
+    use_cache : bool
+        whether to look up and store results in the cache.
+    cache_dir : str
+        directory for cache files. (default: ``utils.get_cache_dir('fbp')``)
+
+    Returns
+    -------
+    graph_definition : dict
+        the graph definition, in FBP JSON graph format. This is a new object
+        on every call, so callers are free to modify it.
+    """
+    if not use_cache:
+        return grammar.parse(fbp_script)
+
+    digest = get_digest(fbp_script)
+
+    serialized = _memory_cache.get(digest)
+    if serialized is None:
+        if cache_dir is None:
+            cache_dir = utils.get_cache_dir('fbp')
+        cache_path = os.path.join(cache_dir, digest + '.json')
+
+        serialized = _read_cache_file(cache_path)
+        if serialized is not None and not _is_valid_entry(serialized):
+            log.warn('Ignoring corrupt FBP parse cache file {}'.format(
+                     cache_path))
+            serialized = None
+
+        if serialized is None:
+            log.debug('FBP parse cache miss: {}'.format(digest))
+            serialized = json.dumps(grammar.parse(fbp_script))
+            _write_cache_file(cache_path, serialized)
+
+        if len(_memory_cache) >= MAX_MEMORY_ENTRIES:
+            _memory_cache.clear()
+        _memory_cache[digest] = serialized
+
+    return json.loads(serialized)
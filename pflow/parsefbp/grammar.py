@@ -1,44 +1,359 @@
-import pyparsing
-from pyparsing import \
-    Forward, Group, Combine, Suppress, StringEnd, \
-    Optional, ZeroOrMore, OneOrMore, oneOf, \
-    operatorPrecedence, opAssoc, \
-    Word, Literal, CaselessLiteral, Regex, \
-    alphas, nums, alphanums, quotedString, \
-    restOfLine, quotedString, delimitedList, \
-    ParseResults, ParseException
-
-# Refs:
-# https://github.com/jpaulm/parsefbp
-# https://github.com/noflo/fbp#readme
-
-'''
-#comment
-INPORT=A.IN:G_IN
-OUTPORT=C.OUT:G_OUT
-'IIP' -> IN A(Component1) OUT -> IN C(Component3)
-A() OUT -> IN B(Component2:bar)
-A OUT -> IN B()
-A OUT -> IN B, C OUT -> IN D(Component4:foo=bar,baz=123)
-'''
-
-INPORT = CaselessLiteral('INPORT')
-OUTPORT = CaselessLiteral('OUTPORT')
-ARROW = Literal('->')
-COLON = Literal(':')
-COMMA = Literal(',')
-EQUALS = Literal('=')
-
-# comment =
-
-# inoutPortAssignExpr =
-# inportStmt =
-# outportStmt =
-
-# initialPacketLiteral =
-# portName =
-# componentName =
-# processExpr =
-# metaExpr =
-
-# connectionExpr =
+"""
+Parser for the FBP DSL.
+
+Refs:
+https://github.com/jpaulm/parsefbp
+https://github.com/noflo/fbp#readme
+
+Example::
+
+    # comment
+    INPORT=A.IN:G_IN
+    OUTPORT=C.OUT:G_OUT
+    'IIP' -> IN A(Component1) OUT -> IN C(Component3)
+    A() OUT -> IN B(Component2:bar)
+    A OUT -> IN B()
+    A OUT -> IN B, C OUT -> IN D(Component4:foo=bar,baz=123)
+
+Parsing is done by a single regex scanner feeding a hand-written parser, so it
+runs in linear time without any backtracking. The result is a graph definition
+dict in the FBP JSON graph format (the same format accepted by
+``Graph.load_json_dict``).
+"""
+import re
+import collections
+
+from .. import exc
+
+# Bump this whenever the output of parse() changes, so that stale cache
+# entries are ignored.
+GRAMMAR_VERSION = 2
+
+DEFAULT_OUTPORT = 'OUT'
+DEFAULT_INPORT = 'IN'
+
+_WORD = r'\w+(?:[.\-/]\w+)*'
+
+_token_regex = re.compile(r'''
+    (?P<WHITESPACE>[ \t\r\f]+) |
+    (?P<COMMENT>\#[^\n]*) |
+    (?P<NEWLINE>\n) |
+    (?P<COMMA>,) |
+    (?P<ARROW>->) |
+    (?P<IIP>'(?:[^'\\]|\\.)*') |
+    (?P<EXPORT>(?:INPORT|OUTPORT|inport|outport)=(?P<EXPORT_PROCESS>{word})\.(?P<EXPORT_PORT>\w+):(?P<EXPORT_NAME>\w+)) |
+    (?P<WORD>{word}) |
+    (?P<COMPONENT>\((?P<COMPONENT_SPEC>[^()\n]*)\)) |
+    (?P<INDEX>\[(?P<INDEX_VALUE>\d+)\]) |
+    (?P<ERROR>.)
+'''.format(word=_WORD), re.VERBOSE)
+
+
+class _Word(object):
+    """
+    A process or port name within a connection, with its optional component
+    spec (processes only) or array index (ports only).
+    """
+    __slots__ = ('name', 'component', 'index', 'line', 'column')
+
+    def __init__(self, name, line, column):
+        self.name = name
+        self.component = None
+        self.index = None
+        self.line = line
+        self.column = column
+
+
+class _Literal(object):
+    """
+    An initial packet (IIP) literal.
+    """
+    __slots__ = ('data', 'line', 'column')
+
+    def __init__(self, data, line, column):
+        self.data = data
+        self.line = line
+        self.column = column
+
+
+def _decode_iip(literal):
+    """
+    IIPs are string literals in the DSL: components receive them as strings,
+    even when they look like numbers or other JSON values.
+    """
+    return literal[1:-1].replace("\\'", "'")
+
+
+def _parse_metadata(spec):
+    metadata = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+
+        key, sep, value = item.partition('=')
+        if sep:
+            metadata[key.strip()] = value.strip()
+        else:
+            # Bare flag, e.g. Component:foo
+            metadata[key] = True
+
+    return metadata
+
+
+class _GraphBuilder(object):
+    """
+    Accumulates parsed statements into an FBP JSON graph definition.
+    """
+    def __init__(self):
+        self.processes = collections.OrderedDict()
+        self.connections = []
+        self.inports = collections.OrderedDict()
+        self.outports = collections.OrderedDict()
+
+    def add_process(self, word):
+        process = self.processes.get(word.name)
+        if process is None:
+            process = self.processes[word.name] = {'component': None,
+                                                   'metadata': {}}
+
+        if word.component:
+            component, _, spec = word.component.partition(':')
+            component = component.strip()
+
+            if process['component'] is None:
+                process['component'] = component
+            elif process['component'] != component:
+                raise exc.FbpSyntaxError(
+                    'process {} was already declared as {}'.format(
+                        word.name, process['component']),
+                    word.line, word.column)
+
+            process['metadata'].update(_parse_metadata(spec))
+
+        return word.name
+
+    def add_export(self, match, line, column):
+        exports = (self.inports
+                   if match.group('EXPORT').upper().startswith('INPORT')
+                   else self.outports)
+
+        name = match.group('EXPORT_NAME')
+        if name in exports:
+            raise exc.FbpSyntaxError('port {} was already exported'.format(name),
+                                     line, column)
+
+        exports[name] = {
+            'process': match.group('EXPORT_PROCESS'),
+            'port': match.group('EXPORT_PORT')
+        }
+
+    def _endpoint(self, process_word, port_word, default_port):
+        process = self.add_process(process_word)
+        if port_word is None:
+            return {'process': process, 'port': default_port}
+
+        if port_word.component is not None:
+            raise exc.FbpSyntaxError('port {} can not have a component'.format(
+                                     port_word.name),
+                                     port_word.line, port_word.column)
+
+        endpoint = {'process': process, 'port': port_word.name}
+        if port_word.index is not None:
+            endpoint['index'] = port_word.index
+
+        return endpoint
+
+    def _check_process(self, word):
+        if word.index is not None:
+            raise exc.FbpSyntaxError('process {} can not have an index'.format(
+                                     word.name), word.line, word.column)
+
+    def add_statement(self, segments, line):
+        """
+        Adds a statement made up of segments separated by arrows, e.g.
+        ``'IIP' -> IN A OUT -> IN B``
+        has the segments ``['IIP']``, ``[IN, A, OUT]`` and ``[IN, B]``.
+        """
+        last = len(segments) - 1
+        source = None
+
+        for i, segment in enumerate(segments):
+            if not segment:
+                raise exc.FbpSyntaxError('expected a process or port name', line, 0)
+
+            if isinstance(segment[0], _Literal):
+                if i != 0 or len(segment) != 1:
+                    raise exc.FbpSyntaxError('initial packets may only appear at '
+                                             'the start of a connection',
+                                             segment[0].line, segment[0].column)
+                if last == 0:
+                    raise exc.FbpSyntaxError('initial packet is not connected to '
+                                             'anything',
+                                             segment[0].line, segment[0].column)
+                source = {'data': segment[0].data}
+                continue
+
+            # Everything else is a list of words
+            for word in segment:
+                if isinstance(word, _Literal):
+                    raise exc.FbpSyntaxError('unexpected initial packet',
+                                             word.line, word.column)
+
+            if i == 0:
+                # PROCESS [OUTPORT]
+                if len(segment) > 2:
+                    raise exc.FbpSyntaxError('expected PROCESS [PORT]',
+                                             segment[2].line, segment[2].column)
+                self._check_process(segment[0])
+                if last == 0:
+                    # Standalone process declaration
+                    if len(segment) != 1:
+                        raise exc.FbpSyntaxError('unexpected port name',
+                                                 segment[1].line, segment[1].column)
+                    self.add_process(segment[0])
+                    return
+
+                outport = segment[1] if len(segment) > 1 else None
+                source = self._endpoint(segment[0], outport, DEFAULT_OUTPORT)
+                continue
+
+            # [INPORT] PROCESS [OUTPORT]
+            if i == last:
+                if len(segment) > 2:
+                    raise exc.FbpSyntaxError('expected [PORT] PROCESS',
+                                             segment[2].line, segment[2].column)
+                inport, process = ((None,) + tuple(segment))[-2:]
+                outport = None
+            else:
+                if len(segment) == 3:
+                    inport, process, outport = segment
+                elif len(segment) == 2:
+                    inport, process = segment
+                    outport = None
+                else:
+                    raise exc.FbpSyntaxError('expected PORT PROCESS [PORT]',
+                                             segment[0].line, segment[0].column)
+
+            self._check_process(process)
+            target = self._endpoint(process, inport, DEFAULT_INPORT)
+
+            connection = {'tgt': target}
+            if 'data' in source:
+                connection['data'] = source['data']
+            else:
+                connection['src'] = source
+            self.connections.append(connection)
+
+            if i != last:
+                source = self._endpoint(process, outport, DEFAULT_OUTPORT)
+
+    def build(self):
+        for name, process in self.processes.items():
+            if process['component'] is None:
+                raise exc.FbpSyntaxError('no component was specified for '
+                                         'process {}'.format(name))
+
+        for exports in (self.inports, self.outports):
+            for name, export in exports.items():
+                if export['process'] not in self.processes:
+                    raise exc.FbpSyntaxError('exported port {} refers to unknown '
+                                             'process {}'.format(name, export['process']))
+
+        return collections.OrderedDict([
+            ('processes', self.processes),
+            ('connections', self.connections),
+            ('inports', self.inports),
+            ('outports', self.outports)
+        ])
+
+
+def parse(fbp_script):
+    """
+    Parses an FBP DSL script.
+
+    Parameters
+    ----------
+    fbp_script : str
+        the FBP DSL source.
+
+    Returns
+    -------
+    graph_definition : dict
+        the graph definition, in FBP JSON graph format.
+
+    Raises
+    ------
+    exc.FbpSyntaxError
+        if the script could not be parsed.
+    """
+    builder = _GraphBuilder()
+
+    segments = [[]]
+    statement_line = line = 1
+    line_start = 0
+    after_arrow = False
+
+    def end_statement():
+        if len(segments) > 1 or segments[0]:
+            if after_arrow:
+                raise exc.FbpSyntaxError('connection is missing a target',
+                                         line, 0)
+            builder.add_statement(segments, statement_line)
+
+        del segments[:]
+        segments.append([])
+
+    for match in _token_regex.finditer(fbp_script):
+        kind = match.lastgroup
+        column = match.start() - line_start + 1
+
+        if kind == 'WHITESPACE' or kind == 'COMMENT':
+            continue
+        elif kind == 'NEWLINE':
+            if not after_arrow:
+                end_statement()
+            line += 1
+            line_start = match.end()
+            if not after_arrow:
+                statement_line = line
+        elif kind == 'COMMA':
+            end_statement()
+            statement_line = line
+        elif kind == 'ARROW':
+            if after_arrow or not segments[-1]:
+                raise exc.FbpSyntaxError('unexpected ->', line, column)
+            segments.append([])
+            after_arrow = True
+        elif kind == 'IIP':
+            segments[-1].append(_Literal(_decode_iip(match.group('IIP')),
+                                         line, column))
+            after_arrow = False
+        elif kind == 'EXPORT':
+            if len(segments) > 1 or segments[0]:
+                raise exc.FbpSyntaxError('exports must be on their own line',
+                                         line, column)
+            builder.add_export(match, line, column)
+        elif kind == 'WORD':
+            segments[-1].append(_Word(match.group('WORD'), line, column))
+            after_arrow = False
+        elif kind == 'COMPONENT':
+            segment = segments[-1]
+            if not segment or not isinstance(segment[-1], _Word) or \
+                    segment[-1].component is not None:
+                raise exc.FbpSyntaxError('unexpected component specification',
+                                         line, column)
+            segment[-1].component = match.group('COMPONENT_SPEC')
+        elif kind == 'INDEX':
+            segment = segments[-1]
+            if not segment or not isinstance(segment[-1], _Word) or \
+                    segment[-1].index is not None:
+                raise exc.FbpSyntaxError('unexpected array port index',
+                                         line, column)
+            segment[-1].index = int(match.group('INDEX_VALUE'))
+        else:
+            raise exc.FbpSyntaxError('unexpected character {!r}'.format(
+                                     match.group()), line, column)
+
+    end_statement()
+    return builder.build()
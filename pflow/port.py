@@ -9,11 +9,27 @@ except ImportError:
     from Queue import Queue  # 2.x
 
 from .packet import (EndOfStream, Packet, StartSubStream, EndSubStream,
-                     StartMap, EndMap, SwitchMapNamespace)
+                     StartMap, EndMap, SwitchMapNamespace, EndOfWorkUnit,
+                     RecordBatch)
 from . import exc
 
 log = logging.getLogger(__name__)
 
+_class_loggers = {}
+
+
+def _get_class_logger(cls):
+    """
+    Gets the logger for a port class. Loggers are cached per class, since
+    ports are created in large numbers when building big graphs.
+    """
+    logger = _class_loggers.get(cls)
+    if logger is None:
+        logger = _class_loggers[cls] = logging.getLogger(
+            '%s.%s' % (cls.__module__, cls.__name__))
+
+    return logger
+
 
 class BasePort(object):
     __metaclass__ = ABCMeta
@@ -22,6 +38,8 @@ class BasePort(object):
 class Port(BasePort):
     __metaclass__ = ABCMeta
 
+    array_port = None  # Owning ArrayPort, if this is one of its elements
+
     def __init__(self, name, description=None, optional=True,
                  allowed_types=None, default=None):
         """
@@ -71,8 +89,7 @@ class Port(BasePort):
         self._is_open = True
         self.proxied_port = None
 
-        self.log = logging.getLogger('%s.%s' % (self.__class__.__module__,
-                                                self.__class__.__name__))
+        self.log = _get_class_logger(self.__class__)
 
     def supports_type(self, type_):
         if not isinstance(type_, type):
@@ -135,7 +152,12 @@ class InputPort(Port):
     Leads from either an OutputPort of an upstream component or an initial
     Packet.
     """
-    def __init__(self, name='IN', max_queue_size=None, **kwargs):
+    # Should `packet.EndOfWorkUnit` markers be forwarded to the component's
+    # outputs rather than received? Only merges of replicas receive them.
+    forward_work_units = True
+
+    def __init__(self, name='IN', max_queue_size=None, spill_threshold=None,
+                 receive_batches=False, **kwargs):
         super(InputPort, self).__init__(name, **kwargs)
 
         self.source_port = None
@@ -145,11 +167,38 @@ class InputPort(Port):
         # to block on send_packet() when the queue is full.
         self.max_queue_size = max_queue_size
 
+        # If spill_threshold is set, packets queued on this port beyond that
+        # many (estimated) bytes are spilled to disk until the component
+        # catches up, rather than being kept in memory. Spilled packets
+        # still count towards max_queue_size.
+        self.spill_threshold = spill_threshold
+
+        # Unless receive_batches is set, `packet.RecordBatch` packets are
+        # split up, and their values received one at a time, so that
+        # components which expect scalars can be sent batches.
+        self.receive_batches = receive_batches
+        self._batch_values = collections.deque()  # Values left of a split batch
+
     def is_connected(self):
         return (self.component is not None and
                 (self.source_port is not None or
                  self.proxied_port is not None))
 
+    def _split_batch(self, batch):
+        """
+        Splits a batch received on this port, keeping its values to be
+        received in turn.
+
+        Returns
+        -------
+        packet : ``Packet`` or None
+            packet of the first value, or None if the batch is empty.
+        """
+        self._batch_values.extend(batch.value.tolist())
+        self.component.drop_packet(batch)
+        if self._batch_values:
+            return self.component.create_packet(self._batch_values.popleft())
+
     def receive_packet(self, timeout=None):
         """
         Receive the next Packet from this input port.
@@ -165,11 +214,29 @@ class InputPort(Port):
         else:
             self._check_ready_state()
 
-        packet = self.component.executor.receive_port(self.component,
-                                                      self.name,
-                                                      timeout=timeout)
+        if self._batch_values:
+            return self.component.create_packet(self._batch_values.popleft())
 
-        return packet
+        executor = self.component.executor
+        while True:
+            packet = executor.receive_port(self.component,
+                                           self.name,
+                                           timeout=timeout)
+
+            tracer = executor.tracer
+            if tracer is not None and packet is not EndOfStream:
+                tracer.on_receive(self.component, packet)
+
+            if isinstance(packet, EndOfWorkUnit) and self.forward_work_units:
+                # The component has finished processing the unit of work, so
+                # mark the end of its results
+                self.component.broadcast_packet(packet, self.component.outputs)
+            elif isinstance(packet, RecordBatch) and not self.receive_batches:
+                packet = self._split_batch(packet)
+                if packet is not None:
+                    return packet
+            else:
+                return packet
 
     def receive(self, timeout=None):
         """
@@ -196,22 +263,41 @@ class InputPort(Port):
         if self.is_open():
             self.component.executor.close_input_port(self.component, self.name)
 
+        self._batch_values.clear()
         super(InputPort, self).close()
 
 
 # FIXME: make this a mixin and have ArrayInputPort inherit from InputPort?
 # would give cleaner validation: isinstance(InputPort).
 class ArrayPort(BasePort):
+    """
+    Fixed-size array of ports, addressed by index (e.g. ``OUT[0]`` in the FBP
+    DSL). Each element is a regular port named ``{name}_{index}``, so
+    executors handle them like any other port.
+    """
     __metaclass__ = ABCMeta
 
     def __init__(self, name, max_ports, **kwargs):
+        """
+        Parameters
+        ----------
+        name : str
+            the unique (per-component) name of this port.
+        max_ports : int
+            number of elements in the array.
+        kwargs :
+            arguments for each element port (e.g. `description`).
+        """
         if not isinstance(name, basestring):
             raise ValueError('name must be a string')
 
-        self._name = name
+        if not isinstance(max_ports, int) or max_ports < 1:
+            raise ValueError('max_ports must be a positive int')
+
+        self.name = name
         self._max_ports = max_ports
         self._kwargs = kwargs
-
+        self._component = None  # Owning component
         self._ports = []
         self._allocate()
 
@@ -222,22 +308,73 @@ class ArrayPort(BasePort):
         self._ports = []
         port_class = self.get_port_class()
         for i in range(self._max_ports):
-            self._ports.append(port_class('{}_{:d}'.format(self._name, i),
-                                          **self._kwargs))
+            port = port_class('{}_{:d}'.format(self.name, i), **self._kwargs)
+            port.array_port = self
+            self._ports.append(port)
 
     @abstractmethod
     def get_port_class(self):
         return Port  # Make IDE shut up
 
+    @property
+    def component(self):
+        return self._component
+
+    @component.setter
+    def component(self, component):
+        self._component = component
+        for port in self._ports:
+            port.component = component
+
+    @property
+    def description(self):
+        return self._ports[0].description
+
+    @property
+    def optional(self):
+        return self._ports[0].optional
+
+    @property
+    def default(self):
+        return self._ports[0].default
+
+    @property
+    def allowed_types(self):
+        return self._ports[0].allowed_types
+
+    @property
+    def id(self):
+        if self.component is not None:
+            component_name = self.component.name
+        else:
+            component_name = '(no_component)'
+
+        return '%s.%s' % (component_name, self.name)
+
+    def is_connected(self):
+        return any(port.is_connected() for port in self._ports)
+
+    def get_connected_ports(self):
+        """
+        Gets the elements that are connected, in index order.
+        """
+        return [port for port in self._ports if port.is_connected()]
+
     def __getitem__(self, index):
         return self._ports[index]
 
     def __iter__(self):
         return iter(self._ports)
 
+    def __len__(self):
+        return len(self._ports)
+
+    def __str__(self):
+        return '%s(%s[%d])' % (self.__class__.__name__, self.id,
+                               self._max_ports)
+
 
 class ArrayInputPort(ArrayPort):
-    @abstractmethod
     def get_port_class(self):
         return InputPort
 
@@ -251,6 +388,7 @@ class OutputPort(Port):
         super(OutputPort, self).__init__(name, **kwargs)
         self._bracket_depth = 0
         self.target_port = None
+        self.proxied_outport = None  # Port of a subgraph component this port exports
 
     def is_connected(self):
         return (self.component is not None and
@@ -287,8 +425,24 @@ class OutputPort(Port):
             self.component.owned_packet_count += 1
 
         executor = self.component.executor
+        tracer = executor.tracer
+        if tracer is not None and self.proxied_outport is None:
+            # Ports exported by subgraphs forward packets that were traced
+            # when their components sent them
+            packet = tracer.on_send(self.component, packet)
+
         executor.send_port(self.component, self.name, packet)
 
+    def _send_proxied(self, packet):
+        """
+        Sends a packet over the port of a graph that exports this port.
+        """
+        tracer = self.component.executor.tracer
+        if tracer is not None:
+            packet = tracer.on_send(self.component, packet)
+
+        self.proxied_port.send_packet(packet)
+
     def send(self, value):
         if self.proxied_port is None:
             packet = self.component.create_packet(value)
@@ -296,7 +450,25 @@ class OutputPort(Port):
         else:
             #self.log.info('proxy:send(%s)' % value)
             packet = self.component.create_packet(value)
-            self.proxied_port.send_packet(packet)
+            self._send_proxied(packet)
+
+    def send_batch(self, values, typecode='d'):
+        """
+        Send a batch of numbers over this output port, as a single
+        ``packet.RecordBatch``.
+
+        Parameters
+        ----------
+        values : iterable
+            numbers to send, or a typed array of them.
+        typecode : str
+            type code of the numbers (see ``packet.make_batch_array()``).
+        """
+        packet = self.component.create_batch(values, typecode)
+        if self.proxied_port is None:
+            self.send_packet(packet)
+        else:
+            self._send_proxied(packet)
 
     def start_substream(self):
         self._bracket_depth += 1
@@ -354,9 +526,29 @@ class OutputPort(Port):
 
 
 class ArrayOutputPort(ArrayPort):
-    @abstractmethod
     def get_port_class(self):
-        return InputPort
+        return OutputPort
+
+    def broadcast_packet(self, packet):
+        """
+        Send a single packet to every connected element of this port.
+
+        The packet itself (rather than a copy) is handed to each downstream
+        component, and is only released by its owner once all of them have
+        dropped it. See `core.Component.broadcast_packet()`.
+
+        Parameters
+        ----------
+        packet : ``Packet``
+            the Packet to send.
+        """
+        self.component.broadcast_packet(packet, self._ports)
+
+    def broadcast(self, value):
+        """
+        Send a value to every connected element of this port.
+        """
+        self.broadcast_packet(self.component.create_packet(value))
 
 
 class PortRegistry(object):
@@ -364,13 +556,13 @@ class PortRegistry(object):
     Per-component port registry descriptor.
     """
     def __init__(self, component, port_type, array_port_type):
-        self._ports = collections.OrderedDict()
+        self._ports = collections.OrderedDict()  # Ports (and array port elements) by name
+        self._array_ports = {}  # Array ports by name
         self._component = component
         self._port_type = port_type
         self._array_port_type = array_port_type
         self._required_superclasses = (port_type, array_port_type)
-        self.log = logging.getLogger('%s.%s' % (self.__class__.__module__,
-                                                self.__class__.__name__))
+        self.log = _get_class_logger(self.__class__)
 
         if not issubclass(port_type, BasePort):
             raise ValueError('port_type must be Port subclass')
@@ -387,15 +579,25 @@ class PortRegistry(object):
                 raise ValueError('{} must be an instance of: {}'.format(
                                  port, ', '.join([c.__name__ for c in self._required_superclasses])))
 
-            if port.name in self._ports:
-                raise ValueError('{} already exists'.format(port))
+            if isinstance(port, ArrayPort):
+                elements = list(port)
+            else:
+                elements = [port]
+
+            for element in [port] + elements:
+                if element.name in self._ports or element.name in self._array_ports:
+                    raise ValueError('{} already exists'.format(element))
 
             if port.component is not None and port.component != self._component:
                 raise ValueError('{} is already attached to {}'.format(
                                  port, port.component))
 
             port.component = self._component
-            self._ports[port.name] = port
+            if isinstance(port, ArrayPort):
+                self._array_ports[port.name] = port
+
+            for element in elements:
+                self._ports[element.name] = element
 
         return self
 
@@ -445,6 +647,7 @@ class PortRegistry(object):
                                                            port))
 
         self.add_ports(port)
+        self._component._invalidate_topology()
         return port
 
     def __getitem__(self, port_name):
@@ -457,7 +660,7 @@ class PortRegistry(object):
             raise ValueError('key must be a string')
 
         try:
-            return self._ports[port_name]
+            return self._array_ports.get(port_name) or self._ports[port_name]
         except KeyError:
             if self._component.state == ComponentState.NOT_INITIALIZED:
                 raise exc.ComponentStateError(self._component,
@@ -475,6 +678,20 @@ class PortRegistry(object):
 
         self.add(port)
 
+    def get_declared_ports(self):
+        """
+        Gets the ports as they were added, with array ports in place of their
+        elements. (Iterating over the registry yields the elements instead.)
+        """
+        ports = []
+        for port in self._ports.values():
+            if port.array_port is None:
+                ports.append(port)
+            elif port.array_port not in ports:
+                ports.append(port.array_port)
+
+        return ports
+
     def __iter__(self):
         return iter(self._ports.values())
 
@@ -1,26 +1,24 @@
 #!/usr/bin/env python
-from .executors.single_process import SingleProcessGraphExecutor
-
 import os
 import sys
-import uuid
+import time
 import logging
-import socket
 import json
+import hashlib
+import importlib
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
 import inspect
 import functools
 import textwrap
 
-import argparse
-import requests
-import gevent
-import geventwebsocket
-
 import pflow.components
 from . import exc, core, utils
 
+# gevent, geventwebsocket, requests and uuid (and the executors that depend
+# on gevent) are imported where they are used, so that importing this module
+# stays cheap for tools that don't run the server.
+
 log = logging.getLogger(__name__)
 
 
@@ -31,6 +29,29 @@ class Runtime(object):
     """
     PROTOCOL_VERSION = '0.5'
 
+    # Bump this whenever the format of component specs changes, so that
+    # stale specs in the on-disk cache are ignored.
+    SPEC_VERSION = 1
+
+    # Should component specs be cached on disk?
+    USE_SPEC_CACHE = True
+
+    # Graph protocol commands supported by apply_graph_commands()
+    GRAPH_COMMANDS = frozenset(['clear', 'addnode', 'removenode', 'addedge',
+                                'removeedge', 'addinitial', 'removeinitial',
+                                'addinport', 'addoutport', 'changenode'])
+
+    # Max number of graphs that may execute at the same time. Graphs started
+    # beyond this limit wait (as started, but not running) for a running graph
+    # to finish. Set to None for no limit.
+    MAX_RUNNING_GRAPHS = 8
+
+    # Max estimated bytes of in-flight packets across all graphs. Once it is
+    # reached, the components with the most bytes in flight are throttled
+    # until their consumers catch up. Set to None for no limit. Only single
+    # process executors support memory budgets.
+    MEMORY_BUDGET = None
+
     # Mapping of native Python types to FBP protocol types
     _type_map = {
         str: 'string',
@@ -50,13 +71,37 @@ class Runtime(object):
         #buffer
     }
 
-    def __init__(self, executor_class=SingleProcessGraphExecutor):
+    def __init__(self, executor_class=None, spec_cache_dir=None):
+        """
+        Parameters
+        ----------
+        executor_class : type
+            ``GraphExecutor`` subclass used to run graphs.
+            (default: ``SingleProcessGraphExecutor``)
+        spec_cache_dir : str
+            directory for cached component specs.
+            (default: ``utils.get_cache_dir('specs')``)
+        """
         self.log = logging.getLogger('%s.%s' % (self.__class__.__module__,
                                                 self.__class__.__name__))
 
         self._components = {}  # Component metadata, keyed by component name
+        self._pending_modules = OrderedDict()  # Modules to register on first use, with their overwrite flag
+        self._spec_cache_dir = spec_cache_dir or utils.get_cache_dir('specs')
+        self._spec_cache = {}  # Cached specs loaded from disk, keyed by module name
+        self._source_digests = {}  # Digests of source files, keyed by path
         self._graphs = {}  # Graph instances, keyed by graph ID
         self._executors = {}  # GraphExecutor instances, keyed by graph ID
+        self._execution_greenlets = {}  # Greenlets running executors, keyed by graph ID
+        self._start_times = {}  # Time each running graph began executing, keyed by graph ID
+        self._edge_inspectors = {}  # EdgeInspectors for graphs with watched edges, keyed by graph ID
+
+        self._running_slots = None  # Semaphore limiting running graphs (created on first start)
+        self._memory_budget = None  # MemoryBudget shared by all graphs (created on first start)
+
+        if executor_class is None:
+            from .executors.single_process import SingleProcessGraphExecutor
+            executor_class = SingleProcessGraphExecutor
 
         self.executor_class = executor_class
 
@@ -93,12 +138,59 @@ class Runtime(object):
         }
 
     def get_all_component_specs(self):
+        """
+        Gets the specs of all registered components, registering any pending
+        modules first.
+
+        Returns
+        -------
+        specs : dict
+            FBP protocol component specs, keyed by component name.
+        """
+        self._register_pending_modules()
+
         specs = {}
+        dirty_modules = set()
         for component_name, component_options in self._components.iteritems():
+            if component_options['spec'] is None:
+                component_options['spec'] = self._get_component_spec(
+                    component_name, component_options['class'], dirty_modules)
+
             specs[component_name] = component_options['spec']
 
+        for module_name in dirty_modules:
+            self._write_spec_cache(module_name)
+
         return specs
 
+    def get_component_class(self, component_name):
+        """
+        Gets a registered component class by name, registering its module
+        first if it is pending.
+
+        Parameters
+        ----------
+        component_name : str
+            the long component name (``'package.module/Class'``).
+
+        Returns
+        -------
+        component_class : type
+            the ``Component`` subclass.
+        """
+        if component_name not in self._components:
+            module_name = component_name.split('/', 1)[0]
+            if module_name in self._pending_modules:
+                self._register_pending_modules(module_name)
+            else:
+                self._register_pending_modules()
+
+        try:
+            return self._components[component_name]['class']
+        except KeyError:
+            raise ValueError('Component {} is not registered'.format(
+                component_name))
+
     def register_component(self, component_class, overwrite=False):
         """
         Registers a component class.
@@ -112,7 +204,6 @@ class Runtime(object):
                              'from Component')
 
         long_name = self._long_class_name(component_class)
-        short_name = self._short_class_name(component_class)
 
         if long_name in self._components and not overwrite:
             raise ValueError("Component {0} already registered".format(
@@ -122,7 +213,7 @@ class Runtime(object):
 
         self._components[long_name] = {
             'class': component_class,
-            'spec': self._create_component_spec(long_name, component_class)
+            'spec': None  # Created on demand by get_all_component_specs()
         }
 
     def _long_class_name(self, component_class):
@@ -134,18 +225,41 @@ class Runtime(object):
 
     def register_module(self, module, overwrite=False):
         """
+        Registers all of the components in a module.
 
-        :param module:
-        :param collection:
-        :param overwrite:
-        """
-        if isinstance(module, basestring):
-            module = __import__(module)
+        Registration is deferred: the module is only imported and searched
+        for components when a client first needs them (e.g. to list
+        components or to add a node).
 
-        if not inspect.ismodule(module):
+        :param module: a module, or the name of a module.
+        :param overwrite: should existing components be overwritten? if not,
+                a ValueError will be raised if a component already exists.
+        """
+        if inspect.ismodule(module):
+            module = module.__name__
+        elif not isinstance(module, basestring):
             raise ValueError('module must be either a module or the name of a '
                              'module')
 
+        self._pending_modules[module] = overwrite
+
+    def _register_pending_modules(self, module_name=None):
+        """
+        Registers the components of pending modules.
+
+        :param module_name: only register this module. (default: all)
+        """
+        if module_name is None:
+            module_names = list(self._pending_modules)
+        else:
+            module_names = [module_name]
+
+        for module_name in module_names:
+            module = importlib.import_module(module_name)
+            overwrite = self._pending_modules.pop(module_name)
+            self._register_module_components(module, overwrite)
+
+    def _register_module_components(self, module, overwrite=False):
         self.log.debug('Registering components in module: {}'.format(
             module.__name__))
 
@@ -164,6 +278,92 @@ class Runtime(object):
             self.log.warn('No components were found in module: {}'.format(
                 module.__name__))
 
+    def _get_source_digest(self, component_class):
+        """
+        Digest of the source files defining a component class and its base
+        classes, which is what a component spec is derived from, or None if
+        one of them can't be read (e.g. modules loaded from a zip file).
+        """
+        digest = hashlib.sha1(str(self.SPEC_VERSION))
+        for cls in inspect.getmro(component_class):
+            module = sys.modules.get(cls.__module__)
+            file_path = getattr(module, '__file__', None)
+            if file_path is None:
+                continue  # Built-in
+
+            if file_path.endswith(('.pyc', '.pyo')):
+                file_path = file_path[:-1]
+
+            file_digest = self._source_digests.get(file_path)
+            if file_digest is None:
+                try:
+                    with open(file_path, 'rb') as f:
+                        file_digest = hashlib.sha1(f.read()).hexdigest()
+                except (IOError, OSError):
+                    # Source is unavailable, so fall back to the compiled
+                    # module's modification time.
+                    try:
+                        file_digest = repr(os.path.getmtime(module.__file__))
+                    except (IOError, OSError):
+                        return None
+
+                self._source_digests[file_path] = file_digest
+
+            digest.update('\0{}.{}:{}'.format(cls.__module__, cls.__name__,
+                                               file_digest))
+
+        return digest.hexdigest()
+
+    def _get_spec_cache(self, module_name):
+        cache = self._spec_cache.get(module_name)
+        if cache is None:
+            cache = {}
+            if self.USE_SPEC_CACHE:
+                cache_path = os.path.join(self._spec_cache_dir,
+                                          module_name + '.json')
+                try:
+                    with open(cache_path, 'r') as f:
+                        cache = json.load(f)
+                except (IOError, OSError, ValueError):
+                    pass  # Not cached yet (or unreadable)
+
+            self._spec_cache[module_name] = cache
+
+        return cache
+
+    def _write_spec_cache(self, module_name):
+        if not self.USE_SPEC_CACHE:
+            return
+
+        cache_path = os.path.join(self._spec_cache_dir, module_name + '.json')
+        try:
+            utils.write_file_atomic(cache_path,
+                                    json.dumps(self._spec_cache[module_name]))
+        except (IOError, OSError, TypeError) as ex:
+            self.log.warn('Unable to write component spec cache file {}: '
+                          '{}'.format(cache_path, ex))
+
+    def _get_component_spec(self, component_name, component_class,
+                            dirty_modules):
+        """
+        Gets a component spec from the spec cache, creating (and caching) it
+        if the cached spec is missing or stale.
+        """
+        digest = self._get_source_digest(component_class)
+        if digest is None:
+            # Changes to the class couldn't be detected, so don't cache it
+            return self._create_component_spec(component_name, component_class)
+
+        cache = self._get_spec_cache(component_class.__module__)
+        cached = cache.get(component_name)
+        if cached is not None and cached['digest'] == digest:
+            return cached['spec']
+
+        spec = self._create_component_spec(component_name, component_class)
+        cache[component_name] = {'digest': digest, 'spec': spec}
+        dirty_modules.add(component_class.__module__)
+        return spec
+
     def _create_component_spec(self, component_class_name, component_class):
         if not issubclass(component_class, core.Component):
             raise ValueError('component_class must be a Component')
@@ -198,7 +398,7 @@ class Runtime(object):
                     #'values': []
                     'default': inport.default
                 }
-                for inport in component.inputs
+                for inport in component.inputs.get_declared_ports()
             ],
             'outPorts': [
                 {
@@ -208,24 +408,80 @@ class Runtime(object):
                     'addressable': isinstance(outport, core.ArrayOutputPort),
                     'required': (not outport.optional)
                 }
-                for outport in component.outputs
+                for outport in component.outputs.get_declared_ports()
             ]
         }
 
     def is_started(self, graph_id):
-        if graph_id not in self._executors:
-            return False
+        """
+        Has the graph been started (and not yet finished or stopped)?
+        """
+        glet = self._execution_greenlets.get(graph_id)
+        return glet is not None and not glet.dead
+
+    def is_running(self, graph_id):
+        """
+        Is the graph actively executing? A started graph may be waiting for
+        a free slot when `MAX_RUNNING_GRAPHS` graphs are already running.
+        """
+        executor = self._executors.get(graph_id)
+        return executor is not None and executor.is_running()
+
+    def get_status(self, graph_id):
+        """
+        Status of a graph, in the format of the FBP network protocol.
+
+        Parameters
+        ----------
+        graph_id : str
+            the graph ID.
+
+        Returns
+        -------
+        status : dict
+            ``graph``, ``started``, ``running``, ``uptime`` (seconds since
+            the graph began executing) and ``cpu`` (approximate seconds spent
+            running its components, if the executor tracks it).
+        """
+        status = {
+            'graph': graph_id,
+            'started': self.is_started(graph_id),
+            'running': self.is_running(graph_id),
+            'debug': False
+        }
 
-        return self._executors[graph_id].is_running()
+        start_time = self._start_times.get(graph_id)
+        if start_time is not None:
+            status['uptime'] = time.time() - start_time
 
-    def start(self, graph_id):
+        executor = self._executors.get(graph_id)
+        if executor is not None and executor.cpu_time is not None:
+            status['cpu'] = executor.cpu_time
+
+        return status
+
+    def start(self, graph_id, on_stopped=None):
         """
         Execute a graph.
+
+        This returns immediately: the graph executes in its own greenlet, so
+        that the runtime and other graphs stay responsive.
+
+        Parameters
+        ----------
+        graph_id : str
+            the graph ID.
+        on_stopped : callable
+            called with the graph ID once the graph finishes or is stopped.
+            (optional)
         """
         self.log.debug('Graph {}: Starting execution'.format(graph_id))
 
         graph = self._graphs[graph_id]
 
+        if self.is_started(graph_id):
+            raise ValueError('Graph {} is already started'.format(graph_id))
+
         if graph_id not in self._executors:
             # Create executor
             self.log.info('Creating executor for graph {}...'.format(graph_id))
@@ -233,14 +489,55 @@ class Runtime(object):
         else:
             executor = self._executors[graph_id]
 
-        if executor.is_running():
-            raise ValueError('Graph {} is already started'.format(graph_id))
+        executor.edge_inspector = self._edge_inspectors.get(graph_id)
+
+        if self._memory_budget is None and self.MEMORY_BUDGET is not None:
+            from .executors.budget import MemoryBudget
+            self._memory_budget = MemoryBudget(self.MEMORY_BUDGET)
+        executor.memory_budget = self._memory_budget
+
+        import gevent
+
+        if self._running_slots is None and self.MAX_RUNNING_GRAPHS is not None:
+            import gevent.lock
+            self._running_slots = gevent.lock.BoundedSemaphore(self.MAX_RUNNING_GRAPHS)
+
+        self._execution_greenlets[graph_id] = gevent.spawn(
+            self._execute, graph_id, executor, on_stopped)
+
+    def _execute(self, graph_id, executor, on_stopped):
+        """
+        Runs an executor once a running slot is available.
+        """
+        import gevent
 
-        # gevent.spawn(executor.execute)
-        # FIXME: single threaded runtime blocks here (use gevent.Group.spawn above):
-        executor.execute()
+        try:
+            if self._running_slots is not None:
+                if self._running_slots.locked():
+                    self.log.info('Graph {}: Waiting for one of {:d} running graphs to '
+                                  'finish...'.format(graph_id, self.MAX_RUNNING_GRAPHS))
 
-        # TODO: send 'started' message back
+                self._running_slots.acquire()
+
+            try:
+                self._start_times[graph_id] = time.time()
+                executor.execute()
+                self.log.info('Graph {}: Finished execution in {:.3f} seconds'.format(
+                    graph_id, time.time() - self._start_times[graph_id]))
+            except Exception as ex:
+                self.log.exception('Graph {}: Execution failed with {}: {}'.format(
+                    graph_id, ex.__class__.__name__, ex))
+            finally:
+                if self._running_slots is not None:
+                    self._running_slots.release()
+        finally:
+            if self._execution_greenlets.get(graph_id) is gevent.getcurrent():
+                del self._execution_greenlets[graph_id]
+
+            self._start_times.pop(graph_id, None)
+
+            if on_stopped is not None:
+                on_stopped(graph_id)
 
     def stop(self, graph_id):
         """
@@ -251,9 +548,108 @@ class Runtime(object):
             raise ValueError('Invalid graph: {}'.format(graph_id))
 
         executor = self._executors[graph_id]
-        executor.stop()
+        glet = self._execution_greenlets.get(graph_id)
+        if executor.is_running():
+            executor.stop()
+        elif glet is not None:
+            glet.kill()  # Still waiting for a running slot
+
+        if glet is not None:
+            glet.join()
+            if self._execution_greenlets.get(graph_id) is glet:
+                del self._execution_greenlets[graph_id]  # Killed before it ran
+
         del self._executors[graph_id]
 
+    def set_watched_edges(self, graph_id, edges):
+        """
+        Sets the edges of a graph whose packets are reported as network
+        protocol events (see `get_edge_events()`). This can be changed while
+        the graph is running.
+
+        Parameters
+        ----------
+        graph_id : str
+            the graph ID.
+        edges : list
+            edges in the network protocol format
+            (``{'src': {'node', 'port'}, 'tgt': {'node', 'port'}}``). An empty
+            list stops watching the graph.
+        """
+        from .executors.inspection import EdgeInspector
+
+        graph = self._graphs[graph_id]
+        ports = [(self._get_port(graph, edge['src'], is_input=False),
+                  self._get_port(graph, edge['tgt'], is_input=True))
+                 for edge in edges]
+
+        if ports:
+            inspector = self._edge_inspectors.get(graph_id)
+            if inspector is None:
+                inspector = self._edge_inspectors[graph_id] = EdgeInspector()
+            inspector.set_edges(ports)
+        else:
+            inspector = self._edge_inspectors.pop(graph_id, None)
+            if inspector is None:
+                return
+            inspector = None
+
+        executor = self._executors.get(graph_id)
+        if executor is not None:
+            executor.edge_inspector = inspector
+
+    def get_edge_events(self, graph_id):
+        """
+        Removes and returns the packet events collected from the watched
+        edges of a graph.
+
+        Returns
+        -------
+        events : list
+            (command, payload) tuples of network protocol events.
+        """
+        inspector = self._edge_inspectors.get(graph_id)
+        if inspector is None:
+            return []
+
+        events = inspector.drain()
+        for _, payload in events:
+            payload['graph'] = graph_id
+
+        return events
+
+    def get_memory_report(self, graph_id):
+        """
+        Reports the estimated bytes of packets in flight, and their high-water
+        marks, for each component of a graph that has sent packets.
+
+        Returns
+        -------
+        report : list
+            entries of ``executors.budget.MemoryBudget.get_report()``, or
+            an empty list if `MEMORY_BUDGET` isn't set.
+        """
+        graph = self._graphs.get(graph_id)
+        if self._memory_budget is None or graph is None:
+            return []
+
+        return self._memory_budget.get_report(graph)
+
+    def get_metrics(self):
+        """
+        Formats the metrics of the graphs with an executor (i.e. that have
+        been started, and not stopped).
+
+        Returns
+        -------
+        text : str
+            metrics in the Prometheus text exposition format (see
+            ``executors.metrics``).
+        """
+        from .executors.metrics import format_metrics
+
+        return format_metrics(self._executors)
+
     def _create_or_get_graph(self, graph_id):
         """
         Parameters
@@ -272,9 +668,18 @@ class Runtime(object):
         return self._graphs[graph_id]
 
     def _find_component_by_name(self, graph, component_name):
-        for component in graph.components:
-            if component.name == component_name:
-                return component
+        try:
+            return graph.get_component(component_name)
+        except ValueError:
+            return None
+
+    def _get_port(self, graph, endpoint, is_input):
+        """
+        Gets a port from a graph protocol endpoint (``{'node', 'port'}``).
+        """
+        component = graph.get_component(endpoint['node'])
+        ports = component.inputs if is_input else component.outputs
+        return ports[endpoint['port']]
 
     def get_source_code(self, component_name):
         component = None
@@ -306,7 +711,7 @@ class Runtime(object):
 
         graph = self._create_or_get_graph(graph_id)
 
-        component_class = self._components[component_id]['class']
+        component_class = self.get_component_class(component_id)
         component = component_class(node_id)
         graph.add_component(component)
 
@@ -328,13 +733,8 @@ class Runtime(object):
             graph_id, src, tgt))
 
         graph = self._graphs[graph_id]
-
-        source_component = self._find_component_by_name(graph, src['node'])
-        source_port = source_component.outputs[src['port']]
-
-        target_component = self._find_component_by_name(graph, tgt['node'])
-        target_port = target_component.inputs[tgt['port']]
-
+        source_port = self._get_port(graph, src, is_input=False)
+        target_port = self._get_port(graph, tgt, is_input=True)
         graph.connect(source_port, target_port)
 
     def remove_edge(self, graph_id, src, tgt):
@@ -346,13 +746,11 @@ class Runtime(object):
 
         graph = self._graphs[graph_id]
 
-        source_component = self._find_component_by_name(graph, src['node'])
-        source_port = source_component.outputs[src['port']]
+        source_port = self._get_port(graph, src, is_input=False)
         if source_port.is_connected():
             graph.disconnect(source_port)
 
-        target_component = self._find_component_by_name(graph, tgt['node'])
-        target_port = target_component.inputs[tgt['port']]
+        target_port = self._get_port(graph, tgt, is_input=True)
         if target_port.is_connected():
             graph.disconnect(target_port)
 
@@ -364,11 +762,13 @@ class Runtime(object):
             graph_id, data, src))
 
         graph = self._graphs[graph_id]
-
-        target_component = self._find_component_by_name(graph, src['node'])
-        target_port = target_component.inputs[src['port']]
+        target_port = self._get_port(graph, src, is_input=True)
         if target_port.is_connected():
-            graph.disconnect(target_port)
+            if isinstance(target_port.source_port.component,
+                          core.InitialPacketGenerator):
+                graph.unset_initial_packet(target_port)
+            else:
+                graph.disconnect(target_port)
 
         graph.set_initial_packet(target_port, data)
 
@@ -380,22 +780,178 @@ class Runtime(object):
             graph_id, src))
 
         graph = self._graphs[graph_id]
+        target_port = self._get_port(graph, src, is_input=True)
+        graph.unset_initial_packet(target_port)
 
-        target_component = self._find_component_by_name(graph, src['node'])
-        target_port = target_component.inputs[src['port']]
-        if target_port.is_connected():
-            graph.disconnect(target_port)
+    def apply_graph_commands(self, commands):
+        """
+        Applies graph protocol edits (``addnode``, ``addedge``,
+        ``addinitial``, etc.) as a single transaction.
 
-        graph.unset_initial_packet(target_port)
+        Each applied edit records how to undo itself, so if any edit fails,
+        the edits before it are rolled back and the graphs are left as they
+        were.
+
+        Parameters
+        ----------
+        commands : iterable
+            (command, payload) tuples, in the graph protocol format.
+
+        Returns
+        -------
+        count : int
+            number of commands applied.
+        """
+        journal = []  # Callables that undo each applied edit
+        count = 0
+        try:
+            for command, payload in commands:
+                undo = self._apply_graph_command(command, payload)
+                if undo is not None:
+                    journal.append(undo)
+                count += 1
+        except Exception:
+            self.log.warn('Rolling back {:d} graph edits...'.format(len(journal)))
+            for undo in reversed(journal):
+                undo()
+            raise
+
+        return count
+
+    def _apply_graph_command(self, command, payload):
+        """
+        Applies a single graph protocol edit.
+
+        Returns
+        -------
+        undo : callable
+            reverts the edit, or None if there is nothing to revert.
+        """
+        if command == 'clear':
+            graph_id = payload['id']
+            old_graph = self._graphs.get(graph_id)
+            self.new_graph(graph_id)
+
+            def undo():
+                if old_graph is None:
+                    del self._graphs[graph_id]
+                else:
+                    self._graphs[graph_id] = old_graph
+
+            return undo
+
+        # Nodes
+        elif command == 'addnode':
+            self.add_node(payload['graph'], payload['id'], payload['component'])
+            return functools.partial(self.remove_node, payload['graph'],
+                                     payload['id'])
+        elif command == 'removenode':
+            graph = self._create_or_get_graph(payload['graph'])
+            component = graph.get_component(payload['id'])
+            edges = self._get_port_edges(list(component.inputs) +
+                                         list(component.outputs))
+            self.remove_node(payload['graph'], payload['id'])
+
+            def undo():
+                graph.add_component(component)
+                self._restore_port_edges(graph, edges)
+
+            return undo
+
+        # Edges/connections
+        elif command == 'addedge':
+            self.add_edge(payload['graph'], payload['src'], payload['tgt'])
+            return functools.partial(self.remove_edge, payload['graph'],
+                                     payload['src'], payload['tgt'])
+        elif command == 'removeedge':
+            graph = self._graphs[payload['graph']]
+            edges = self._get_port_edges([
+                self._get_port(graph, payload['src'], is_input=False),
+                self._get_port(graph, payload['tgt'], is_input=True)])
+            self.remove_edge(payload['graph'], payload['src'], payload['tgt'])
+            return functools.partial(self._restore_port_edges, graph, edges)
+
+        # IIP / literals
+        elif command == 'addinitial':
+            graph = self._graphs[payload['graph']]
+            target_port = self._get_port(graph, payload['tgt'], is_input=True)
+            edges = self._get_port_edges([target_port])
+            self.add_iip(payload['graph'], payload['tgt'],
+                         payload['src']['data'])
+
+            def undo():
+                graph.unset_initial_packet(target_port)
+                self._restore_port_edges(graph, edges)
+
+            return undo
+        elif command == 'removeinitial':
+            graph = self._graphs[payload['graph']]
+            target_port = self._get_port(graph, payload['tgt'], is_input=True)
+            edges = self._get_port_edges([target_port])
+            self.remove_iip(payload['graph'], payload['tgt'])
+            return functools.partial(self._restore_port_edges, graph, edges)
+
+        # Exported ports and metadata changes
+        elif command in ('addinport', 'addoutport', 'changenode'):
+            return None  # Not supported yet
+
+        else:
+            raise ValueError("Unknown graph command '{}'".format(command))
+
+    def _get_port_edges(self, ports):
+        """
+        Records the connections of ports, so that they can be restored with
+        `_restore_port_edges()`.
+
+        Returns
+        -------
+        edges : list
+            (source port, target port, IIP value) tuples. The source port is
+            None for IIPs.
+        """
+        edges = []
+        for port in ports:
+            if not port.is_connected():
+                continue
+
+            if isinstance(port, core.OutputPort):
+                edges.append((port, port.target_port, None))
+            elif isinstance(port.source_port, core.OutputPort):
+                source_component = port.source_port.component
+                if isinstance(source_component, core.InitialPacketGenerator):
+                    edges.append((None, port, source_component.value))
+                else:
+                    edges.append((port.source_port, port, None))
+
+        return edges
+
+    def _restore_port_edges(self, graph, edges):
+        for source_port, target_port, value in edges:
+            if target_port.is_connected():
+                graph.disconnect(target_port)
+
+            if source_port is None:
+                graph.set_initial_packet(target_port, value)
+            else:
+                if source_port.is_connected():
+                    graph.disconnect(source_port)
+                graph.connect(source_port, target_port)
 
 
 def create_websocket_application(runtime):
+    import socket
+    import gevent
+    import geventwebsocket
+    import geventwebsocket.websocket
+
     class WebSocketRuntimeAdapterApplication(geventwebsocket.WebSocketApplication):
         """
         Web socket application that hosts a single Runtime.
         """
+        EDGE_EVENTS_INTERVAL = 0.25  # Seconds between batches of watched edge events
+
         def __init__(self, ws):
-            super(WebSocketRuntimeAdapterApplication, self).__init__(self)
+            super(WebSocketRuntimeAdapterApplication, self).__init__(ws)
 
             self.log = logging.getLogger('%s.%s' % (self.__class__.__module__,
                                                     self.__class__.__name__))
@@ -405,6 +961,9 @@ def create_websocket_application(runtime):
 
             self.runtime = runtime
 
+            self._outbox = []  # Serialized messages waiting to be sent
+            self._watched_graphs = set()  # Graphs with edges watched by this client
+            self._edge_events_greenlet = None  # Sends edge events while graphs are watched
         ### WebSocket transport handling ###
         @staticmethod
         def protocol_name():
@@ -419,6 +978,12 @@ def create_websocket_application(runtime):
         def on_close(self, reason):
             self.log.info("Connection closed. Reason: %s" % reason)
 
+            # Stop watching edges nobody will receive events for
+            for graph_id in self._watched_graphs:
+                if graph_id in self.runtime._graphs:
+                    self.runtime.set_watched_edges(graph_id, [])
+            self._watched_graphs.clear()
+
         def on_message(self, message, **kwargs):
             self.log.debug('MESSAGE: %s' % message)
 
@@ -444,10 +1009,55 @@ def create_websocket_application(runtime):
         def send(self, protocol, command, payload):
             """
             Send a message to UI/client
+
+            Messages are queued and sent together once the current greenlet
+            yields, so that bursts of acks and edge data go out in a single
+            socket write rather than one write per message.
             """
-            self.ws.send(json.dumps({'protocol': protocol,
-                                     'command': command,
-                                     'payload': payload}))
+            self._outbox.append(json.dumps({'protocol': protocol,
+                                            'command': command,
+                                            'payload': payload}))
+            if len(self._outbox) == 1:
+                gevent.spawn(self._flush_outbox)
+
+        def _send_edge_events(self):
+            """
+            Periodically sends the packet events of watched edges, so that
+            they go out in batches rather than one write per packet.
+            """
+            try:
+                while self._watched_graphs and not self.ws.closed:
+                    gevent.sleep(self.EDGE_EVENTS_INTERVAL)
+                    for graph_id in list(self._watched_graphs):
+                        for command, payload in self.runtime.get_edge_events(graph_id):
+                            self.send('network', command, payload)
+            finally:
+                self._edge_events_greenlet = None
+
+        def _flush_outbox(self):
+            messages, self._outbox = self._outbox, []
+            if not messages or self.ws.closed:
+                return
+
+            frames = []
+            for message in messages:
+                if isinstance(message, unicode):
+                    message = message.encode('utf-8')
+
+                frames.append(bytes(geventwebsocket.websocket.Header.encode_header(
+                    True, geventwebsocket.websocket.WebSocket.OPCODE_TEXT, b'',
+                    len(message), 0)))
+                frames.append(message)
+
+            # The frames are written the way ``WebSocket.send_frame()`` writes
+            # a single one, and a dead socket is handled as ``WebSocket.send()``
+            # handles it: the client has gone, so the connection is closed
+            try:
+                self.ws.raw_write(b''.join(frames))
+            except socket.error as ex:
+                self.log.error('Unable to send {:d} messages: {}'.format(
+                    len(messages), ex))
+                self.on_close(geventwebsocket.websocket.MSG_SOCKET_DEAD)
 
         ### Protocol send/responses ###
         def handle_runtime(self, command, payload):
@@ -502,66 +1112,53 @@ def create_websocket_application(runtime):
             # you must send a message on the same format, informing the client about the change
             # Normally done using signals,observer-pattern or similar
 
-            send_ack = True
-
-            # New graph
-            if command == 'clear':
-                self.runtime.new_graph(payload['id'])
-            # Nodes
-            elif command == 'addnode':
-                self.runtime.add_node(payload['graph'], payload['id'],
-                                      payload['component'])
-            elif command == 'removenode':
-                self.runtime.remove_node(payload['graph'], payload['id'])
-            # Edges/connections
-            elif command == 'addedge':
-                self.runtime.add_edge(payload['graph'], payload['src'],
-                                      payload['tgt'])
-            elif command == 'removeedge':
-                self.runtime.remove_edge(payload['graph'], payload['src'],
-                                         payload['tgt'])
-            # IIP / literals
-            elif command == 'addinitial':
-                self.runtime.add_iip(payload['graph'], payload['tgt'],
-                                     payload['src']['data'])
-            elif command == 'removeinitial':
-                self.runtime.remove_iip(payload['graph'], payload['tgt'])
-            # Exported ports
-            elif command in ('addinport', 'addoutport'):
-                pass  # No support in this example
-            # Metadata changes
-            elif command in ('changenode',):
-                pass
-            else:
-                send_ack = False
+            if command == 'batch':
+                # Many edits in one transaction, with a single ack (instead
+                # of one round trip per edit).
+                commands = [(c['command'], c['payload']) for c in payload['commands']]
+                try:
+                    count = self.runtime.apply_graph_commands(commands)
+                except Exception as ex:
+                    self.log.exception('Graph batch failed')
+                    self.send('graph', 'error', {'message': str(ex)})
+                else:
+                    self.send('graph', 'batch', {'graph': payload.get('graph'),
+                                                 'count': count})
+                return
+
+            if command not in self.runtime.GRAPH_COMMANDS:
                 self.log.warn("Unknown command '%s' for protocol '%s' " % (command, 'graph'))
+                return
+
+            self.runtime.apply_graph_commands([(command, payload)])
 
             # For any message we respected, send same in return as acknowledgement
-            if send_ack:
-                self.send('graph', command, payload)
+            self.send('graph', command, payload)
 
         def handle_network(self, command, payload):
             def send_status(cmd, g):
-                started = self.runtime.is_started(g)
-                # NOTE: running indicates network is actively running, data being processed
-                # for this example, we consider ourselves running as long as we have been started
-                running = started
-                payload = {
-                    graph: g,
-                    started: started,
-                    running: running,
-                }
-                self.send('network', cmd, payload)
+                self.send('network', cmd, self.runtime.get_status(g))
 
             graph = payload.get('graph', None)
             if command == 'getstatus':
                 send_status('status', graph)
             elif command == 'start':
-                self.runtime.start(graph)
+                self.runtime.start(graph,
+                                   on_stopped=functools.partial(send_status, 'stopped'))
                 send_status('started', graph)
             elif command == 'stop':
                 self.runtime.stop(graph)
-                send_status('started', graph)
+            elif command == 'edges':
+                self.runtime.set_watched_edges(graph, payload['edges'])
+                if payload['edges']:
+                    self._watched_graphs.add(graph)
+                else:
+                    self._watched_graphs.discard(graph)
+
+                if self._watched_graphs and self._edge_events_greenlet is None:
+                    self._edge_events_greenlet = gevent.spawn(self._send_edge_events)
+
+                self.send('network', 'edges', payload)
             else:
                 self.log.warn("Unknown command '%s' for protocol '%s'" % (command, 'network'))
 
@@ -625,6 +1222,8 @@ class FlowhubRegistry(RuntimeRegistry):
             'secret': '9129923',  # unused
         }
 
+        import requests
+
         self.log.info('Registering runtime %s for user %s...' % (runtime_id, user_id))
         response = requests.put('%s/runtimes/%s' % (self._endpoint, runtime_id),
                                 data=json.dumps(payload),
@@ -632,6 +1231,8 @@ class FlowhubRegistry(RuntimeRegistry):
         self._ensure_http_success(response)
 
     def ping_runtime(self, runtime_id):
+        import requests
+
         self.log.info('Pinging runtime %s...' % runtime_id)
         response = requests.post('%s/runtimes/%s' % (self._endpoint, runtime_id))
         self._ensure_http_success(response)
@@ -644,10 +1245,20 @@ class FlowhubRegistry(RuntimeRegistry):
 
 
 def create_runtime_id(user_id, address):
+    import uuid
+
     return str(uuid.uuid3(uuid.UUID(user_id), 'pflow_' + address))
 
 
 def main():
+    # Patch before anything else uses sockets, etc.
+    from .executors.single_process import monkey_patch
+    monkey_patch()
+
+    import argparse
+    import gevent
+    import geventwebsocket
+
     # Argument defaults
     defaults = {
         'host': 'localhost',
@@ -670,6 +1281,9 @@ def main():
     argp.add_argument(
         '--port', type=int, default=3569, metavar='PORT',
         help='Listen port for websocket (default: %(port)d)' % defaults)
+    argp.add_argument(
+        '--metrics-port', type=int, metavar='PORT',
+        help='Port to serve Prometheus metrics of the running graphs on (default: none)')
     argp.add_argument(
         '--log-file', metavar='FILE_PATH',
         help='File to send log output to (default: none)')
@@ -729,11 +1343,18 @@ def main():
             flowhub.ping_runtime(runtime_id)
             gevent.sleep(delay_secs)
 
-    # Start!
-    gevent.wait([
+    tasks = [
         gevent.spawn(runtime_application_task),
         gevent.spawn(registration_task)
-    ])
+    ]
+
+    if args.metrics_port is not None:
+        from .executors.metrics import MetricsServer
+        metrics_server = MetricsServer(runtime.get_metrics, args.host, args.metrics_port)
+        tasks.append(gevent.spawn(metrics_server.serve_forever))
+
+    # Start!
+    gevent.wait(tasks)
 
 
 if __name__ == '__main__':
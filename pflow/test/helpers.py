@@ -4,7 +4,63 @@ try:
 except ImportError:
     import mock
 
+from ..core import Graph, Component
+from ..packet import EndOfStream
+
+
+class Collector(Component):
+    """
+    Collects the values it receives.
+    """
+    def initialize(self):
+        self.inputs.add('IN')
+        self.values = []
+
+    def run(self):
+        while True:
+            with self.quiescent():
+                value = self.inputs['IN'].receive()
+            if value is EndOfStream:
+                break
+
+            self.values.append(value)
+
 
 class ComponentTest(unittest.TestCase):
-    # TODO: write helpers
-    pass
+    def run_component(self, component, collector=None, source=None, inport='IN',
+                      **parameters):
+        """
+        Runs a component with its parameters set by initial packets, and sends
+        its output to a collector.
+
+        Parameters
+        ----------
+        component : ``core.Component``
+            the component to run.
+        collector : `Collector`
+            collects the component's output. (default: a new `Collector`)
+        source : ``core.Component``
+            sends packets from its OUT port to the component's `inport`.
+            (optional)
+        inport : str
+            name of the input port the source is connected to.
+        parameters : dict
+            initial packets, keyed by input port name.
+
+        Returns
+        -------
+        values : list
+            the values the collector received.
+        """
+        from ..executors.single_process import SingleProcessGraphExecutor
+
+        graph = Graph('GRAPH', initialize=False)
+        collector = collector or Collector('COLLECT')
+        if source is not None:
+            graph.connect(source.outputs['OUT'], component.inputs[inport])
+        graph.connect(component.outputs['OUT'], collector.inputs['IN'])
+        for name, value in parameters.items():
+            graph.set_initial_packet(component.inputs[name], value)
+
+        SingleProcessGraphExecutor(graph).execute()
+        return collector.values
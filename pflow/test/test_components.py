@@ -1,10 +1,81 @@
+import time
 import unittest
 try:
     from unittest import mock
 except ImportError:
     import mock
 
-from .helpers import ComponentTest
+from .helpers import ComponentTest, Collector
+from .. import packet as packet_module
+from ..core import Component
+from ..components import (TumblingWindow, SlidingWindow, SessionWindow,
+                          Multiply, Modulo, RandomNumberGenerator)
+from ..packet import get_numpy, is_batch_array
+from ..port import InputPort
+
+
+class ListSource(Component):
+    """
+    Sends VALUES, waiting DELAYS[i] seconds before sending the i-th value.
+    """
+    VALUES = []
+    DELAYS = {}
+
+    def initialize(self):
+        self.outputs.add('OUT')
+
+    def run(self):
+        for i, value in enumerate(self.VALUES):
+            if i in self.DELAYS:
+                self.suspend(self.DELAYS[i])
+            self.outputs['OUT'].send(value)
+
+
+class BatchSource(Component):
+    """
+    Sends VALUES as a single batch.
+    """
+    VALUES = []
+
+    def initialize(self):
+        self.outputs.add('OUT')
+
+    def run(self):
+        self.outputs['OUT'].send_batch(self.VALUES)
+
+
+class BatchCollector(Collector):
+    """
+    Collects the values it receives, including whole batches.
+    """
+    def initialize(self):
+        self.inputs.add_ports(InputPort('IN', receive_batches=True))
+        self.values = []
+
+
+def without_and_with_numpy():
+    """
+    Yields once with NumPy disabled, and once with it (if it's installed).
+    """
+    for numpy in (None, get_numpy()):
+        with mock.patch.object(packet_module, '_numpy', numpy):
+            yield
+
+
+class WindowTest(ComponentTest):
+    def run_window(self, window, values, delays=None, **parameters):
+        source = ListSource('SOURCE')
+        source.VALUES = values
+        source.DELAYS = delays or {}
+        return self.run_component(window, source=source, **parameters)
+
+
+class BatchTest(ComponentTest):
+    def run_batch(self, component, values, collector=None, inport='IN', **parameters):
+        source = BatchSource('SOURCE')
+        source.VALUES = values
+        return self.run_component(component, collector, source=source, inport=inport,
+                                  **parameters)
 
 
 class RepeatTest(ComponentTest):
@@ -43,10 +114,85 @@ class RegexFilterTest(ComponentTest):
 #         pass
 
 
-class MultiplyTest(ComponentTest):
-    @unittest.skip('unimplemented')
-    def test_component(self):
-        pass
+class MultiplyTest(BatchTest):
+    def test_scalars(self):
+        self.assertEqual(self.run_component(Multiply('MULTIPLY'), X=3, Y=4), [12])
+
+    def test_batch(self):
+        for _ in without_and_with_numpy():
+            batch, = self.run_batch(Multiply('MULTIPLY'), [1, 2, 3],
+                                    BatchCollector('COLLECT'), inport='X', Y=2)
+            self.assertTrue(is_batch_array(batch))
+            self.assertEqual(batch.tolist(), [2, 4, 6])
+
+
+class TumblingWindowTest(WindowTest):
+    def test_event_time(self):
+        records = [{'host': 'a', 'time': 0, 'value': 1},
+                   {'host': 'b', 'time': 10, 'value': 5},
+                   {'host': 'a', 'time': 59, 'value': 3},
+                   {'host': 'a', 'time': 61, 'value': 4},
+                   {'host': 'a', 'time': 30, 'value': 9},  # Late
+                   {'host': 'b', 'time': 130, 'value': 6}]
+        windows = self.run_window(TumblingWindow('WINDOW'), records, SIZE=60, KEY='host',
+                                  FIELD='value', TIME_FIELD='time')
+
+        self.assertEqual([(w['key'], w['start'], w['end']) for w in windows],
+                         [('a', 0, 60), ('b', 0, 60), ('a', 60, 120), ('b', 120, 180)])
+        self.assertEqual(windows[0], {'key': 'a', 'start': 0, 'end': 60, 'count': 2,
+                                      'sum': 4, 'min': 1, 'max': 3, 'mean': 2.0})
+        self.assertEqual([w['count'] for w in windows], [2, 1, 1, 1])
+
+    def test_lateness(self):
+        records = [(0, 1), (65, 2), (30, 3), (100, 4)]
+        windows = self.run_window(TumblingWindow('WINDOW'), records, SIZE=60, FIELD=1,
+                                  TIME_FIELD=0, LATENESS=10)
+        self.assertEqual([w['sum'] for w in windows], [4, 6])
+
+    def test_processing_time(self):
+        # The first window is closed by its timer, before the last value.
+        # Windows start on multiples of SIZE, so the first values are sent
+        # just after one starts, rather than possibly either side of it.
+        until_next_window = 0.5 - time.time() % 0.5
+        windows = self.run_window(TumblingWindow('WINDOW'), [1, 2, 3],
+                                  delays={0: until_next_window + 0.1, 2: 1.0}, SIZE=0.5)
+        self.assertEqual([w['sum'] for w in windows], [3, 3])
+
+    def test_brackets(self):
+        values = self.run_window(TumblingWindow('WINDOW'), [(0, 1), (1, 2)], SIZE=60,
+                                 FIELD=1, TIME_FIELD=0, BRACKETS=True)
+        self.assertEqual(values, ['StartSubStream', ('start', 0), ('end', 60),
+                                  ('count', 2), ('sum', 3), ('min', 1), ('max', 2),
+                                  ('mean', 1.5), 'EndSubStream'])
+
+
+class SlidingWindowTest(WindowTest):
+    def test_event_time(self):
+        records = [(0, 1), (20, 2), (40, 3)]
+        windows = self.run_window(SlidingWindow('WINDOW'), records, SIZE=30, SLIDE=10,
+                                  FIELD=1, TIME_FIELD=0)
+        self.assertEqual([(w['start'], w['sum']) for w in windows],
+                         [(-20, 1), (-10, 1), (0, 3), (10, 2), (20, 5), (30, 3), (40, 3)])
+
+
+class SessionWindowTest(WindowTest):
+    def test_event_time(self):
+        records = [(0, 1), (5, 2), (30, 3), (12, 4), (60, 5)]
+        windows = self.run_window(SessionWindow('WINDOW'), records, GAP=10, FIELD=1,
+                                  TIME_FIELD=0)
+
+        # The first session closed at 15, so the late value at 12 is dropped
+        self.assertEqual([(w['start'], w['end'], w['sum']) for w in windows],
+                         [(0, 15, 3), (30, 40, 3), (60, 70, 5)])
+
+    def test_merge(self):
+        records = [(0, 1), (18, 2), (9, 3), (100, 4)]
+        windows = self.run_window(SessionWindow('WINDOW'), records, GAP=10, FIELD=1,
+                                  TIME_FIELD=0, LATENESS=20)
+
+        # 9 bridges the sessions at 0 and 18
+        self.assertEqual([(w['start'], w['end'], w['count']) for w in windows],
+                         [(0, 28, 3), (100, 110, 1)])
 
 
 class FileTailReaderTest(ComponentTest):
@@ -67,7 +213,28 @@ class ConsoleLineWriterTest(ComponentTest):
 #         pass
 
 
+class ModuloTest(BatchTest):
+    def test_batch(self):
+        for _ in without_and_with_numpy():
+            # The collector doesn't receive batches, so gets their values
+            self.assertEqual(self.run_batch(Modulo('MODULO'), [5, -5, 7.5], MODULO=3),
+                             [5 % 3.0, -5 % 3.0, 7.5 % 3.0])
+
+
 class RandomNumberGeneratorTest(ComponentTest):
-    @unittest.skip('unimplemented')
     def test_component(self):
-        pass
+        values = self.run_component(RandomNumberGenerator('RNG'), LIMIT=10)
+        self.assertEqual(len(values), 10)
+        self.assertTrue(all(1 <= value <= 100 for value in values))
+
+    def test_blocks(self):
+        for _ in without_and_with_numpy():
+            values = self.run_component(RandomNumberGenerator('RNG'), LIMIT=10,
+                                        BLOCK_SIZE=4, SEED=1)
+            self.assertEqual(len(values), 10)
+            self.assertTrue(all(1 <= value <= 100 for value in values))
+
+            batches = self.run_component(RandomNumberGenerator('RNG'),
+                                         BatchCollector('COLLECT'), LIMIT=10,
+                                         BLOCK_SIZE=4)
+            self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
@@ -5,6 +5,10 @@ except ImportError:
     import mock
 
 from . import helpers
+from .. import components, exc
+from ..core import (Graph, InitialPacketGenerator, ReplicaDispatcher,
+                    ReplicaMerge)
+from ..states import ComponentState
 
 
 class ComponentTest(unittest.TestCase):
@@ -51,26 +55,76 @@ class InitialPacketGeneratorTest(helpers.ComponentTest):
         pass
 
 
+def create_chain_graph():
+    graph = Graph('GRAPH', initialize=False)
+    graph.load_fbp_string('A(Repeat) OUT -> IN B(Repeat) OUT -> IN C(Drop)',
+                          use_cache=False)
+    return graph, [graph.get_component(name) for name in 'ABC']
+
+
 class GraphTest(unittest.TestCase):
-    @unittest.skip('unimplemented')
     def test_get_upstream(self):
-        pass
+        graph, (a, b, c) = create_chain_graph()
+        self.assertEqual(graph.get_upstream(a), set())
+        self.assertEqual(graph.get_upstream(c), set([b]))
+
+        # Cached topology is refreshed when the graph changes
+        graph.disconnect(c.inputs['IN'])
+        self.assertEqual(graph.get_upstream(c), set())
 
-    @unittest.skip('unimplemented')
     def test_get_downstream(self):
-        pass
+        graph, (a, b, c) = create_chain_graph()
+        self.assertEqual(graph.get_downstream(a), set([b]))
+        self.assertEqual(graph.get_downstream(c), set())
+
+        d = graph.add_component(components.Drop('D'))
+        graph.disconnect(b.outputs['OUT'])
+        graph.connect(b.outputs['OUT'], d.inputs['IN'])
+        self.assertEqual(graph.get_downstream(b), set([d]))
 
-    @unittest.skip('unimplemented')
     def test_is_upstream_terminated(self):
-        pass
+        graph, (a, b, c) = create_chain_graph()
+        self.assertTrue(graph.is_upstream_terminated(a))
+        self.assertFalse(graph.is_upstream_terminated(b))
+
+        a.state = ComponentState.TERMINATED
+        self.assertTrue(graph.is_upstream_terminated(b))
 
-    @unittest.skip('unimplemented')
     def test_add_component(self):
-        pass
+        graph = Graph('GRAPH', initialize=False)
+        rpt = components.Repeat('RPT')
+        self.assertIs(graph.add_component(rpt), rpt)
+        self.assertIs(graph.add_component(rpt), rpt)
+        self.assertIs(graph.get_component('RPT'), rpt)
+
+        self.assertRaises(ValueError, graph.add_component,
+                          components.Repeat('RPT'))
+        self.assertRaises(ValueError, graph.get_component, 'MISSING')
 
-    @unittest.skip('unimplemented')
     def test_remove_component(self):
-        pass
+        graph = Graph('GRAPH', initialize=False)
+        graph.add_component(components.Repeat('RPT_1'))
+        rpt_2 = graph.add_component(components.Repeat('RPT_2'))
+
+        graph.remove_component('RPT_1')
+        graph.remove_component(rpt_2)
+        self.assertEqual(graph.components, set())
+        self.assertRaises(ValueError, graph.get_component, 'RPT_1')
+
+        # Names can be re-used once removed
+        graph.add_component(components.Repeat('RPT_1'))
+        self.assertIsInstance(graph.get_component('RPT_1'), components.Repeat)
+
+    def test_get_subgraph_component(self):
+        subgraph = Graph('SUB', initialize=False)
+        rpt = subgraph.add_component(components.Repeat('RPT'))
+
+        graph = Graph('GRAPH', initialize=False)
+        graph.add_component(subgraph)
+        self.assertIs(graph.get_component('SUB'), subgraph)
+        self.assertIs(graph.get_component('SUB.RPT'), rpt)
+        self.assertRaises(ValueError, graph.get_component, 'SUB.MISSING')
+        self.assertRaises(ValueError, graph.get_component, 'SUB.RPT.X')
 
     @unittest.skip('unimplemented')
     def test_set_initial_packet(self):
@@ -88,33 +142,179 @@ class GraphTest(unittest.TestCase):
     def test_connect(self):
         pass
 
-    @unittest.skip('unimplemented')
     def test_disconnect(self):
-        pass
+        graph, (a, b, c) = create_chain_graph()
+        graph.disconnect(b.inputs['IN'])
+        self.assertFalse(b.inputs['IN'].is_connected())
+        self.assertFalse(a.outputs['OUT'].is_connected())
+
+        graph.disconnect(b.outputs['OUT'])
+        self.assertFalse(b.outputs['OUT'].is_connected())
+        self.assertFalse(c.inputs['IN'].is_connected())
+
+    def test_replicate(self):
+        graph = Graph('GRAPH', initialize=False)
+        graph.load_fbp_string("A(Repeat) OUT -> IN B(RegexFilter) OUT -> IN C(Drop)\n"
+                              "'x' -> REGEX B", use_cache=False)
+        a, b, c = [graph.get_component(name) for name in 'ABC']
+
+        replicas = graph.replicate(b, 3)
+        self.assertEqual([r.name for r in replicas], ['B', 'B_1', 'B_2'])
+        self.assertIsInstance(replicas[1], components.RegexFilter)
+
+        dispatcher = graph.get_component('B_DISPATCH')
+        merge = graph.get_component('B_MERGE')
+        self.assertIsInstance(dispatcher, ReplicaDispatcher)
+        self.assertIsInstance(merge, ReplicaMerge)
+        self.assertIs(a.outputs['OUT'].target_port, dispatcher.inputs['IN'])
+        self.assertIs(merge.outputs['OUT'].target_port, c.inputs['IN'])
+
+        for i, replica in enumerate(replicas):
+            self.assertIs(replica.inputs['IN'].source_port,
+                          dispatcher.outputs['OUT_{:d}'.format(i)])
+            self.assertIs(replica.outputs['OUT'].target_port,
+                          merge.inputs['IN_{:d}'.format(i)])
+            self.assertEqual(replica.inputs['REGEX'].source_port.component.value, 'x')
+
+        self.assertEqual(graph.get_downstream(a), set([dispatcher]))
+        self.assertEqual(graph.get_upstream(c), set([merge]))
+
+    def test_replicate_invalid(self):
+        graph, (a, b, c) = create_chain_graph()
+        self.assertRaises(ValueError, graph.replicate, b, 0)
+        self.assertRaises(ValueError, graph.replicate, a, 2)  # Unconnected input
+        self.assertEqual(graph.replicate(b, 1), [b])
 
-    @unittest.skip('unimplemented')
     def test_self_starters(self):
-        pass
+        graph, (a, b, c) = create_chain_graph()
+        self.assertEqual(graph.get_self_starters, set([a]))
+
+        graph.remove_component(b)
+        self.assertEqual(graph.get_self_starters, set([a, c]))
 
     @unittest.skip('unimplemented')
     def test_run(self):
         pass
 
-    @unittest.skip('unimplemented')
     def test_is_terminated(self):
-        pass
+        graph, (a, b, c) = create_chain_graph()
+        subgraph = Graph('SUB', initialize=False)
+        d = subgraph.add_component(components.Drop('D'))
+        graph.add_component(subgraph)
+        self.assertEqual(graph.get_all_components(), set([a, b, c, d]))
 
-    @unittest.skip('unimplemented')
-    def test_load_fbp_string(self):
-        pass
+        for component in (a, b, c, d):
+            component.state = ComponentState.ACTIVE
 
-    @unittest.skip('unimplemented')
-    def test_load_fbp_file(self):
-        pass
+        self.assertFalse(graph.is_suspended())
+        c.state = ComponentState.SUSP_RECV
+        self.assertTrue(graph.is_suspended())
+        c.state = ComponentState.ACTIVE
+        self.assertFalse(graph.is_suspended())
+
+        for component in (a, b, c):
+            component.state = ComponentState.TERMINATED
+        self.assertFalse(graph.is_terminated())
+
+        d.state = ComponentState.ERROR
+        self.assertTrue(subgraph.is_terminated())
+        self.assertTrue(graph.is_terminated())
+
+        # Adding a live component invalidates the counters
+        graph.add_component(components.Drop('E'))
+        self.assertFalse(graph.is_terminated())
+
+    def test_load_fbp_string(self):
+        graph = Graph('GRAPH', initialize=False)
+        graph.load_fbp_string("'3' -> LIMIT GEN(RandomNumberGenerator)\n"
+                              "GEN OUT -> IN RPT(Repeat:foo=bar) OUT -> IN DROP(Drop)",
+                              use_cache=False)
+
+        gen = graph.get_component('GEN')
+        rpt = graph.get_component('RPT')
+        drop = graph.get_component('DROP')
+        self.assertIsInstance(gen, components.RandomNumberGenerator)
+        self.assertEqual(rpt.metadata, {'foo': 'bar'})
+        self.assertIs(gen.outputs['OUT'].target_port, rpt.inputs['IN'])
+        self.assertIs(rpt.outputs['OUT'].target_port, drop.inputs['IN'])
+
+        iip_gen = gen.inputs['LIMIT'].source_port.component
+        self.assertIsInstance(iip_gen, InitialPacketGenerator)
+        self.assertEqual(iip_gen.value, 3)
+
+    def test_load_fbp_iips(self):
+        # IIPs are strings, unless their port only accepts numbers
+        graph = Graph('GRAPH', initialize=False)
+        graph.load_fbp_string("'123' -> REGEX F(RegexFilter)\n"
+                              "'3' -> LIMIT GEN(RandomNumberGenerator)",
+                              use_cache=False)
+
+        def get_iip_value(port):
+            return port.source_port.component.value
+
+        self.assertEqual(get_iip_value(graph.get_component('F').inputs['REGEX']), '123')
+        self.assertEqual(get_iip_value(graph.get_component('GEN').inputs['LIMIT']), 3)
+
+    def test_load_fbp_exports(self):
+        graph = Graph('GRAPH', initialize=False)
+        graph.load_fbp_string("INPORT=RPT.IN:IN\nOUTPORT=RPT.OUT:OUT\n"
+                              "RPT(pflow.components.Repeat)",
+                              use_cache=False)
+
+        rpt = graph.get_component('RPT')
+        self.assertIs(graph.inputs['IN'].proxied_port, rpt.inputs['IN'])
+        self.assertIs(rpt.outputs['OUT'].proxied_port, graph.outputs['OUT'])
+
+    def test_load_fbp_unknown_component(self):
+        graph = Graph('GRAPH', initialize=False)
+        self.assertRaises(ValueError, graph.load_fbp_string,
+                          "A(NoSuchComponent)", use_cache=False)
 
-    @unittest.skip('unimplemented')
     def test_load_json_dict(self):
-        pass
+        graph = Graph('GRAPH', initialize=False)
+        graph.load_json_dict({
+            'processes': {
+                'GEN': {'component': 'pflow.components/RandomNumberGenerator'},
+                'RPT': {'component': 'Repeat', 'metadata': {'x': 1}}
+            },
+            'connections': [
+                {'data': 3, 'tgt': {'process': 'GEN', 'port': 'LIMIT'}},
+                {'src': {'process': 'GEN', 'port': 'OUT'},
+                 'tgt': {'process': 'RPT', 'port': 'IN'}}
+            ],
+            'inports': {},
+            'outports': {'OUT': {'process': 'RPT', 'port': 'OUT'}}
+        })
+
+        gen = graph.get_component('GEN')
+        rpt = graph.get_component('RPT')
+        self.assertEqual(len(graph.components), 3)  # including IIP
+        self.assertEqual(rpt.metadata, {'x': 1})
+        self.assertIs(gen.outputs['OUT'].target_port, rpt.inputs['IN'])
+        self.assertIs(rpt.inputs['IN'].source_port, gen.outputs['OUT'])
+        self.assertEqual(gen.inputs['LIMIT'].source_port.component.value, 3)
+        self.assertIs(rpt.outputs['OUT'].proxied_port, graph.outputs['OUT'])
+
+    def test_load_json_dict_is_atomic(self):
+        graph = Graph('GRAPH', initialize=False)
+        self.assertRaises(ValueError, graph.load_json_dict, {
+            'processes': {'RPT': {'component': 'Repeat'}},
+            'connections': [
+                {'src': {'process': 'RPT', 'port': 'OUT'},
+                 'tgt': {'process': 'MISSING', 'port': 'IN'}}
+            ]
+        })
+        self.assertEqual(len(graph.components), 0)
+
+    def test_load_json_dict_duplicate_target(self):
+        graph = Graph('GRAPH', initialize=False)
+        self.assertRaises(exc.PortError, graph.load_json_dict, {
+            'processes': {'RPT': {'component': 'Repeat'}},
+            'connections': [
+                {'data': 1, 'tgt': {'process': 'RPT', 'port': 'IN'}},
+                {'data': 2, 'tgt': {'process': 'RPT', 'port': 'IN'}}
+            ]
+        })
 
     @unittest.skip('unimplemented')
     def test_load_json_file(self):
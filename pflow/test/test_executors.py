@@ -1,9 +1,284 @@
+import os
+import shutil
+import multiprocessing as mp
+import tempfile
+import time
 import unittest
 try:
     from unittest import mock
 except ImportError:
     import mock
 
+try:
+    from StringIO import StringIO  # 2.x
+except ImportError:
+    from io import StringIO  # 3.x
+
+try:
+    import queue  # 3.x
+except ImportError:
+    import Queue as queue  # 2.x
+
+import gevent
+
+from ..core import Graph, Component, ComponentState
+from ..components import Broadcast, Split, Merge, Repeat, Multiply, TumblingWindow
+from ..packet import (Packet, ControlPacket, StartSubStream, EndSubStream,
+                      EndOfStream, BinaryPacketSerializer)
+from ..executors.inspection import EdgeInspector
+from ..executors.recording import EdgeRecorder, get_recording_path, read_recording
+from ..executors.replay import replay
+from ..executors.profiling import BottleneckReport
+from ..executors.deadlock import SEND, RECEIVE, THROTTLE
+from ..executors.metrics import MetricsServer, CONTENT_TYPE
+from ..executors import flight_recorder
+from ..executors.flight_recorder import FlightRecorder, read_dump
+from ..tracing import Tracer, TRACE_ATTR
+from ..executors.checkpoint import Checkpoint
+from ..executors.spill import SpillingQueue, SpillingChannel
+from ..executors.budget import MemoryBudget
+from ..executors.scheduling import SinkFirstPolicy, QueueDepthPolicy
+from ..executors.timers import TimerHeap
+from ..executors.single_process import SingleProcessGraphExecutor
+from ..executors.multi_process import MultiProcessGraphExecutor, NotifyingChannel, Arrivals
+from .. import exc
+from .helpers import Collector
+
+
+class Counter(Component):
+    """
+    Sends the integers up to COUNT, resuming from checkpoints.
+    """
+    COUNT = 6
+
+    def initialize(self):
+        self.outputs.add('OUT')
+        self.next_value = 0
+
+    def get_checkpoint_state(self):
+        return self.next_value
+
+    def restore_checkpoint_state(self, state):
+        self.next_value = state
+
+    def run(self):
+        while self.next_value < self.COUNT:
+            value = self.next_value
+            self.next_value += 1
+            with self.quiescent():
+                self.outputs['OUT'].send(value)
+
+
+class QueueCollector(Component):
+    """
+    Collects the values it receives on a multiprocessing queue, for graphs
+    run in other processes.
+    """
+    def initialize(self):
+        self.inputs.add('IN')
+        self.results = mp.Queue()
+
+    def run(self):
+        try:
+            while True:
+                value = self.inputs['IN'].receive()
+                if value is EndOfStream:
+                    break
+
+                self.results.put(value)
+        finally:
+            self.results.put(None)
+
+    def get_values(self):
+        values = []
+        while True:
+            value = self.results.get(timeout=5)
+            if value is None:
+                return values
+
+            values.append(value)
+
+
+class TimeoutReceiver(Component):
+    """
+    Sends 'timeout' if nothing arrives on IN within 0.1s, then forwards the
+    values it receives.
+    """
+    def initialize(self):
+        self.inputs.add('IN')
+        self.outputs.add('OUT')
+
+    def run(self):
+        try:
+            self.receive_any([self.inputs['IN']], timeout=0.1)
+        except exc.PortTimeout:
+            self.outputs['OUT'].send('timeout')
+
+        while True:
+            packet, _ = self.receive_any([self.inputs['IN']])
+            if packet is EndOfStream:
+                break
+
+            self.outputs['OUT'].send(packet.value)
+            self.drop_packet(packet)
+
+
+class TimeoutBroadcaster(Component):
+    """
+    Broadcasts 0 and 1 on OUT_A and OUT_B with a 0.1s timeout, and collects
+    the names of the ports that timed out on a multiprocessing queue.
+    """
+    def initialize(self):
+        self.outputs.add('OUT_A')
+        self.outputs.add('OUT_B')
+        self.timeouts = mp.Queue()
+
+    def run(self):
+        try:
+            for value in range(2):
+                packet = self.create_packet(value)
+                try:
+                    self.executor.broadcast_port(self, ['OUT_A', 'OUT_B'], packet,
+                                                 timeout=0.1)
+                except exc.PortTimeout as ex:
+                    self.timeouts.put(ex.port.name)
+
+                self.drop_packet(packet)
+        finally:
+            self.timeouts.put(None)
+
+
+class SlowQueueCollector(QueueCollector):
+    """
+    A `QueueCollector` with room for a single packet on IN, which only starts
+    receiving after 0.5s.
+    """
+    def initialize(self):
+        super(SlowQueueCollector, self).initialize()
+        self.inputs['IN'].max_queue_size = 1
+
+    def run(self):
+        time.sleep(0.5)
+        super(SlowQueueCollector, self).run()
+
+
+class SubStreamSource(Component):
+    """
+    Sends the integers up to 8, with 3-5 in a substream.
+    """
+    def initialize(self):
+        self.outputs.add('OUT')
+
+    def run(self):
+        for i in range(8):
+            if i == 3:
+                self.outputs['OUT'].start_substream()
+            self.outputs['OUT'].send(i)
+            if i == 5:
+                self.outputs['OUT'].end_substream()
+
+
+class SlowTransform(Component):
+    """
+    Sends (name, value) for each received value, taking longer for even
+    values, so that replicas finish out of order.
+    """
+    def initialize(self):
+        self.inputs.add('IN')
+        self.outputs.add('OUT')
+
+    def run(self):
+        while True:
+            packet = self.inputs['IN'].receive_packet()
+            if packet is EndOfStream:
+                break
+
+            if isinstance(packet, ControlPacket):
+                self.outputs['OUT'].send_packet(packet)
+                continue
+
+            self.suspend(0.3 if packet.value % 2 == 0 else 0.01)
+            self.outputs['OUT'].send((self.name, packet.value))
+            self.drop_packet(packet)
+
+
+class SlowCounter(Counter):
+    """
+    Sends the integers from 100, waiting between sends.
+    """
+    COUNT = 103
+
+    def initialize(self):
+        super(SlowCounter, self).initialize()
+        self.next_value = 100
+
+    def run(self):
+        while self.next_value < self.COUNT:
+            self.suspend(0.3)
+            self.outputs['OUT'].send(self.next_value)
+            self.next_value += 1
+
+
+class PacedCounter(Counter):
+    """
+    A `Counter` that waits DELAY seconds before sending each integer.
+    """
+    COUNT = 10
+    DELAY = 0.01
+
+    def create_value(self, value):
+        return value
+
+    def run(self):
+        while self.next_value < self.COUNT:
+            with self.quiescent():
+                self.suspend(self.DELAY)
+                value = self.next_value
+                self.next_value += 1
+                self.outputs['OUT'].send(self.create_value(value))
+
+
+class SlowPacedCounter(PacedCounter):
+    DELAY = 0.05
+
+
+class RecordCounter(SlowPacedCounter):
+    """
+    Sends records with the integers in their 'time' and 'value' fields.
+    """
+    def create_value(self, value):
+        return {'time': value, 'value': value}
+
+
+def create_stream_graph():
+    """
+    Creates a graph that multiplies paced integers, and aggregates them in
+    tumbling windows of 5.
+    """
+    graph = Graph('STREAM_GRAPH', initialize=False)
+    multiply = Multiply('MULTIPLY')
+    products = Collector('PRODUCTS')
+    graph.connect(PacedCounter('X').outputs['OUT'], multiply.inputs['X'])
+    graph.connect(SlowPacedCounter('Y').outputs['OUT'], multiply.inputs['Y'])
+    graph.connect(multiply.outputs['OUT'], products.inputs['IN'])
+
+    window = TumblingWindow('WINDOW')
+    windows = Collector('WINDOWS')
+    graph.connect(RecordCounter('RECORDS').outputs['OUT'], window.inputs['IN'])
+    graph.connect(window.outputs['OUT'], windows.inputs['IN'])
+    graph.set_initial_packet(window.inputs['SIZE'], 5)
+    graph.set_initial_packet(window.inputs['TIME_FIELD'], 'time')
+    graph.set_initial_packet(window.inputs['FIELD'], 'value')
+    return graph, products, windows
+
+
+def create_counter_graph():
+    graph = Graph('COUNTER_GRAPH', initialize=False)
+    counter = Counter('COUNT')
+    collector = Collector('COLLECT')
+    graph.connect(counter.outputs['OUT'], collector.inputs['IN'])
+    return graph, collector
+
 
 class SingleProcessExecutorTest(unittest.TestCase):
     @unittest.skip('unimplemented')
@@ -11,7 +286,1055 @@ class SingleProcessExecutorTest(unittest.TestCase):
         pass
 
 
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(self.temp_dir, 'graph.checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_save_load(self):
+        checkpoint = Checkpoint('GRAPH')
+        packet = Packet('foo')
+        packet.attrs['bar'] = 1
+        checkpoint.add_packet('GRAPH.B.IN', packet, 'GRAPH.A')
+        checkpoint.add_packet('GRAPH.B.IN', StartSubStream(), None)
+        checkpoint.states['GRAPH.A'] = {'offset': 42}
+        checkpoint.terminated.add('GRAPH.C')
+        checkpoint.save(self.checkpoint_path)
+
+        loaded = Checkpoint.load(self.checkpoint_path)
+        self.assertEqual(loaded.graph_name, 'GRAPH')
+        self.assertEqual(loaded.states, {'GRAPH.A': {'offset': 42}})
+        self.assertEqual(loaded.terminated, set(['GRAPH.C']))
+
+        packets = list(loaded.iter_packets('GRAPH.B.IN'))
+        self.assertEqual([owner_path for _, owner_path in packets], ['GRAPH.A', None])
+        self.assertEqual(packets[0][0].value, 'foo')
+        self.assertEqual(packets[0][0].attrs, {'bar': 1})
+        self.assertIsInstance(packets[1][0], StartSubStream)
+        self.assertEqual(list(loaded.iter_packets('GRAPH.C.IN')), [])
+
+    def test_load_missing(self):
+        self.assertIsNone(Checkpoint.load(self.checkpoint_path))
+
+    def test_load_invalid(self):
+        with open(self.checkpoint_path, 'wb') as f:
+            f.write(b'not a checkpoint')
+
+        self.assertRaises(exc.CheckpointError, Checkpoint.load, self.checkpoint_path)
+
+    def test_resume(self):
+        graph, collector = create_counter_graph()
+        executor = SingleProcessGraphExecutor(graph, checkpoint_path=self.checkpoint_path)
+        execution = gevent.spawn(executor.execute)
+        gevent.sleep(0.25)
+        executor.stop()
+        execution.get(timeout=5)
+
+        # Stopping writes a checkpoint, which resumes without losing or
+        # repeating values
+        checkpoint = Checkpoint.load(self.checkpoint_path)
+        self.assertEqual(checkpoint.states['COUNTER_GRAPH.COUNT'],
+                         len(collector.values) +
+                         len(checkpoint.queues.get('COUNTER_GRAPH.COLLECT.IN', [])))
+
+        graph, resumed_collector = create_counter_graph()
+        SingleProcessGraphExecutor(graph, checkpoint_path=self.checkpoint_path).execute()
+
+        self.assertEqual(collector.values + resumed_collector.values, range(Counter.COUNT))
+        self.assertTrue(collector.values)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_resume_mid_stream(self):
+        graph, products, windows = create_stream_graph()
+        executor = SingleProcessGraphExecutor(graph, checkpoint_path=self.checkpoint_path)
+        execution = gevent.spawn(executor.execute)
+        gevent.sleep(0.4)
+        executor.stop()
+        execution.get(timeout=5)
+
+        # MULTIPLY was checkpointed between packets rather than holding an X
+        # while waiting for a Y, and WINDOW with its open window
+        checkpoint = Checkpoint.load(self.checkpoint_path)
+        self.assertTrue(0 < len(products.values) < PacedCounter.COUNT)
+        open_windows = checkpoint.states['STREAM_GRAPH.WINDOW']['windows']
+        self.assertEqual(len(open_windows), 1)
+        self.assertGreater(open_windows[0].count, 0)
+
+        graph, resumed_products, resumed_windows = create_stream_graph()
+        SingleProcessGraphExecutor(graph, checkpoint_path=self.checkpoint_path).execute()
+
+        self.assertEqual(products.values + resumed_products.values,
+                         [i * i for i in range(PacedCounter.COUNT)])
+        self.assertEqual(windows.values + resumed_windows.values,
+                         [{'key': None, 'start': start, 'end': start + 5, 'count': 5,
+                           'sum': sum(range(start, start + 5)), 'min': start,
+                           'max': start + 4, 'mean': start + 2.0}
+                          for start in range(0, PacedCounter.COUNT, 5)])
+
+    def test_resume_other_graph(self):
+        Checkpoint('OTHER_GRAPH').save(self.checkpoint_path)
+
+        graph, _ = create_counter_graph()
+        executor = SingleProcessGraphExecutor(graph, checkpoint_path=self.checkpoint_path)
+        self.assertRaises(exc.CheckpointError, executor.execute)
+
+
+class SpillingQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.owner = Counter('OWNER')
+        self.queue = SpillingQueue(self.temp_dir, 'GRAPH.B.IN',
+                                   threshold=Packet('x' * 100).estimate_size() * 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_packets(self):
+        packets = [StartSubStream()]
+        for i in range(10):
+            packet = Packet(str(i) * 100)
+            packet.owner = self.owner
+            packets.append(packet)
+        packets.append(EndSubStream())
+        return packets
+
+    def test_spill(self):
+        packets = self.create_packets()
+        for packet in packets:
+            self.queue.put(packet)
+
+        self.assertEqual(self.queue.qsize(), len(packets))
+        self.assertGreater(self.queue.spilled_count, 0)
+        self.assertLessEqual(len(self.queue.queue), 3)
+        self.assertTrue(os.listdir(self.temp_dir))
+
+        # Packets are paged back in order, with their owners
+        received = [self.queue.get(block=False) for _ in packets]
+        self.assertEqual([p.__class__ for p in received], [p.__class__ for p in packets])
+        self.assertEqual([p.value for p in received], [p.value for p in packets])
+        self.assertTrue(all(p.owner is self.owner for p in received[1:-1]))
+        self.assertTrue(self.queue.empty())
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_max_size(self):
+        # maxsize counts spilled packets as well as those in memory
+        self.queue = SpillingQueue(self.temp_dir, 'GRAPH.B.IN', threshold=self.queue.threshold,
+                                   maxsize=5)
+        packets = self.create_packets()
+        for packet in packets[:5]:
+            self.queue.put(packet)
+
+        self.assertGreater(self.queue.spilled_count, 0)
+        self.assertTrue(self.queue.full())
+        self.assertRaises(queue.Full, self.queue.put, packets[5], block=False)
+
+        self.queue.get(block=False)
+        self.queue.put(packets[5], block=False)
+        self.assertEqual(self.queue.qsize(), 5)
+        self.queue.close()
+
+    def test_shared(self):
+        # Packets broadcast to two edges, which both spill
+        other_queue = SpillingQueue(self.temp_dir, 'GRAPH.C.IN',
+                                    threshold=self.queue.threshold)
+        packets = self.create_packets()[1:-1]
+        for packet in packets:
+            packet.share(2)
+            self.owner.owned_packet_count += 1
+            self.queue.put(packet)
+            other_queue.put(packet)
+        self.assertGreater(self.queue.spilled_count, 0)
+        self.assertGreater(other_queue.spilled_count, 0)
+
+        # Both consumers drop the packets they receive
+        for _ in packets:
+            self.owner.drop_packet(self.queue.get(block=False))
+            self.owner.drop_packet(other_queue.get(block=False))
+
+        self.assertEqual(self.owner.owned_packet_count, 0)
+
+    def test_interleaved(self):
+        packets = self.create_packets()
+        received = []
+        for i, packet in enumerate(packets):
+            self.queue.put(packet)
+            if i % 3 == 2:
+                received.append(self.queue.get(block=False))
+
+        while not self.queue.empty():
+            received.append(self.queue.get(block=False))
+
+        self.assertEqual([p.value for p in received], [p.value for p in packets])
+
+    def test_get_packets(self):
+        packets = self.create_packets()
+        for packet in packets:
+            self.queue.put(packet)
+
+        self.assertEqual([p.value for p in self.queue.get_packets()],
+                         [p.value for p in packets])
+        self.assertEqual(self.queue.qsize(), len(packets))
+
+        self.queue.close()
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_executor(self):
+        graph, collector = create_counter_graph()
+        collector.inputs['IN'].spill_threshold = 1
+
+        executor = SingleProcessGraphExecutor(graph)
+        executor.SPILL_DIR = self.temp_dir
+        executor.execute()
+
+        self.assertEqual(collector.values, range(Counter.COUNT))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+
+class SpillingChannelTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_spill(self):
+        channel = SpillingChannel(mp.Queue(), self.temp_dir, 'B.IN', threshold=500)
+        serializer = BinaryPacketSerializer()
+        values = [str(i) * 100 for i in range(20)]
+        for value in values:
+            channel.put(serializer.serialize(Packet(value)))
+
+        self.assertTrue(os.listdir(self.temp_dir))
+        self.assertEqual([serializer.deserialize(channel.get(timeout=5)).value for _ in values],
+                         values)
+        channel.close()
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+
+class MemoryBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = Graph('GRAPH', initialize=False)
+        self.graph.load_fbp_string('A(Repeat) OUT -> IN C(Drop)\n'
+                                   'B(Repeat) OUT -> IN D(Drop)', use_cache=False)
+        self.a, self.b = self.graph.get_component('A'), self.graph.get_component('B')
+        self.a_edge = self.graph.get_component('C').inputs['IN']
+        self.b_edge = self.graph.get_component('D').inputs['IN']
+        self.budget = MemoryBudget(100)
+
+    def test_accounting(self):
+        self.budget.add(self.graph, self.a, self.a_edge, 30)
+        self.budget.add(self.graph, self.a, self.a_edge, 30)
+        self.budget.add(self.graph, self.b, self.b_edge, 10)
+        self.budget.remove(self.a_edge, 30)
+
+        self.assertEqual(self.budget.total, 40)
+        self.assertEqual(self.budget.high_water_mark, 70)
+        self.assertEqual(self.budget.get_report(), [
+            {'graph': 'GRAPH', 'component': 'A', 'bytes': 30, 'high_water_mark': 60,
+             'edges': {'C.IN': 30}},
+            {'graph': 'GRAPH', 'component': 'B', 'bytes': 10, 'high_water_mark': 10,
+             'edges': {'D.IN': 10}}
+        ])
+        self.assertEqual(self.budget.get_report(Graph('OTHER', initialize=False)), [])
+
+        self.budget.release(self.graph)
+        self.assertEqual(self.budget.total, 0)
+        self.assertEqual(self.budget.get_report()[0]['high_water_mark'], 60)
+
+    def test_release(self):
+        self.budget.MAX_RELEASED_COMPONENTS = 1
+        self.budget.add(self.graph, self.a, self.a_edge, 30)
+        self.budget.add(self.graph, self.b, self.b_edge, 10)
+        self.budget.release(self.graph)
+
+        # Released components aren't referenced any more, and only the most
+        # recently released high-water marks are kept
+        self.assertFalse(self.budget._graphs)
+        self.assertFalse(self.budget._edge_senders)
+        self.assertFalse(self.budget._component_bytes)
+        self.assertFalse(self.budget._high_water_marks)
+        self.assertEqual(len(self.budget.get_report(self.graph)), 1)
+
+        # High-water marks carry over to the next execution
+        self.budget.add(self.graph, self.b, self.b_edge, 5)
+        self.assertEqual(self.budget.get_report(self.graph), [
+            {'graph': 'GRAPH', 'component': 'B', 'bytes': 5, 'high_water_mark': 10,
+             'edges': {'D.IN': 5}}
+        ])
+
+    def test_throttle_heaviest(self):
+        self.budget.add(self.graph, self.a, self.a_edge, 80)
+        self.budget.add(self.graph, self.b, self.b_edge, 10)
+        self.assertFalse(self.budget.should_throttle(self.a))
+
+        self.budget.add(self.graph, self.b, self.b_edge, 10)
+        self.assertTrue(self.budget.is_exceeded())
+        self.assertTrue(self.budget.should_throttle(self.a))
+        self.assertFalse(self.budget.should_throttle(self.b))
+
+        self.budget.remove(self.a_edge, 80)
+        self.assertFalse(self.budget.should_throttle(self.a))
+
+    def test_executor(self):
+        graph, collector = create_counter_graph()
+        executor = SingleProcessGraphExecutor(graph)
+        executor.memory_budget = MemoryBudget(1)
+        executor.execute()
+
+        self.assertEqual(collector.values, range(Counter.COUNT))
+        self.assertEqual(executor.memory_budget.total, 0)
+        report = executor.memory_budget.get_report(graph)
+        self.assertEqual([entry['component'] for entry in report], ['COUNT'])
+        self.assertGreater(report[0]['high_water_mark'], 0)
+
+
+class SchedulingPolicyTest(unittest.TestCase):
+    def test_sink_first(self):
+        graph = Graph('GRAPH', initialize=False)
+        graph.load_fbp_string('A(Repeat) OUT -> IN B(Repeat) OUT -> IN C(Drop)', use_cache=False)
+        executor = SingleProcessGraphExecutor(graph)
+
+        policy = SinkFirstPolicy()
+        policy.prepare(executor)
+        a, b, c = [graph.get_component(name) for name in 'ABC']
+        self.assertEqual(policy.get_send_suspend_time(a, None), policy.SUSPEND_TIME)
+        self.assertAlmostEqual(policy.get_send_suspend_time(b, None), policy.SUSPEND_TIME / 2)
+        self.assertEqual(policy.get_send_suspend_time(c, None), policy.MIN_SUSPEND_TIME)
+        self.assertEqual(policy.get_receive_suspend_time(c, None), policy.RECEIVE_SUSPEND_TIME)
+        self.assertAlmostEqual(policy.get_receive_suspend_time(b, None), policy.SUSPEND_TIME / 2)
+
+    def test_queue_depth(self):
+        policy = QueueDepthPolicy()
+        q = mock.Mock()
+        q.qsize.return_value = 0
+        self.assertEqual(policy.get_send_suspend_time(None, q), policy.MIN_SUSPEND_TIME)
+        q.qsize.return_value = policy.TARGET_DEPTH / 2
+        self.assertAlmostEqual(policy.get_send_suspend_time(None, q), policy.SUSPEND_TIME / 2)
+        q.qsize.return_value = policy.TARGET_DEPTH * 2
+        self.assertEqual(policy.get_send_suspend_time(None, q), policy.SUSPEND_TIME)
+
+    def test_executor(self):
+        graph, collector = create_counter_graph()
+        SingleProcessGraphExecutor(graph, scheduling_policy=QueueDepthPolicy()).execute()
+        self.assertEqual(collector.values, range(Counter.COUNT))
+
+
+class ReplicateTest(unittest.TestCase):
+    def test_order(self):
+        graph = Graph('GRAPH', initialize=False)
+        transform = SlowTransform('TRANSFORM')
+        collector = Collector('COLLECT')
+        graph.connect(SubStreamSource('SOURCE').outputs['OUT'], transform.inputs['IN'])
+        graph.connect(transform.outputs['OUT'], collector.inputs['IN'])
+        graph.replicate(transform, 3)
+
+        SingleProcessGraphExecutor(graph).execute()
+
+        values = collector.values
+        self.assertEqual(values[3], 'StartSubStream')
+        self.assertEqual(values[7], 'EndSubStream')
+        results = values[:3] + values[4:7] + values[8:]
+        self.assertEqual([value for _, value in results], range(8))
+
+        # Replicas take turns, and substreams are processed by a single replica
+        replicas = [name for name, _ in results]
+        self.assertEqual(len(set(replicas[:3])), 3)
+        self.assertEqual(len(set(replicas[3:6])), 1)
+
+
+class BroadcastTest(unittest.TestCase):
+    def test_broadcast(self):
+        graph = Graph('GRAPH', initialize=False)
+        counter = Counter('COUNT')
+        broadcast = Broadcast('BROADCAST')
+        graph.connect(counter.outputs['OUT'], broadcast.inputs['IN'])
+        collectors = []
+        for i in (0, 2, 5):
+            collector = Collector('COLLECT_{}'.format(i))
+            graph.connect(broadcast.outputs['OUT'][i], collector.inputs['IN'])
+            collectors.append(collector)
+
+        SingleProcessGraphExecutor(graph).execute()
+
+        for collector in collectors:
+            self.assertEqual(collector.values, range(Counter.COUNT))
+
+        # The packets were shared, and released once all collectors dropped them
+        self.assertEqual(counter.owned_packet_count, 0)
+
+    def test_split(self):
+        graph = Graph('GRAPH', initialize=False)
+        counter = Counter('COUNT')
+        split = Split('SPLIT')
+        collector_a = Collector('COLLECT_A')
+        collector_b = Collector('COLLECT_B')
+        graph.connect(counter.outputs['OUT'], split.inputs['IN'])
+        graph.connect(split.outputs['OUT_A'], collector_a.inputs['IN'])
+        graph.connect(split.outputs['OUT_B'], collector_b.inputs['IN'])
+
+        SingleProcessGraphExecutor(graph).execute()
+
+        self.assertEqual(collector_a.values, range(Counter.COUNT))
+        self.assertEqual(collector_b.values, range(Counter.COUNT))
+        self.assertEqual(counter.owned_packet_count, 0)
+        self.assertEqual(split.owned_packet_count, 0)
+
+
+class MergeTest(unittest.TestCase):
+    def create_graph(self, *sources):
+        graph = Graph('GRAPH', initialize=False)
+        merge = Merge('MERGE')
+        collector = Collector('COLLECT')
+        for i, source in enumerate(sources):
+            graph.connect(source.outputs['OUT'], merge.inputs['IN'][i])
+        graph.connect(merge.outputs['OUT'], collector.inputs['IN'])
+        return graph, collector
+
+    def test_rates(self):
+        graph, collector = self.create_graph(SlowCounter('SLOW'), Counter('FAST'))
+        SingleProcessGraphExecutor(graph).execute()
+
+        values = collector.values
+        self.assertEqual(sorted(values), range(Counter.COUNT) + range(100, SlowCounter.COUNT))
+
+        self.assertEqual([value for value in values if value < 100], range(Counter.COUNT))
+
+        # Neither source held up the other
+        self.assertLess(values.index(0), values.index(100))
+        self.assertLess(values.index(100), values.index(Counter.COUNT - 1))
+
+    def test_substreams(self):
+        graph, collector = self.create_graph(SubStreamSource('SUBSTREAM'), SlowCounter('SLOW'))
+        SingleProcessGraphExecutor(graph).execute()
+
+        values = collector.values
+        start = values.index('StartSubStream')
+        self.assertEqual(values[start:start + 5], ['StartSubStream', 3, 4, 5, 'EndSubStream'])
+
+    def test_timeout(self):
+        test = self
+
+        class Waiter(Component):
+            def initialize(self):
+                self.inputs.add('A')
+                self.inputs.add('B')
+
+            def run(self):
+                test.assertRaises(exc.PortTimeout, self.receive_any,
+                                  [self.inputs['A'], self.inputs['B']], timeout=0.2)
+                self.inputs['A'].receive()
+                self.inputs['B'].receive()
+
+        graph = Graph('GRAPH', initialize=False)
+        waiter = Waiter('WAIT')
+        graph.connect(SlowCounter('A').outputs['OUT'], waiter.inputs['A'])
+        graph.connect(SlowCounter('B').outputs['OUT'], waiter.inputs['B'])
+        SingleProcessGraphExecutor(graph).execute()
+
+
+class TimerHeapTest(unittest.TestCase):
+    def test_order(self):
+        timers = TimerHeap()
+        fired = []
+        for deadline in (3.0, 1.0, 2.0, 1.0):
+            timers.schedule(deadline, lambda deadline=deadline: fired.append(deadline))
+        cancelled = timers.schedule(0.5, lambda: fired.append(0.5))
+        cancelled.cancel()
+
+        self.assertEqual(timers.get_next_deadline(), 1.0)
+        for callback in timers.pop_expired(2.0):
+            callback()
+        self.assertEqual(fired, [1.0, 1.0, 2.0])
+        self.assertEqual(timers.get_next_deadline(), 3.0)
+        self.assertEqual(timers.pop_expired(2.5), [])
+
+    def test_executor(self):
+        graph, _ = create_counter_graph()
+        executor = SingleProcessGraphExecutor(graph)
+        fired = []
+
+        class Waiter(Component):
+            def initialize(self):
+                self.inputs.add('IN')
+
+            def run(self):
+                deadline = time.time() + 0.2
+                executor.schedule_timer(deadline, lambda: fired.append(time.time() - deadline))
+                executor.schedule_timer(deadline - 0.1, lambda: fired.append(None)).cancel()
+                self.suspend(0.4)
+
+        graph.add_component(Waiter('WAIT'))
+        executor.execute()
+        self.assertEqual(len(fired), 1)
+        self.assertLess(fired[0], 0.1)
+
+
 class MultiProcessExecutorTest(unittest.TestCase):
     @unittest.skip('unimplemented')
     def test_foo(self):
         pass
+
+    def test_merge(self):
+        # Merge receives EndOfStream once its upstream components terminate
+        graph = Graph('MERGE_GRAPH', initialize=False)
+        merge = Merge('MERGE')
+        collector = QueueCollector('COLLECT')
+        graph.connect(Counter('COUNT_1').outputs['OUT'], merge.inputs['IN'][0])
+        graph.connect(Counter('COUNT_2').outputs['OUT'], merge.inputs['IN'][1])
+        graph.connect(merge.outputs['OUT'], collector.inputs['IN'])
+
+        MultiProcessGraphExecutor(graph).execute()
+        self.assertEqual(sorted(collector.get_values()), sorted(list(range(Counter.COUNT)) * 2))
+
+    def test_receive_any_timeout(self):
+        graph = Graph('TIMEOUT_GRAPH', initialize=False)
+        receiver = TimeoutReceiver('RECEIVE')
+        collector = QueueCollector('COLLECT')
+        graph.connect(SlowCounter('COUNT').outputs['OUT'], receiver.inputs['IN'])
+        graph.connect(receiver.outputs['OUT'], collector.inputs['IN'])
+
+        MultiProcessGraphExecutor(graph).execute()
+        self.assertEqual(collector.get_values(), ['timeout', 100, 101, 102])
+
+    def test_broadcast_timeout(self):
+        graph = Graph('BROADCAST_GRAPH', initialize=False)
+        broadcaster = TimeoutBroadcaster('BROADCAST')
+        collector_a = QueueCollector('COLLECT_A')
+        collector_b = SlowQueueCollector('COLLECT_B')
+        graph.connect(broadcaster.outputs['OUT_A'], collector_a.inputs['IN'])
+        graph.connect(broadcaster.outputs['OUT_B'], collector_b.inputs['IN'])
+
+        MultiProcessGraphExecutor(graph).execute()
+        self.assertEqual(broadcaster.timeouts.get(timeout=5), 'OUT_B')
+        self.assertIsNone(broadcaster.timeouts.get(timeout=5))
+
+        # The second broadcast timed out after reaching OUT_A
+        self.assertEqual(collector_a.get_values(), [0, 1])
+        self.assertEqual(collector_b.get_values(), [0])
+
+    def test_unsupported(self):
+        graph = Graph('GRAPH', initialize=False)
+        graph.connect(Counter('COUNT').outputs['OUT'], Collector('COLLECT').inputs['IN'])
+        executor = MultiProcessGraphExecutor(graph)
+        executor.tracer = Tracer(graph)
+        self.assertRaises(ValueError, executor.execute)
+
+        executor = MultiProcessGraphExecutor(graph)
+        executor.edge_inspector = EdgeInspector()
+        self.assertRaises(ValueError, executor.execute)
+
+        executor = MultiProcessGraphExecutor(graph)
+        executor.edge_recorder = EdgeRecorder(tempfile.gettempdir(), [])
+        self.assertRaises(ValueError, executor.execute)
+
+        executor = MultiProcessGraphExecutor(graph)
+        executor.memory_budget = MemoryBudget(100)
+        self.assertRaises(ValueError, executor.execute)
+
+        executor = MultiProcessGraphExecutor(graph)
+        executor.METRICS_PORT = 9100
+        self.assertRaises(ValueError, executor.execute)
+
+        self.assertRaises(ValueError, MultiProcessGraphExecutor, graph, checkpoint_path='my_graph.checkpoint')
+
+    def test_arrivals(self):
+        arrivals = Arrivals()
+        channel = NotifyingChannel(mp.Queue(), arrivals)
+        for i in range(3):
+            channel.put(i)
+        self.assertTrue(arrivals.wait(1))
+        self.assertEqual([channel.get() for _ in range(3)], [0, 1, 2])
+
+        # Every arrival was consumed, so waits don't return early
+        self.assertFalse(arrivals.wait(0.05))
+
+
+class EdgeInspectorTest(unittest.TestCase):
+    def setUp(self):
+        graph = Graph('GRAPH', initialize=False)
+        graph.load_fbp_string('A(Repeat) OUT -> IN B(Drop)', use_cache=False)
+        self.source_port = graph.get_component('A').outputs['OUT']
+        self.target_port = graph.get_component('B').inputs['IN']
+
+        self.inspector = EdgeInspector()
+        self.inspector.set_edges([(self.source_port, self.target_port)])
+        self.edge = self.inspector.edges[self.source_port]
+
+    def test_drain(self):
+        self.edge.observe(StartSubStream())
+        self.edge.observe(Packet('x' * 1000))
+        events = self.inspector.drain()
+
+        self.assertEqual([command for command, _ in events], ['begingroup', 'data'])
+        command, payload = events[1]
+        self.assertEqual(payload['id'], 'A() OUT -> IN B()')
+        self.assertEqual(payload['src'], {'node': 'A', 'port': 'OUT'})
+        self.assertEqual(payload['tgt'], {'node': 'B', 'port': 'IN'})
+        self.assertEqual(len(payload['data']),
+                         EdgeInspector.PREVIEW_LENGTH + len('...'))
+        self.assertEqual(self.inspector.drain(), [])
+
+    def test_sampling(self):
+        self.inspector.SAMPLE_EVERY = 3
+        for i in range(9):
+            self.edge.observe(Packet(i))
+
+        self.assertEqual([payload['data'] for _, payload in self.inspector.drain()],
+                         [2, 5, 8])
+
+    def test_rate_limit(self):
+        for i in range(EdgeInspector.MAX_EVENTS_PER_SECOND * 2):
+            self.edge.observe(Packet(i))
+
+        self.assertLessEqual(len(self.inspector.drain()),
+                             EdgeInspector.MAX_EVENTS_PER_SECOND + 1)
+        self.assertGreater(self.inspector.dropped_count, 0)
+
+    def test_set_edges(self):
+        self.inspector.set_edges([(self.source_port, self.target_port)])
+        self.assertIs(self.inspector.edges[self.source_port], self.edge)
+
+        self.inspector.set_edges([])
+        self.assertEqual(self.inspector.edges, {})
+
+
+class EdgeRecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self):
+        graph = Graph('GRAPH', initialize=False)
+        collector = Collector('COLLECT')
+        graph.connect(SubStreamSource('SOURCE').outputs['OUT'], collector.inputs['IN'])
+
+        executor = SingleProcessGraphExecutor(graph, scheduling_policy=QueueDepthPolicy())
+        executor.edge_recorder = EdgeRecorder(self.directory, [collector.inputs['IN']])
+        executor.execute()
+        return get_recording_path(self.directory, collector.inputs['IN'])
+
+    def test_record(self):
+        records = list(read_recording(self.record()))
+
+        packets = [packet for _, packet in records]
+        self.assertEqual([type(packet) for packet in packets],
+                         [Packet] * 3 + [StartSubStream] + [Packet] * 3 +
+                         [EndSubStream] + [Packet] * 2)
+        self.assertEqual([packet.value for packet in packets if type(packet) is Packet],
+                         list(range(8)))
+
+        offsets = [offset for offset, _ in records]
+        self.assertEqual(offsets, sorted(offsets))
+
+    def test_replay(self):
+        report = replay(Repeat('REPEAT'), {'IN': self.record()})
+
+        self.assertEqual(report['packet_count'], 10)
+        self.assertEqual(report['output_count'], 10)
+        self.assertGreater(report['throughput'], 0)
+        self.assertGreater(report['latency']['max'], 0)
+
+    def test_invalid_recording(self):
+        path = os.path.join(self.directory, 'invalid.rec')
+        with open(path, 'wb') as f:
+            f.write(b'not a recording')
+
+        self.assertRaises(ValueError, list, read_recording(path))
+
+
+class SlowRepeat(Component):
+    """
+    Repeats packets from IN to OUT, waiting DELAY seconds for each one.
+    """
+    DELAY = 0.05
+
+    def initialize(self):
+        self.inputs.add('IN')
+        self.outputs.add('OUT')
+
+    def run(self):
+        while True:
+            packet = self.inputs['IN'].receive_packet()
+            if packet is EndOfStream:
+                break
+
+            self.suspend(self.DELAY)
+            self.outputs['OUT'].send_packet(packet)
+
+
+class BottleneckReportTest(unittest.TestCase):
+    def setUp(self):
+        graph = Graph('GRAPH', initialize=False)
+        self.source = Counter('SOURCE')
+        self.source.COUNT = 20
+        self.transform = SlowRepeat('TRANSFORM')
+        self.collector = Collector('COLLECT')
+        graph.connect(self.source.outputs['OUT'], self.transform.inputs['IN'])
+        graph.connect(self.transform.outputs['OUT'], self.collector.inputs['IN'])
+
+        # The source is throttled once a few packets are in flight
+        self.executor = SingleProcessGraphExecutor(graph, scheduling_policy=QueueDepthPolicy())
+        self.executor.memory_budget = MemoryBudget(100)
+        self.executor.execute()
+        self.report = self.executor.get_bottleneck_report()
+
+    def test_bottleneck(self):
+        self.assertIs(self.report.bottleneck, self.transform)
+        self.assertGreater(self.report.components[0]['utilization'], 0.8)
+
+    def test_edges(self):
+        statuses = dict((edge['target_port'].component, edge['status'])
+                        for edge in self.report.edges)
+        self.assertEqual(statuses[self.transform], BottleneckReport.BLOCKED)
+        self.assertEqual(statuses[self.collector], BottleneckReport.STARVED)
+        self.assertEqual([edge['packet_count'] for edge in self.report.edges], [20, 20])
+
+    def test_estimate_speedup(self):
+        # The transform mostly waits rather than running, so replicas help
+        self.assertGreater(self.report.estimate_speedup(self.transform, 2), 1.5)
+        self.assertAlmostEqual(self.report.estimate_speedup(self.collector, 2), 1.0)
+        self.assertRaises(ValueError, self.report.estimate_speedup, self.transform, 0)
+
+    def test_output(self):
+        table = self.report.format_table()
+        self.assertIn('*TRANSFORM (SlowRepeat)', table)
+        self.assertIn('SOURCE.OUT -> TRANSFORM.IN', table)
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'graph.graphml')
+            self.report.write_graphml(path)
+            with open(path) as f:
+                self.assertIn('producer blocked', f.read())
+        finally:
+            shutil.rmtree(directory)
+
+
+class ForkSource(Component):
+    """
+    Sends COUNT values on A, then the same values on B.
+    """
+    COUNT = 3
+
+    def initialize(self):
+        self.outputs.add('A')
+        self.outputs.add('B')
+
+    def run(self):
+        for port_name in ('A', 'B'):
+            for value in range(self.COUNT):
+                self.outputs[port_name].send(value)
+
+
+class ReversedJoin(Component):
+    """
+    Collects the values it receives on B, then those on A.
+    """
+    def initialize(self):
+        self.inputs.add('A')
+        self.inputs.add('B')
+        self.values = []
+
+    def run(self):
+        for port_name in ('B', 'A'):
+            while True:
+                value = self.inputs[port_name].receive()
+                if value is EndOfStream:
+                    break
+
+                self.values.append(value)
+
+
+class DeadlockTest(unittest.TestCase):
+    def setUp(self):
+        graph = Graph('GRAPH', initialize=False)
+        self.source = ForkSource('SOURCE')
+        self.join = ReversedJoin('JOIN')
+        self.join.inputs['A'].max_queue_size = 1
+        graph.connect(self.source.outputs['A'], self.join.inputs['A'])
+        graph.connect(self.source.outputs['B'], self.join.inputs['B'])
+        self.executor = SingleProcessGraphExecutor(graph)
+        self.executor.DEADLOCK_CHECK_INTERVAL = 0.05
+        self.executor.FLIGHT_RECORDER_DIR = self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_abort(self):
+        with self.assertRaises(exc.DeadlockError) as context:
+            self.executor.execute()
+
+        deadlock = context.exception.deadlock
+        self.assertIs(self.executor.deadlock, deadlock)
+        self.assertEqual(deadlock.components, set([self.source, self.join]))
+        self.assertEqual([(wait['component'], wait['kind'], wait['source_port'].name,
+                           wait['target_port'].name) for wait in deadlock.cycle],
+                         [(self.join, RECEIVE, 'B', 'B'), (self.source, SEND, 'A', 'A')])
+        self.assertIn('SOURCE.A -> JOIN.A (queue full, 1/1 packets)', str(context.exception))
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_expand(self):
+        self.executor.DEADLOCK_ACTION = 'expand'
+        self.executor.execute()
+        self.assertIsNone(self.executor.deadlock)
+        self.assertEqual(self.join.values, [0, 1, 2, 0, 1, 2])
+
+    def test_throttled_diamond(self):
+        # The source is throttled by the budget with packets in flight to
+        # JOIN.A, while JOIN waits for the source's packets to B to come
+        # through REPEAT
+        graph = Graph('GRAPH', initialize=False)
+        source = ForkSource('SOURCE')
+        repeat = Repeat('REPEAT')
+        join = ReversedJoin('JOIN')
+        graph.connect(source.outputs['A'], join.inputs['A'])
+        graph.connect(source.outputs['B'], repeat.inputs['IN'])
+        graph.connect(repeat.outputs['OUT'], join.inputs['B'])
+
+        executor = SingleProcessGraphExecutor(graph)
+        executor.DEADLOCK_CHECK_INTERVAL = 0.05
+        executor.FLIGHT_RECORDER_DIR = self.directory
+        executor.memory_budget = MemoryBudget(1)
+        with self.assertRaises(exc.DeadlockError) as context:
+            executor.execute()
+
+        deadlock = context.exception.deadlock
+        self.assertEqual(deadlock.components, set([source, repeat, join]))
+        self.assertEqual([(wait['component'], wait['kind']) for wait in deadlock.cycle],
+                         [(join, RECEIVE), (repeat, RECEIVE), (source, THROTTLE)])
+        self.assertIn("ForkSource('SOURCE') is throttled by a memory budget, with packets in "
+                      "flight on SOURCE.A -> JOIN.A", str(context.exception))
+
+    def test_bounded_pipeline(self):
+        # A producer waiting on a slow consumer isn't deadlocked
+        graph = Graph('GRAPH', initialize=False)
+        collector = Collector('COLLECT')
+        transform = SlowRepeat('TRANSFORM')
+        transform.inputs['IN'].max_queue_size = 1
+        graph.connect(Counter('SOURCE').outputs['OUT'], transform.inputs['IN'])
+        graph.connect(transform.outputs['OUT'], collector.inputs['IN'])
+
+        executor = SingleProcessGraphExecutor(graph)
+        executor.DEADLOCK_CHECK_INTERVAL = 0.01
+        executor.execute()
+        self.assertEqual(collector.values, list(range(Counter.COUNT)))
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        graph = Graph('GRAPH', initialize=False)
+        graph.connect(Counter('SOURCE').outputs['OUT'], Collector('COLLECT').inputs['IN'])
+        self.executor = SingleProcessGraphExecutor(graph)
+        self.executor.execute()
+
+    def test_format(self):
+        lines = self.executor.get_metrics().splitlines()
+        self.assertIn('# TYPE pflow_edge_packets_total counter', lines)
+        self.assertIn('pflow_edge_packets_total{graph="GRAPH",source="SOURCE.OUT",'
+                      'target="COLLECT.IN"} 6.0', lines)
+        self.assertIn('pflow_edge_queue_size{graph="GRAPH",source="SOURCE.OUT",'
+                      'target="COLLECT.IN"} 0.0', lines)
+        self.assertIn('pflow_component_state{graph="GRAPH",component="COLLECT",'
+                      'state="INITIALIZED"} 1.0', lines)
+        self.assertIn('pflow_graph_running{graph="GRAPH"} 0.0', lines)
+
+    def test_server(self):
+        server = MetricsServer(self.executor.get_metrics)
+        start_response = mock.Mock()
+        body = b''.join(server.application({'PATH_INFO': '/metrics'}, start_response))
+        self.assertIn(b'pflow_component_busy_seconds_total{graph="GRAPH",component="SOURCE"}',
+                      body)
+        self.assertEqual(start_response.call_args[0][0], '200 OK')
+        self.assertIn(('Content-Type', CONTENT_TYPE), start_response.call_args[0][1])
+
+        server.application({'PATH_INFO': '/other'}, start_response)
+        self.assertEqual(start_response.call_args[0][0], '404 Not Found')
+
+
+class TracingTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = Graph('GRAPH', initialize=False)
+        self.source = SubStreamSource('SOURCE')
+        self.transform = SlowTransform('TRANSFORM')
+        self.collector = Collector('COLLECT')
+        self.graph.connect(self.source.outputs['OUT'], self.transform.inputs['IN'])
+        self.graph.connect(self.transform.outputs['OUT'], self.collector.inputs['IN'])
+
+    def test_propagation(self):
+        tracer = Tracer(self.graph, sample_rate=1.0)
+        self.assertEqual(tracer.sources, frozenset([self.source]))
+        self.assertEqual(tracer.sinks, frozenset([self.collector]))
+
+        packet = Packet(1)
+        tracer.on_send(self.source, packet)
+        trace_id, ingress_time, hops = packet.attrs[TRACE_ATTR]
+        self.assertEqual(hops, (('SOURCE', ingress_time),))
+
+        # Brackets sent by a transform carry the trace of its last input,
+        # including across process boundaries
+        tracer.on_receive(self.transform, packet)
+        bracket = StartSubStream()
+        tracer.on_send(self.transform, bracket)
+        serializer = BinaryPacketSerializer()
+        bracket = serializer.deserialize(serializer.serialize(bracket))
+        self.assertEqual(bracket.attrs[TRACE_ATTR][0], trace_id)
+        self.assertEqual([name for name, _ in bracket.attrs[TRACE_ATTR][2]],
+                         ['SOURCE', 'TRANSFORM'])
+
+        tracer.on_receive(self.collector, bracket)
+        self.assertEqual(tracer.latency.count, 0)
+        tracer.on_receive(self.collector, Packet(2))
+        self.assertIsNone(self.collector._trace)
+
+    def test_shared_packet(self):
+        tracer = Tracer(self.graph, sample_rate=1.0)
+        packet = self.source.create_packet(1)
+        tracer.on_send(self.source, packet)
+        packet.share(2)
+
+        # The transform forwards a packet it shares with another component,
+        # so its hop goes on a copy
+        tracer.on_receive(self.transform, packet)
+        sent_packet = tracer.on_send(self.transform, packet)
+        self.assertIsNot(sent_packet, packet)
+        self.assertEqual(sent_packet.value, 1)
+        self.assertEqual(sent_packet.owner, self.transform)
+        self.assertEqual([name for name, _ in sent_packet.attrs[TRACE_ATTR][2]],
+                         ['SOURCE', 'TRANSFORM'])
+        self.assertEqual([name for name, _ in packet.attrs[TRACE_ATTR][2]], ['SOURCE'])
+        self.assertEqual(packet._share_count, 1)
+
+        # Unshared packets are sent as they are
+        self.assertIs(tracer.on_send(self.transform, sent_packet), sent_packet)
+
+    def test_broadcast(self):
+        graph = Graph('BROADCAST_GRAPH', initialize=False)
+        broadcast = Broadcast('BROADCAST')
+        graph.connect(Counter('COUNT').outputs['OUT'], broadcast.inputs['IN'])
+        graph.connect(broadcast.outputs['OUT'][0], Collector('COLLECT_A').inputs['IN'])
+        graph.connect(broadcast.outputs['OUT'][1], Repeat('REPEAT').inputs['IN'])
+        graph.connect(graph.get_component('REPEAT').outputs['OUT'],
+                      Collector('COLLECT_B').inputs['IN'])
+
+        executor = SingleProcessGraphExecutor(graph)
+        executor.tracer = tracer = Tracer(graph, sample_rate=1.0)
+        executor.execute()
+
+        # The repeater's hops don't show up in the traces COLLECT_A receives
+        self.assertEqual(sorted(tracer.hop_latencies),
+                         [('BROADCAST', 'COLLECT_A'), ('BROADCAST', 'REPEAT'),
+                          ('COUNT', 'BROADCAST'), ('REPEAT', 'COLLECT_B')])
+        self.assertEqual(tracer.hop_latencies[('BROADCAST', 'COLLECT_A')].count, Counter.COUNT)
+
+    def test_executor(self):
+        executor = SingleProcessGraphExecutor(self.graph)
+        executor.tracer = tracer = Tracer(self.graph, sample_rate=0.5)
+        executor.execute()
+
+        # Every other packet the source sent (brackets included) was traced
+        self.assertEqual(tracer.trace_count, 5)
+        self.assertEqual(tracer.latency.count, 5)
+        self.assertGreater(tracer.latency.get_percentile(50), 0.1)
+        self.assertEqual(sorted(tracer.hop_latencies),
+                         [('SOURCE', 'TRANSFORM'), ('TRANSFORM', 'COLLECT')])
+        self.assertEqual(tracer.hop_latencies[('TRANSFORM', 'COLLECT')].count, 5)
+
+        metrics = executor.get_metrics().splitlines()
+        self.assertIn('pflow_trace_latency_seconds_count{graph="GRAPH"} 5.0', metrics)
+        self.assertIn('pflow_trace_latency_seconds_bucket{graph="GRAPH",le="+Inf"} 5.0', metrics)
+        self.assertIn('pflow_trace_hop_latency_seconds_count{graph="GRAPH",source="SOURCE",'
+                      'target="TRANSFORM"} 5.0', metrics)
+
+
+class FailingRepeat(Component):
+    """
+    Fails on the packet after the first.
+    """
+    def initialize(self):
+        self.inputs.add('IN')
+        self.outputs.add('OUT')
+
+    def run(self):
+        self.outputs['OUT'].send(self.inputs['IN'].receive())
+        self.inputs['IN'].receive()
+        raise ValueError('failed')
+
+
+class FlightRecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ring(self):
+        component = Counter('COUNT')
+        recorder = FlightRecorder(3)
+        component._state_port = 'OUT'
+        recorder.record(component, ComponentState.INITIALIZED, ComponentState.ACTIVE)
+        for _ in range(2):
+            recorder.record(component, ComponentState.ACTIVE, ComponentState.SUSP_SEND)
+            recorder.record(component, ComponentState.SUSP_SEND, ComponentState.ACTIVE)
+
+        # The oldest transitions are overwritten
+        self.assertEqual(recorder.count, 5)
+        entries = recorder.get_entries()
+        self.assertEqual([entry[1:] for entry in entries], [
+            ('COUNT', 'SUSP_SEND', 'ACTIVE', 'COUNT.OUT'),
+            ('COUNT', 'ACTIVE', 'SUSP_SEND', 'COUNT.OUT'),
+            ('COUNT', 'SUSP_SEND', 'ACTIVE', 'COUNT.OUT')])
+        self.assertEqual(sorted(entries), entries)
+
+        path = os.path.join(self.directory, 'dump.flight')
+        recorder.dump(path, reason='test')
+        table, dumped_entries = read_dump(path)
+        self.assertEqual(dumped_entries, entries)
+        self.assertEqual((table['count'], table['size'], table['reason']), (5, 3, 'test'))
+
+    def test_main(self):
+        component = Counter('COUNT')
+        recorder = FlightRecorder(4)
+        for _ in range(2):
+            recorder.record(component, ComponentState.ACTIVE, ComponentState.SUSP_SEND)
+        path = os.path.join(self.directory, 'dump.flight')
+        recorder.dump(path)
+
+        for last, expected_lines in ((None, 3), ('0', 1), ('1', 2), ('5', 3)):
+            with mock.patch('sys.stdout', new_callable=StringIO) as stdout:
+                flight_recorder.main([path] + (['-n', last] if last is not None else []))
+            self.assertEqual(len(stdout.getvalue().splitlines()), expected_lines)
+
+        with mock.patch('sys.stderr', new_callable=StringIO):
+            self.assertRaises(SystemExit, flight_recorder.main, [path, '-n', '-1'])
+
+    def test_invalid_dump(self):
+        path = os.path.join(self.directory, 'dump.flight')
+        with open(path, 'wb') as f:
+            f.write(b'not a flight recorder dump')
+
+        self.assertRaises(ValueError, read_dump, path)
+
+    def test_executor(self):
+        graph = Graph('GRAPH', initialize=False)
+        graph.connect(Counter('SOURCE').outputs['OUT'], FailingRepeat('REPEAT').inputs['IN'])
+        graph.connect(graph.get_component('REPEAT').outputs['OUT'],
+                      Collector('COLLECT').inputs['IN'])
+        executor = SingleProcessGraphExecutor(graph)
+        executor.FLIGHT_RECORDER_DIR = self.directory
+        executor.execute()
+
+        # Dumped once the component failed
+        paths = os.listdir(self.directory)
+        self.assertEqual(len(paths), 1)
+        self.assertTrue(paths[0].startswith('GRAPH.error.'))
+        table, entries = read_dump(os.path.join(self.directory, paths[0]))
+        self.assertEqual(table['graph'], 'GRAPH')
+        transitions = [entry[1:] for entry in entries]
+        self.assertIn(('REPEAT', 'SUSP_RECV', 'ACTIVE', 'REPEAT.IN'), transitions)
+        self.assertIn(('REPEAT', 'ACTIVE', 'ERROR', None), transitions)
+        self.assertIn(('SOURCE', 'ACTIVE', 'SUSP_SEND', 'SOURCE.OUT'), transitions)
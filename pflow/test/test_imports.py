@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import subprocess
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def import_in_subprocess(module):
+    """
+    Imports a module in a fresh interpreter, returning the names of the
+    modules it loaded and whether gevent monkey patched socket.
+    """
+    script = ('import sys, json\n'
+              'import {}\n'
+              'patched = "gevent.monkey" in sys.modules and '
+              'sys.modules["gevent.monkey"].is_module_patched("socket")\n'
+              'print(json.dumps([sorted(sys.modules), patched]))'.format(module))
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     cwd=ROOT_DIR)
+    modules, patched = json.loads(output.decode('utf-8').splitlines()[-1])
+    return set(modules), patched
+
+
+class ImportTest(unittest.TestCase):
+    def test_import_pflow(self):
+        modules, patched = import_in_subprocess('pflow')
+        self.assertFalse(patched)
+        for module in ('gevent', 'geventwebsocket', 'requests', 'uuid',
+                       'inspect', 'numpy', 'pflow.runtime'):
+            self.assertNotIn(module, modules)
+
+    def test_import_runtime(self):
+        modules, patched = import_in_subprocess('pflow.runtime')
+        self.assertFalse(patched)
+        for module in ('gevent', 'geventwebsocket', 'requests',
+                       'pflow.executors.single_process'):
+            self.assertNotIn(module, modules)
+
+    def test_import_single_process(self):
+        modules, patched = import_in_subprocess('pflow.executors.single_process')
+        self.assertIn('gevent', modules)
+        self.assertFalse(patched)
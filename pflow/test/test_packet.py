@@ -0,0 +1,110 @@
+import array
+import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    import cPickle as pickle  # 2.x
+except ImportError:
+    import pickle  # 3.x
+
+from .. import packet as packet_module
+from ..packet import (Packet, StartSubStream, EndSubStream, StartMap, EndMap,
+                      SwitchMapNamespace, EndOfWorkUnit, RecordBatch,
+                      BinaryPacketSerializer, get_numpy)
+
+
+class BinaryPacketSerializerTest(unittest.TestCase):
+    def setUp(self):
+        self.serializer = BinaryPacketSerializer()
+
+    def round_trip(self, packet):
+        serialized = self.serializer.serialize(packet)
+        # Packets are pickled again by multiprocessing queues
+        serialized = pickle.loads(pickle.dumps(serialized))
+        return self.serializer.deserialize(serialized)
+
+    def test_data_packet(self):
+        for value in (42, 1.5, u'unicode', b'bytes', {'a': [1, 2]}, None):
+            packet = self.round_trip(Packet(value))
+            self.assertIs(type(packet), Packet)
+            self.assertEqual(packet.value, value)
+            self.assertIs(type(packet.value), type(value))
+
+    def test_large_bytes(self):
+        value = b'\0' * 8192
+        packet = self.round_trip(Packet(value))
+        self.assertEqual(packet.value, value)
+        self.assertIs(type(packet.value), bytes)
+
+    def test_memoryview(self):
+        # Only the viewed slice is sent
+        packet = self.round_trip(Packet(memoryview(b'0123456789')[2:5]))
+        self.assertEqual(packet.value, b'234')
+        self.assertIs(type(packet.value), bytes)
+
+    def test_control_packets(self):
+        for packet_class in (StartSubStream, EndSubStream, StartMap, EndMap):
+            packet = self.round_trip(packet_class())
+            self.assertIs(type(packet), packet_class)
+
+        self.assertEqual(len(self.serializer.serialize(StartSubStream())), 1)
+
+    def test_switch_map_namespace(self):
+        packet = self.round_trip(SwitchMapNamespace('alpha'))
+        self.assertIs(type(packet), SwitchMapNamespace)
+        self.assertEqual(packet.namespace, 'alpha')
+
+    def test_end_of_work_unit(self):
+        packet = self.round_trip(EndOfWorkUnit(7))
+        self.assertIs(type(packet), EndOfWorkUnit)
+        self.assertEqual(packet.sequence, 7)
+
+    def test_shared(self):
+        original = Packet(b'bytes')
+        original.share(3)
+        packet = self.round_trip(original)
+        self.assertEqual(packet._share_count, 1)
+
+    def test_attrs(self):
+        for original in (Packet(b'bytes'), Packet([1, 2]), EndMap()):
+            original.attrs['trace_id'] = 'abc'
+            packet = self.round_trip(original)
+            self.assertIs(type(packet), type(original))
+            self.assertEqual(packet.value, original.value)
+            self.assertEqual(packet.attrs, {'trace_id': 'abc'})
+
+    def test_record_batch(self):
+        for numpy in (get_numpy(), None):
+            with mock.patch.object(packet_module, '_numpy', numpy):
+                packet = self.round_trip(RecordBatch([1, 2, 3], 'l'))
+                self.assertIs(type(packet), RecordBatch)
+                self.assertEqual(packet.typecode, 'l')
+                self.assertEqual(packet.value.tolist(), [1, 2, 3])
+
+    def test_invalid_packet(self):
+        self.assertRaises(ValueError, self.serializer.serialize, 'foo')
+
+
+class RecordBatchTest(unittest.TestCase):
+    def test_array(self):
+        with mock.patch.object(packet_module, '_numpy', None):
+            batch = RecordBatch([1, 2, 3])
+            self.assertIsInstance(batch.value, array.array)
+            self.assertEqual(batch.typecode, 'd')
+            self.assertEqual(batch.value.tolist(), [1.0, 2.0, 3.0])
+
+            # Typed arrays are held as is
+            values = array.array('l', range(1000))
+            self.assertIs(RecordBatch(values).value, values)
+            self.assertGreater(RecordBatch(values).estimate_size(), 1000 * values.itemsize)
+
+    @unittest.skipIf(get_numpy() is None, 'NumPy is not installed')
+    def test_numpy(self):
+        numpy = get_numpy()
+        batch = RecordBatch(range(1000), 'l')
+        self.assertIsInstance(batch.value, numpy.ndarray)
+        self.assertEqual(batch.typecode, 'l')
+        self.assertGreater(batch.estimate_size(), 1000 * batch.value.itemsize)
@@ -1,11 +1,141 @@
+import os
+import shutil
+import tempfile
 import unittest
 try:
     from unittest import mock
 except ImportError:
     import mock
 
+from .. import exc
+from ..parsefbp import grammar, cache
+
 
 class ParserTest(unittest.TestCase):
-    @unittest.skip('unimplemented')
-    def test_foo(self):
-        pass
+    def test_connections(self):
+        graph = grammar.parse(
+            "# comment\n"
+            "'42' -> SEED A(RandomNumberGenerator)\n"
+            "A OUT -> IN B(pflow.components/Repeat) OUT -> IN C(Drop)\n")
+
+        self.assertEqual(list(graph['processes'].keys()), ['A', 'B', 'C'])
+        self.assertEqual(graph['processes']['B']['component'],
+                         'pflow.components/Repeat')
+        self.assertEqual(graph['connections'], [
+            {'data': '42', 'tgt': {'process': 'A', 'port': 'SEED'}},
+            {'src': {'process': 'A', 'port': 'OUT'},
+             'tgt': {'process': 'B', 'port': 'IN'}},
+            {'src': {'process': 'B', 'port': 'OUT'},
+             'tgt': {'process': 'C', 'port': 'IN'}}
+        ])
+
+    def test_iip_values(self):
+        graph = grammar.parse("'swagger' -> A X(Foo), '[1, 2]' -> B X, "
+                              "'it\\'s' -> C X")
+        self.assertEqual([c['data'] for c in graph['connections']],
+                         ['swagger', '[1, 2]', "it's"])
+
+    def test_iips_are_strings(self):
+        graph = grammar.parse("'123' -> REGEX F(RegexFilter), 'null' -> A X(Foo), "
+                              "'true' -> B X")
+        self.assertEqual([c['data'] for c in graph['connections']],
+                         ['123', 'null', 'true'])
+
+    def test_default_ports(self):
+        graph = grammar.parse("A(Foo) -> X B(Bar) -> C(Baz)")
+        self.assertEqual(graph['connections'], [
+            {'src': {'process': 'A', 'port': 'OUT'},
+             'tgt': {'process': 'B', 'port': 'X'}},
+            {'src': {'process': 'B', 'port': 'OUT'},
+             'tgt': {'process': 'C', 'port': 'IN'}}
+        ])
+
+    def test_metadata(self):
+        graph = grammar.parse("A(Foo:foo=bar,baz=123,flag)")
+        self.assertEqual(graph['processes']['A']['metadata'],
+                         {'foo': 'bar', 'baz': '123', 'flag': True})
+
+    def test_exports_and_indexes(self):
+        graph = grammar.parse("INPORT=A.IN:G_IN\n"
+                              "OUTPORT=B.OUT:G_OUT\n"
+                              "A(Foo) OUT[1] -> IN[0] B(Bar)")
+        self.assertEqual(graph['inports'], {'G_IN': {'process': 'A',
+                                                     'port': 'IN'}})
+        self.assertEqual(graph['outports'], {'G_OUT': {'process': 'B',
+                                                       'port': 'OUT'}})
+        self.assertEqual(graph['connections'], [
+            {'src': {'process': 'A', 'port': 'OUT', 'index': 1},
+             'tgt': {'process': 'B', 'port': 'IN', 'index': 0}}
+        ])
+
+    def test_multiline_connection(self):
+        graph = grammar.parse("A(Foo) OUT ->\n  IN B(Bar)")
+        self.assertEqual(len(graph['connections']), 1)
+
+    def test_syntax_errors(self):
+        for script in ("A(Foo) OUT -> ",
+                       "A(Foo) OUT -> IN B",
+                       "'x'",
+                       "A(Foo) -> -> IN B(Bar)",
+                       "A(Foo) ! B(Bar)",
+                       "A(Foo)\nA(Bar)",
+                       "OUTPORT=X.OUT:G_OUT"):
+            self.assertRaises(exc.FbpSyntaxError, grammar.parse, script)
+
+    def test_error_location(self):
+        try:
+            grammar.parse("A(Foo) OUT -> IN B(Bar)\nA OUT -> IN B !")
+        except exc.FbpSyntaxError as ex:
+            self.assertEqual((ex.line, ex.column), (2, 15))
+        else:
+            self.fail('FbpSyntaxError was not raised')
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        cache._memory_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        cache._memory_cache.clear()
+
+    def test_parse_is_cached(self):
+        script = "A(Foo) OUT -> IN B(Bar)"
+        expected = grammar.parse(script)
+
+        self.assertEqual(cache.parse(script, cache_dir=self.cache_dir),
+                         expected)
+
+        with mock.patch.object(grammar, 'parse') as parse:
+            # Memory cache
+            self.assertEqual(cache.parse(script, cache_dir=self.cache_dir),
+                             expected)
+            # Disk cache
+            cache._memory_cache.clear()
+            self.assertEqual(cache.parse(script, cache_dir=self.cache_dir),
+                             expected)
+            self.assertFalse(parse.called)
+
+    def test_results_are_copies(self):
+        script = "A(Foo) OUT -> IN B(Bar)"
+        cache.parse(script, cache_dir=self.cache_dir)['processes'].clear()
+        self.assertEqual(len(cache.parse(script,
+                                         cache_dir=self.cache_dir)['processes']),
+                         2)
+
+    def test_corrupt_cache_file(self):
+        script = "A(Foo) OUT -> IN B(Bar)"
+        cache_path = os.path.join(self.cache_dir,
+                                  cache.get_digest(script) + '.json')
+        with open(cache_path, 'w') as f:
+            f.write('{"processes": {"A": {"compo')
+
+        self.assertEqual(cache.parse(script, cache_dir=self.cache_dir),
+                         grammar.parse(script))
+
+        # The corrupt file was overwritten
+        cache._memory_cache.clear()
+        with mock.patch.object(grammar, 'parse') as parse:
+            cache.parse(script, cache_dir=self.cache_dir)
+            self.assertFalse(parse.called)
@@ -22,3 +22,45 @@ class PortRegistryTest(unittest.TestCase):
     def test_foo(self):
         pass
 
+
+
+class ArrayPortTest(unittest.TestCase):
+    def setUp(self):
+        from ..components import Broadcast
+        self.component = Broadcast('BROADCAST')
+
+    def test_elements(self):
+        from ..port import OutputPort
+
+        array_port = self.component.outputs['OUT']
+        self.assertEqual(len(array_port), 10)
+        self.assertEqual([port.name for port in array_port][:3], ['OUT_0', 'OUT_1', 'OUT_2'])
+        for port in array_port:
+            self.assertIsInstance(port, OutputPort)
+            self.assertIs(port.component, self.component)
+            self.assertIs(port.array_port, array_port)
+
+        # Elements are registered like any other port
+        self.assertIs(self.component.outputs['OUT_1'], array_port[1])
+        self.assertEqual(list(self.component.outputs), list(array_port))
+        self.assertEqual(self.component.outputs.get_declared_ports(), [array_port])
+
+    def test_connect(self):
+        from ..core import Graph
+        from ..components import Repeat
+
+        graph = Graph('GRAPH', initialize=False)
+        repeat = Repeat('REPEAT')
+        array_port = self.component.outputs['OUT']
+        self.assertRaises(ValueError, graph.connect, array_port, repeat.inputs['IN'])
+
+        graph.connect(array_port[1], repeat.inputs['IN'])
+        self.assertTrue(array_port.is_connected())
+        self.assertEqual(array_port.get_connected_ports(), [array_port[1]])
+
+    def test_invalid(self):
+        from ..port import ArrayInputPort
+
+        self.assertRaises(ValueError, ArrayInputPort, 'IN', 0)
+        self.assertRaises(ValueError, self.component.outputs.add_ports,
+                          ArrayInputPort('IN', 2))
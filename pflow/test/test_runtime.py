@@ -4,31 +4,196 @@ try:
 except ImportError:
     import mock
 
+import os
+import json
+import shutil
+import socket
+import struct
+import tempfile
+
+import gevent
+
+from .. import components
+from ..runtime import Runtime, create_websocket_application
+
+
+def create_endless_graph(runtime, graph_id):
+    runtime.new_graph(graph_id)
+    runtime.add_node(graph_id, 'CONST', 'pflow.components/Constant')
+    runtime.add_node(graph_id, 'DROP', 'pflow.components/Drop')
+    runtime.add_iip(graph_id, {'node': 'CONST', 'port': 'VALUE'}, 'foo')
+    runtime.add_edge(graph_id,
+                     {'node': 'CONST', 'port': 'OUT'},
+                     {'node': 'DROP', 'port': 'IN'})
+
 
 class RuntimeTest(unittest.TestCase):
-    @unittest.skip('unimplemented')
+    def setUp(self):
+        self.spec_cache_dir = tempfile.mkdtemp()
+        self.runtime = Runtime(spec_cache_dir=self.spec_cache_dir)
+        self.runtime.register_module(components)
+
+    def tearDown(self):
+        shutil.rmtree(self.spec_cache_dir)
+
     def test_all_component_specs(self):
-        pass
+        specs = self.runtime.get_all_component_specs()
+        spec = specs['pflow.components/Repeat']
+        self.assertEqual(spec['name'], 'pflow.components/Repeat')
+        self.assertEqual([port['id'] for port in spec['inPorts']], ['IN'])
+        self.assertEqual([port['id'] for port in spec['outPorts']], ['OUT'])
+
+        # Specs are cached on disk
+        cache_path = os.path.join(self.spec_cache_dir, 'pflow.components.json')
+        self.assertTrue(os.path.exists(cache_path))
+
+        runtime = Runtime(spec_cache_dir=self.spec_cache_dir)
+        runtime.register_module(components)
+        with mock.patch.object(runtime, '_create_component_spec') as create_spec:
+            self.assertEqual(runtime.get_all_component_specs(), specs)
+            self.assertFalse(create_spec.called)
+
+    def test_all_component_specs_stale(self):
+        self.runtime.get_all_component_specs()
+
+        runtime = Runtime(spec_cache_dir=self.spec_cache_dir)
+        runtime.register_module(components)
+        runtime.SPEC_VERSION = Runtime.SPEC_VERSION + 1
+        with mock.patch.object(runtime, '_create_component_spec',
+                               return_value={}) as create_spec:
+            runtime.get_all_component_specs()
+            self.assertTrue(create_spec.called)
+
+    def test_all_component_specs_no_source(self):
+        # e.g. modules loaded from a zip file
+        with mock.patch('os.path.getmtime', side_effect=OSError), \
+                mock.patch('pflow.runtime.open', side_effect=IOError, create=True):
+            specs = self.runtime.get_all_component_specs()
+
+        self.assertIn('pflow.components/Repeat', specs)
+        self.assertFalse(os.path.exists(os.path.join(self.spec_cache_dir,
+                                                     'pflow.components.json')))
 
-    @unittest.skip('unimplemented')
     def test_register_component(self):
-        pass
+        self.runtime.register_component(components.Repeat)
+        self.assertIs(self.runtime.get_component_class('pflow.components/Repeat'),
+                      components.Repeat)
+
+        self.assertRaises(ValueError, self.runtime.register_component,
+                          components.Repeat)
+        self.runtime.register_component(components.Repeat, overwrite=True)
+        self.assertRaises(ValueError, self.runtime.register_component, object)
 
-    @unittest.skip('unimplemented')
     def test_register_module(self):
-        pass
+        runtime = Runtime(spec_cache_dir=self.spec_cache_dir)
+        with mock.patch('importlib.import_module',
+                        return_value=components) as import_module:
+            runtime.register_module('pflow.components')
+            self.assertFalse(import_module.called)
+
+            # Registered on first use
+            self.assertIs(runtime.get_component_class('pflow.components/Drop'),
+                          components.Drop)
+            import_module.assert_called_once_with('pflow.components')
+
+        self.assertRaises(ValueError, runtime.get_component_class,
+                          'pflow.components/Missing')
+        self.assertRaises(ValueError, runtime.register_module, 42)
 
-    @unittest.skip('unimplemented')
     def test_is_started(self):
-        pass
+        create_endless_graph(self.runtime, 'GRAPH')
+        self.assertFalse(self.runtime.is_started('GRAPH'))
+
+        self.runtime.start('GRAPH')
+        self.assertTrue(self.runtime.is_started('GRAPH'))
+
+        self.runtime.stop('GRAPH')
+        self.assertFalse(self.runtime.is_started('GRAPH'))
 
-    @unittest.skip('unimplemented')
     def test_start(self):
-        pass
+        create_endless_graph(self.runtime, 'GRAPH_1')
+        create_endless_graph(self.runtime, 'GRAPH_2')
+
+        # Returns without blocking on graph execution
+        self.runtime.start('GRAPH_1')
+        self.runtime.start('GRAPH_2')
+        self.assertRaises(ValueError, self.runtime.start, 'GRAPH_1')
+        gevent.sleep(0.2)
+
+        for graph_id in ('GRAPH_1', 'GRAPH_2'):
+            status = self.runtime.get_status(graph_id)
+            self.assertTrue(status['started'])
+            self.assertTrue(status['running'])
+            self.assertGreater(status['uptime'], 0)
+            self.assertGreater(status['cpu'], 0)
+
+            self.runtime.stop(graph_id)
+
+    def test_start_limit(self):
+        class LimitedRuntime(Runtime):
+            MAX_RUNNING_GRAPHS = 1
+
+        self.runtime = LimitedRuntime()
+        self.runtime.register_module(components)
+        create_endless_graph(self.runtime, 'GRAPH_1')
+        create_endless_graph(self.runtime, 'GRAPH_2')
+
+        self.runtime.start('GRAPH_1')
+        self.runtime.start('GRAPH_2')
+        gevent.sleep(0.2)
+        self.assertTrue(self.runtime.is_running('GRAPH_1'))
+        self.assertTrue(self.runtime.is_started('GRAPH_2'))
+        self.assertFalse(self.runtime.is_running('GRAPH_2'))
+
+        self.runtime.stop('GRAPH_1')
+        gevent.sleep(0.2)
+        self.assertTrue(self.runtime.is_running('GRAPH_2'))
+        self.runtime.stop('GRAPH_2')
 
-    @unittest.skip('unimplemented')
     def test_stop(self):
-        pass
+        create_endless_graph(self.runtime, 'GRAPH')
+        on_stopped = mock.Mock()
+
+        self.runtime.start('GRAPH', on_stopped=on_stopped)
+        gevent.sleep(0.2)
+        self.runtime.stop('GRAPH')
+        gevent.sleep(0)
+
+        on_stopped.assert_called_once_with('GRAPH')
+
+    def test_memory_report(self):
+        self.assertEqual(self.runtime.get_memory_report('GRAPH'), [])
+
+        class BudgetedRuntime(Runtime):
+            MEMORY_BUDGET = 1024
+
+        self.runtime = BudgetedRuntime(spec_cache_dir=self.spec_cache_dir)
+        self.runtime.register_module(components)
+        create_endless_graph(self.runtime, 'GRAPH')
+        self.runtime.start('GRAPH')
+        gevent.sleep(0.2)
+        self.runtime.stop('GRAPH')
+
+        report = dict((entry['component'], entry)
+                      for entry in self.runtime.get_memory_report('GRAPH'))
+        self.assertGreater(report['CONST']['high_water_mark'], 0)
+        self.assertEqual(report['CONST']['bytes'], 0)
+        status = self.runtime.get_status('GRAPH')
+        self.assertFalse(status['started'])
+        self.assertFalse(status['running'])
+        self.assertRaises(ValueError, self.runtime.stop, 'GRAPH')
+
+    def test_metrics(self):
+        create_endless_graph(self.runtime, 'GRAPH')
+        self.runtime.start('GRAPH')
+        gevent.sleep(0.2)
+        metrics = self.runtime.get_metrics()
+        self.runtime.stop('GRAPH')
+
+        self.assertIn('pflow_graph_running{graph="GRAPH"} 1.0', metrics)
+        self.assertIn('pflow_edge_packets_total{graph="GRAPH",source="CONST.OUT",target="DROP.IN"}',
+                      metrics)
+        self.assertEqual(self.runtime.get_metrics(), '\n')
 
     @unittest.skip('unimplemented')
     def test_new_graph(self):
@@ -58,6 +223,151 @@ class RuntimeTest(unittest.TestCase):
     def test_remove_iip(self):
         pass
 
+    def test_apply_graph_commands(self):
+        count = self.runtime.apply_graph_commands([
+            ('clear', {'id': 'GRAPH'}),
+            ('addnode', {'graph': 'GRAPH', 'id': 'CONST',
+                         'component': 'pflow.components/Constant'}),
+            ('addnode', {'graph': 'GRAPH', 'id': 'DROP',
+                         'component': 'pflow.components/Drop'}),
+            ('addinitial', {'graph': 'GRAPH', 'src': {'data': 'foo'},
+                            'tgt': {'node': 'CONST', 'port': 'VALUE'}}),
+            ('addedge', {'graph': 'GRAPH',
+                         'src': {'node': 'CONST', 'port': 'OUT'},
+                         'tgt': {'node': 'DROP', 'port': 'IN'}}),
+        ])
+        self.assertEqual(count, 5)
+
+        graph = self.runtime._graphs['GRAPH']
+        const = graph.get_component('CONST')
+        self.assertEqual(const.inputs['VALUE'].source_port.component.value, 'foo')
+        self.assertIs(const.outputs['OUT'].target_port.component,
+                      graph.get_component('DROP'))
+
+    def test_apply_graph_commands_rollback(self):
+        create_endless_graph(self.runtime, 'GRAPH')
+        graph = self.runtime._graphs['GRAPH']
+        const = graph.get_component('CONST')
+        drop = graph.get_component('DROP')
+        components_before = set(graph.components)
+
+        self.assertRaises(ValueError, self.runtime.apply_graph_commands, [
+            ('addinitial', {'graph': 'GRAPH', 'src': {'data': 'bar'},
+                            'tgt': {'node': 'CONST', 'port': 'VALUE'}}),
+            ('removeedge', {'graph': 'GRAPH',
+                            'src': {'node': 'CONST', 'port': 'OUT'},
+                            'tgt': {'node': 'DROP', 'port': 'IN'}}),
+            ('removenode', {'graph': 'GRAPH', 'id': 'CONST'}),
+            ('addnode', {'graph': 'GRAPH', 'id': 'RPT',
+                         'component': 'pflow.components/Repeat'}),
+            ('addnode', {'graph': 'GRAPH', 'id': 'MISSING',
+                         'component': 'pflow.components/Missing'}),
+        ])
+
+        self.assertEqual(set(graph.components) - components_before,
+                         set([const.inputs['VALUE'].source_port.component]))
+        self.assertIs(graph.get_component('CONST'), const)
+        self.assertRaises(ValueError, graph.get_component, 'RPT')
+        self.assertEqual(const.inputs['VALUE'].source_port.component.value, 'foo')
+        self.assertIs(const.outputs['OUT'].target_port, drop.inputs['IN'])
+        self.assertEqual(len(graph.components), 3)
+
+
+class WebSocketApplicationTest(unittest.TestCase):
+    def setUp(self):
+        self.runtime = Runtime()
+        self.runtime.register_module(components)
+        self.ws = mock.Mock(closed=False)
+        self.app = create_websocket_application(self.runtime)(self.ws)
+
+    def get_sent_messages(self):
+        messages = []
+        for call in self.ws.raw_write.call_args_list:
+            data = call[0][0]
+            while data:
+                # Unmasked text frames with payloads of < 64KB
+                length = ord(data[1])
+                offset = 2
+                if length == 126:
+                    length = struct.unpack('!H', data[2:4])[0]
+                    offset = 4
+
+                messages.append(json.loads(data[offset:offset + length]))
+                data = data[offset + length:]
+
+        return messages
+
+    def test_batch(self):
+        self.app.on_message(json.dumps({
+            'protocol': 'graph',
+            'command': 'batch',
+            'payload': {
+                'graph': 'GRAPH',
+                'commands': [
+                    {'command': 'clear', 'payload': {'id': 'GRAPH'}},
+                    {'command': 'addnode',
+                     'payload': {'graph': 'GRAPH', 'id': 'DROP',
+                                 'component': 'pflow.components/Drop'}},
+                ]
+            }
+        }))
+        gevent.sleep(0)
+
+        self.assertEqual(self.get_sent_messages(), [
+            {'protocol': 'graph', 'command': 'batch',
+             'payload': {'graph': 'GRAPH', 'count': 2}}
+        ])
+        self.assertIsNotNone(self.runtime._graphs['GRAPH'].get_component('DROP'))
+
+    def test_socket_dead(self):
+        self.app._watched_graphs.add('GRAPH')
+        self.ws.raw_write.side_effect = socket.error('Broken pipe')
+        self.app.send('runtime', 'runtime', {})
+        self.app.send('runtime', 'runtime', {})
+        gevent.sleep(0)
+
+        # Both messages went in one write, and the connection was closed
+        self.assertEqual(self.ws.raw_write.call_count, 1)
+        self.assertEqual(self.app._watched_graphs, set())
+
+        # Nothing is written once the socket is closed
+        self.ws.closed = True
+        self.app.send('runtime', 'runtime', {})
+        gevent.sleep(0)
+        self.assertEqual(self.ws.raw_write.call_count, 1)
+
+    def test_watch_edges(self):
+        self.app.EDGE_EVENTS_INTERVAL = 0.05
+        create_endless_graph(self.runtime, 'GRAPH')
+        self.runtime.start('GRAPH')
+
+        edge = {'src': {'node': 'CONST', 'port': 'OUT'},
+                'tgt': {'node': 'DROP', 'port': 'IN'}}
+        self.app.on_message(json.dumps({
+            'protocol': 'network',
+            'command': 'edges',
+            'payload': {'graph': 'GRAPH', 'edges': [edge]}
+        }))
+        gevent.sleep(0.2)
+        self.runtime.stop('GRAPH')
+
+        messages = self.get_sent_messages()
+        self.assertEqual(messages[0]['command'], 'edges')
+        data = [m['payload'] for m in messages if m['command'] == 'data']
+        self.assertTrue(data)
+        self.assertEqual(data[0]['graph'], 'GRAPH')
+        self.assertEqual(data[0]['id'], 'CONST() OUT -> IN DROP()')
+        self.assertEqual(data[0]['data'], 'foo')
+
+    def test_coalesced_send(self):
+        self.app.send('graph', 'clear', {'id': 'A'})
+        self.app.send('graph', 'clear', {'id': 'B'})
+        gevent.sleep(0)
+
+        self.assertEqual(self.ws.raw_write.call_count, 1)
+        self.assertEqual([m['payload']['id'] for m in self.get_sent_messages()],
+                         ['A', 'B'])
+
 
 class FlowhubRegistryTest(unittest.TestCase):
     @unittest.skip('unimplemented')
@@ -0,0 +1,209 @@
+"""
+Sampled tracing of packets through graphs.
+
+A `Tracer` set on an executor (``executor.tracer = Tracer(graph)``) starts a
+trace for a sample of the packets sent by the graph's sources: a random trace
+ID and the time the packet entered the graph, kept in the packet's `attrs`
+along with the hops it has taken so far. Components that receive a traced
+packet carry its trace over to every packet they send until they receive the
+next one, so traces follow packets through transforms, substream and map
+brackets. When a traced packet reaches one of the graph's sinks, the tracer
+records its end-to-end latency, and the latency of each hop (from one
+component sending it to the next one sending it on), in histograms.
+
+The histograms are kept in the executor's process, so only single process
+executors support tracing.
+
+Traces are tuples of ``(trace_id, ingress_time, hops)``, where ``hops`` is a
+tuple of ``(component_name, send_time)`` tuples.
+"""
+import binascii
+import collections
+import copy
+import os
+import time
+
+from .packet import ControlPacket
+
+TRACE_ATTR = 'trace'  # Key of the trace in packet attrs
+
+
+class LatencyHistogram(object):
+    """
+    Counts of latencies in exponentially sized buckets.
+    """
+    # Upper bounds of the buckets, in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+               1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)  # Latencies in each bucket
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+        self.count += 1
+        self.sum += seconds
+
+    def get_cumulative_counts(self):
+        """
+        Gets the number of latencies up to each bucket's bound.
+
+        Returns
+        -------
+        counts : list
+            (bound, count) tuples.
+        """
+        total = 0
+        cumulative_counts = []
+        for bound, count in zip(self.BUCKETS, self.counts):
+            total += count
+            cumulative_counts.append((bound, total))
+
+        return cumulative_counts
+
+    def get_percentile(self, percentile):
+        """
+        Estimates a percentile of the latencies, as the bound of the bucket
+        it falls in.
+
+        Returns
+        -------
+        seconds : float
+            or None if no latencies were observed.
+        """
+        if not self.count:
+            return None
+
+        rank = self.count * percentile / 100.0
+        for bound, count in self.get_cumulative_counts():
+            if count >= rank:
+                return bound
+
+
+class Tracer(object):
+    """
+    Traces a sample of the packets sent by a graph's sources to its sinks.
+
+    Attributes
+    ----------
+    trace_count : int
+        number of traces started.
+    latency : `LatencyHistogram`
+        end-to-end latencies (from a source sending a packet to a sink
+        receiving it).
+    hop_latencies : dict
+        `LatencyHistogram` of the latencies between components, keyed by
+        (from component name, to component name).
+    """
+    def __init__(self, graph, sample_rate=0.01):
+        """
+        Parameters
+        ----------
+        graph : ``core.Graph``
+            the graph to trace.
+        sample_rate : float
+            fraction of the packets sent by sources to trace.
+        """
+        from .core import InitialPacketGenerator
+
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be between 0 and 1')
+
+        self.graph = graph
+        self.sample_interval = int(round(1.0 / sample_rate))  # Packets sent per trace started
+        self._countdown = 1  # Packets to send before the next trace starts
+
+        # Components that don't receive packets (other than initial packets)
+        # start traces, and those that don't send any end them
+        components = [c for c in graph.get_all_components()
+                      if not isinstance(c, InitialPacketGenerator)]
+        self.sources = frozenset(
+            c for c in components
+            if all(isinstance(upstream, InitialPacketGenerator)
+                   for upstream in graph.get_upstream(c)))
+        self.sinks = frozenset(c for c in components if not graph.get_downstream(c))
+
+        self.trace_count = 0
+        self.latency = LatencyHistogram()
+        self.hop_latencies = collections.defaultdict(LatencyHistogram)
+
+    def on_send(self, component, packet):
+        """
+        Called when a component sends a packet: adds the component as a hop of
+        the packet's trace, continuing the trace of the packet the component
+        last received or (for sources) starting a sampled trace.
+
+        Returns
+        -------
+        packet : ``packet.Packet``
+            the packet to send: the same packet, or if it's shared with other
+            components (see ``packet.Packet.share()``), a copy of it owned by
+            the component, which has dropped the shared one.
+        """
+        old_trace = packet.attrs.get(TRACE_ATTR) if packet.attrs else None
+        trace = old_trace
+        if trace is None:
+            trace = component._trace
+            if trace is None:
+                if component not in self.sources:
+                    return packet
+
+                self._countdown -= 1
+                if self._countdown > 0:
+                    return packet
+
+                self._countdown = self.sample_interval
+                self.trace_count += 1
+                now = time.time()
+                trace = (binascii.hexlify(os.urandom(8)).decode('ascii'),
+                         now, ((component.name, now),))
+                return self._set_trace(component, packet, trace)
+
+        trace_id, ingress_time, hops = trace
+        if hops[-1][0] != component.name:
+            trace = (trace_id, ingress_time, hops + ((component.name, time.time()),))
+        if trace is old_trace:
+            return packet
+
+        return self._set_trace(component, packet, trace)
+
+    def _set_trace(self, component, packet, trace):
+        """
+        Sets the trace of a packet a component is sending, copying the packet
+        first if other components share it.
+        """
+        if packet._share_count > 1:
+            shared_packet = packet
+            packet = copy.copy(shared_packet)
+            packet._share_count = 1
+            packet._owner = component
+            packet.attrs = dict(shared_packet.attrs)
+            component.owned_packet_count += 1
+            component.drop_packet(shared_packet)
+
+        packet.attrs[TRACE_ATTR] = trace
+        return packet
+
+    def on_receive(self, component, packet):
+        """
+        Called when a component receives a packet: the component continues
+        its trace (if any), and sinks record its latencies (except for
+        brackets and other control packets).
+        """
+        trace = packet.attrs.get(TRACE_ATTR) if packet.attrs else None
+        component._trace = trace
+        if trace is None or component not in self.sinks or isinstance(packet, ControlPacket):
+            return
+
+        now = time.time()
+        trace_id, ingress_time, hops = trace
+        self.latency.observe(now - ingress_time)
+        for (name, send_time), (next_name, next_time) in zip(
+                hops, hops[1:] + ((component.name, now),)):
+            self.hop_latencies[(name, next_name)].observe(next_time - send_time)
@@ -1,5 +1,9 @@
-import uuid
-import socket
+import os
+import importlib
+
+# Modules that are slow to import (uuid loads ctypes, for instance) are
+# imported by the functions that need them, so that importing pflow stays
+# fast.
 
 
 def get_free_tcp_port():
@@ -9,6 +13,8 @@ def get_free_tcp_port():
     Keep in mind that this is vulnerable to race conditions, but it's still useful
     when you need a free port assigned by the OS, and don't want to brute force a port range.
     """
+    import socket
+
     sck = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sck.bind(('', 0))
     port = sck.getsockname()[1]
@@ -20,6 +26,8 @@ def random_id():
     """
     Generates a random hex string ID value.
     """
+    import uuid
+
     return str(uuid.uuid4())
 
 
@@ -42,6 +50,71 @@ def pluck(seq, key):
     return vals
 
 
+def get_cache_dir(*parts):
+    """
+    Gets the path of a pflow cache directory.
+
+    This is ``$PFLOW_CACHE_DIR`` if set, otherwise ``~/.cache/pflow``. The
+    directory is not created.
+
+    :param parts: optional sub-directory path components.
+    :return: the cache directory path.
+    """
+    cache_dir = os.environ.get('PFLOW_CACHE_DIR')
+    if not cache_dir:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'pflow')
+
+    return os.path.join(cache_dir, *parts)
+
+
+def write_file_atomic(file_path, data, binary=False):
+    """
+    Writes a file atomically (via a temporary file that is renamed into
+    place), so that concurrent readers never see a partially written file.
+    Parent directories are created as needed.
+
+    :param file_path: path of the file to write.
+    :param data: file contents.
+    :param binary: write the file in binary mode?
+    """
+    dir_path = os.path.dirname(file_path)
+    if not os.path.isdir(dir_path):
+        os.makedirs(dir_path)
+
+    import tempfile
+
+    fd, temp_path = tempfile.mkstemp(dir=dir_path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if binary else 'w') as f:
+            f.write(data)
+        os.rename(temp_path, file_path)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+def import_object(path):
+    """
+    Imports an object (e.g. a class) by its path.
+
+    :param path: ``'package.module/Name'`` or ``'package.module.Name'``
+    :return: the imported object.
+    """
+    if '/' in path:
+        module_name, obj_name = path.rsplit('/', 1)
+    elif '.' in path:
+        module_name, obj_name = path.rsplit('.', 1)
+    else:
+        raise ValueError('{} is not a fully qualified path'.format(path))
+
+    module = importlib.import_module(module_name)
+    try:
+        return getattr(module, obj_name)
+    except AttributeError:
+        raise ImportError('Module {} has no attribute {}'.format(module_name,
+                                                                obj_name))
+
+
 def init_logger(default_level=None, console_level=None, filename=None, logger_levels=None):
     import logging
 
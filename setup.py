@@ -10,7 +10,6 @@ install_requires = [
     'networkx',  # writing graphml files
     'gevent',
     #'haigha',  # amqp
-    'pyparsing',  # fbp grammar
     'gevent-websocket',  # fbp network runtime
     'python-coveralls',  # code coverage
 